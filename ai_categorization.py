@@ -3,14 +3,100 @@ AI Categorization & Subscription Detection - PFMS Hackathon MVP
 Uses rule-based + AWS Comprehend for transaction categorization
 """
 
+import bisect
 import json
+import os
 import re
+from collections import deque
 from datetime import datetime, timedelta
-import boto3
+import aws_clients
+
+from category_store import STORE_VERSION, default_category_store
+
+# Comprehend accepts at most 25 documents per batch call
+COMPREHEND_BATCH_SIZE = 25
+
+# 'numpy' runs the detectors on columnar arrays (vectorized_analytics)
+ANALYTICS_BACKENDS = ('python', 'numpy')
+
+# Placeholder merchants say nothing about the category, never store them
+UNSTORED_MERCHANTS = {'', 'unknown merchant'}
+
+
+def normalize_merchant(merchant):
+    """Cache key for a merchant: lowercase alphanumeric words"""
+    return ' '.join(re.findall(r'[a-z0-9]+', merchant.lower()))
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton built once from the category keyword rules.
+
+    Returns the first category (in rule order) that has a keyword in any of
+    the given fields, scanning each field a single time.
+    """
+
+    def __init__(self, category_rules):
+        self.categories = list(category_rules)
+        no_match = len(self.categories)
+
+        # Keyword trie; out[state] = best category index ending at state
+        goto = [{}]
+        out = [no_match]
+        for index, keywords in enumerate(category_rules.values()):
+            for keyword in keywords:
+                state = 0
+                for ch in keyword:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        out.append(no_match)
+                    state = nxt
+                out[state] = min(out[state], index)
+
+        # Failure links (BFS), folded into a full transition table
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = dict(delta[fail[state]])
+            delta[state].update(goto[state])
+            out[state] = min(out[state], out[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(nxt)
+
+        self._delta = delta
+        self._out = out
+        self._no_match = no_match
+
+    def match(self, *fields):
+        """Return the winning category for the fields, or None"""
+        delta = self._delta
+        out = self._out
+        best = out[0]  # an empty keyword matches everything
+        for text in fields:
+            state = 0
+            for ch in text:
+                state = delta[state].get(ch, 0)
+                if out[state] < best:
+                    best = out[state]
+                    if best == 0:
+                        return self.categories[0]
+        return self.categories[best] if best < self._no_match else None
+
 
 class TransactionCategorizer:
-    def __init__(self):
-        self.comprehend = boto3.client('comprehend')
+    def __init__(self, comprehend=None, store=None, backend='python'):
+        if backend not in ANALYTICS_BACKENDS:
+            raise ValueError(f"Unknown analytics backend: {backend}")
+        self.comprehend = comprehend or aws_clients.client('comprehend')
+        self.store = store or default_category_store()
+        self.backend = backend
+        self._columns = None
         
         # Category keywords
         self.category_rules = {
@@ -41,17 +127,19 @@ class TransactionCategorizer:
             'gym': {'amount': 1500, 'frequency': 'monthly'},
             'newspaper': {'amount': 300, 'frequency': 'monthly'}
         }
+        
+        self.matcher = KeywordMatcher(self.category_rules)
     
     def categorize_transaction(self, transaction):
         """Categorize transaction using rules + AI"""
         merchant = transaction.get('merchant', '').lower()
         description = transaction.get('rawSubject', '').lower()
         
-        # Rule-based categorization
-        for category, keywords in self.category_rules.items():
-            if any(keyword in merchant or keyword in description for keyword in keywords):
-                transaction['category'] = category
-                return transaction
+        # Stored merchant category, then rule-based categorization
+        category = self.known_category(merchant, description)
+        if category:
+            transaction['category'] = category
+            return transaction
         
         # Use AWS Comprehend for unknown categories
         try:
@@ -60,20 +148,107 @@ class TransactionCategorizer:
                 Text=text,
                 LanguageCode='en'
             )
-            
-            # Simple entity-based categorization
-            entities = [e['Type'] for e in response['Entities']]
-            if 'ORGANIZATION' in entities:
-                transaction['category'] = 'Shopping'
-            else:
-                transaction['category'] = 'Others'
+            category = self.category_from_entities(response['Entities'])
+            self.remember(merchant, category)
         except:
-            transaction['category'] = 'Others'
+            category = 'Others'
         
+        transaction['category'] = category
         return transaction
     
+    def categorize_transactions(self, transactions):
+        """Categorize a batch, sending only unseen merchants to Comprehend"""
+        pending = {}
+        for txn in transactions:
+            merchant = txn.get('merchant', '').lower()
+            description = txn.get('rawSubject', '').lower()
+            
+            category = self.known_category(merchant, description)
+            if category:
+                txn['category'] = category
+                continue
+            
+            # De-duplicate: one Comprehend document per merchant
+            text = f"{merchant} {description}"
+            key = self.store_key(merchant) or text
+            if key not in pending:
+                pending[key] = (text, merchant, [])
+            pending[key][2].append(txn)
+        
+        batches = list(pending.values())
+        for start in range(0, len(batches), COMPREHEND_BATCH_SIZE):
+            chunk = batches[start:start + COMPREHEND_BATCH_SIZE]
+            categories = self.detect_categories([text for text, _, _ in chunk])
+            for (_, merchant, txns), category in zip(chunk, categories):
+                if category is None:
+                    category = 'Others'
+                else:
+                    self.remember(merchant, category)
+                for txn in txns:
+                    txn['category'] = category
+        
+        return transactions
+    
+    def store_key(self, merchant):
+        """Normalized merchant, or None when it should not be stored"""
+        key = normalize_merchant(merchant)
+        return None if key in UNSTORED_MERCHANTS else key
+    
+    def known_category(self, merchant, description):
+        """Category from the rules or the merchant store, None if Comprehend is needed.
+        
+        The rules always win, so a stored Comprehend guess for a merchant
+        never overrides a keyword match in a later transaction's subject.
+        The store only answers for transactions no rule matches.
+        """
+        category = self.matcher.match(merchant, description)
+        if category:
+            return category
+        
+        key = self.store_key(merchant)
+        if key:
+            return self.store.get(key, STORE_VERSION)
+        return None
+    
+    def remember(self, merchant, category):
+        """Store a Comprehend result for the merchant"""
+        key = self.store_key(merchant)
+        if key:
+            self.store.set(key, category, STORE_VERSION)
+    
+    def detect_categories(self, texts):
+        """One batch_detect_entities call; None marks a failed document"""
+        categories = [None] * len(texts)
+        try:
+            response = self.comprehend.batch_detect_entities(
+                TextList=texts,
+                LanguageCode='en'
+            )
+        except:
+            return categories
+        
+        for result in response.get('ResultList', []):
+            categories[result['Index']] = self.category_from_entities(result['Entities'])
+        return categories
+    
+    def category_from_entities(self, entities):
+        """Simple entity-based categorization"""
+        types = [e['Type'] for e in entities]
+        return 'Shopping' if 'ORGANIZATION' in types else 'Others'
+    
+    def columns(self, transactions):
+        """Columnar view for the numpy backend, shared by both detectors"""
+        from vectorized_analytics import TransactionColumns
+        if self._columns is None or self._columns.transactions is not transactions:
+            self._columns = TransactionColumns(transactions)
+        return self._columns
+    
     def detect_subscription(self, transactions):
         """Detect recurring subscriptions from transaction history"""
+        if self.backend == 'numpy':
+            import vectorized_analytics
+            return vectorized_analytics.detect_subscription(self.columns(transactions))
+        
         subscriptions = []
         
         # Group by merchant
@@ -114,152 +289,373 @@ class TransactionCategorizer:
     
     def detect_wasteful_expenses(self, transactions, subscriptions):
         """Flag unnecessary/wasteful expenses"""
-        wasteful = []
-        
-        # Check for unused subscriptions (no usage pattern)
+        if self.backend == 'numpy':
+            import vectorized_analytics
+            index = vectorized_analytics.ColumnarExpenseIndex(
+                self.columns(transactions), subscriptions, WASTE_KEYWORDS)
+        else:
+            index = ExpenseIndex(transactions, subscriptions, WASTE_KEYWORDS)
+        return wasteful_expenses(index)
+
+
+# Merchant keyword sets, matched once per distinct merchant by the expense index
+WASTE_KEYWORDS = {
+    'fitness': ['gym', 'fitness', 'yoga', 'sports'],
+    'streaming': ['netflix', 'hotstar', 'amazon prime', 'youtube'],
+    'gambling': ['dream11', 'mpl', 'paytm first games', 'bet', 'casino']
+}
+
+# Small repeated expenses: purchases in this category below this amount
+SMALL_EXPENSES = ('Food', 200)
+
+# Wasteful-expense rules in report order, see wasteful_rule
+WASTEFUL_RULES = []
+
+
+def wasteful_rule(func):
+    """Register a rule: func(index) returns a list of wasteful expense records"""
+    WASTEFUL_RULES.append(func)
+    return func
+
+
+def keyword_hits(text, keywords):
+    """Names of the keyword sets with a keyword in text"""
+    return [name for name, words in keywords.items() if any(w in text for w in words)]
+
+
+class ExpenseIndex:
+    """Shared indexes for the wasteful-expense rules, built in one pass.
+
+    Rules only read from it: keyword_stats() for merchant keyword sets,
+    small_stats() for cheap purchases in a category and subscription_hits()
+    for subscriptions whose service matches a keyword set.
+    """
+
+    def __init__(self, transactions, subscriptions, keywords):
+        self.subscriptions = subscriptions
+        self._keyword_amounts = {name: [] for name in keywords}
+        self._category_amounts = {}
+
+        merchant_hits = {}
+        for txn in transactions:
+            merchant = txn['merchant'].lower()
+            names = merchant_hits.get(merchant)
+            if names is None:
+                names = merchant_hits[merchant] = keyword_hits(merchant, keywords)
+            for name in names:
+                self._keyword_amounts[name].append(txn['amount'])
+            self._category_amounts.setdefault(txn.get('category'), []).append(txn['amount'])
+
+        self._subscription_hits = {name: [] for name in keywords}
         for sub in subscriptions:
-            service = sub['service'].lower()
-            
-            # Gym membership with no other fitness expenses
-            if 'gym' in service:
-                fitness_txns = [t for t in transactions 
-                               if any(w in t['merchant'].lower() 
-                                     for w in ['gym', 'fitness', 'yoga', 'sports'])]
-                if len(fitness_txns) <= 2:  # Only subscription charges
-                    wasteful.append({
-                        'type': 'unused_subscription',
-                        'service': sub['service'],
-                        'amount': sub['amount'],
-                        'reason': 'Gym membership with no usage',
-                        'monthlySavings': sub['amount']
-                    })
-            
-            # Streaming services with multiple subscriptions
-            streaming = ['netflix', 'hotstar', 'amazon prime', 'youtube']
-            user_streaming = [s for s in subscriptions 
-                            if any(st in s['service'].lower() for st in streaming)]
-            if len(user_streaming) > 2:
-                wasteful.append({
-                    'type': 'duplicate_subscription',
-                    'service': ', '.join([s['service'] for s in user_streaming]),
-                    'amount': sum([s['amount'] for s in user_streaming]),
-                    'reason': f'Multiple streaming subscriptions ({len(user_streaming)})',
-                    'monthlySavings': min([s['amount'] for s in user_streaming])
-                })
-        
-        # Small repeated expenses (coffee, snacks)
-        small_expenses = [t for t in transactions 
-                         if t['amount'] < 200 and t['category'] == 'Food']
-        if len(small_expenses) > 20:  # More than 20 small food expenses
-            total = sum([t['amount'] for t in small_expenses])
-            wasteful.append({
-                'type': 'small_repeated_expenses',
-                'service': 'Small food purchases',
-                'amount': total,
-                'reason': f'{len(small_expenses)} small food expenses',
-                'monthlySavings': total * 0.3  # Suggest 30% reduction
-            })
+            for name in keyword_hits(sub['service'].lower(), keywords):
+                self._subscription_hits[name].append(sub)
+
+    def keyword_stats(self, name):
+        """(count, total amount) of transactions whose merchant matches the set"""
+        amounts = self._keyword_amounts[name]
+        return len(amounts), sum(amounts)
+
+    def small_stats(self, category, limit):
+        """(count, total amount) of transactions in category below limit"""
+        amounts = [a for a in self._category_amounts.get(category, []) if a < limit]
+        return len(amounts), sum(amounts)
+
+    def subscription_hits(self, name):
+        return self._subscription_hits[name]
+
+
+class RunningExpenseIndex(ExpenseIndex):
+    """ExpenseIndex built one transaction at a time, for streamed input.
+    
+    Keeps (count, total) per keyword set and per small-expense limit
+    instead of every amount, so memory does not grow with the history;
+    small_stats() answers only the (category, limit) pairs given up front.
+    Call finish() with the subscriptions before running the rules.
+    """
+    
+    def __init__(self, keywords, small_limits=(SMALL_EXPENSES,)):
+        self.keywords = keywords
+        self.subscriptions = []
+        self._keyword_stats = {name: [0, 0] for name in keywords}
+        self._small_stats = {limit: [0, 0] for limit in small_limits}
+        self._merchant_hits = {}
+        self._subscription_hits = {name: [] for name in keywords}
+    
+    def add(self, txn):
+        merchant = txn['merchant'].lower()
+        names = self._merchant_hits.get(merchant)
+        if names is None:
+            names = self._merchant_hits[merchant] = keyword_hits(merchant, self.keywords)
+        amount = txn['amount']
+        for name in names:
+            stats = self._keyword_stats[name]
+            stats[0] += 1
+            stats[1] += amount
+        for (category, limit), stats in self._small_stats.items():
+            if txn.get('category') == category and amount < limit:
+                stats[0] += 1
+                stats[1] += amount
+    
+    def finish(self, subscriptions):
+        self.subscriptions = subscriptions
+        for sub in subscriptions:
+            for name in keyword_hits(sub['service'].lower(), self.keywords):
+                self._subscription_hits[name].append(sub)
+        return self
+    
+    def keyword_stats(self, name):
+        return tuple(self._keyword_stats[name])
+    
+    def small_stats(self, category, limit):
+        return tuple(self._small_stats[category, limit])
+
+
+def wasteful_expenses(index):
+    """Run the wasteful-expense rules against a built index"""
+    wasteful = []
+    for rule in WASTEFUL_RULES:
+        wasteful.extend(rule(index))
+    return wasteful
+
+
+@wasteful_rule
+def unused_gym_rule(index):
+    """Gym membership with no other fitness expenses"""
+    fitness_count, _ = index.keyword_stats('fitness')
+    if fitness_count > 2:  # More than the subscription charges
+        return []
+    return [{
+        'type': 'unused_subscription',
+        'service': sub['service'],
+        'amount': sub['amount'],
+        'reason': 'Gym membership with no usage',
+        'monthlySavings': sub['amount']
+    } for sub in index.subscriptions if 'gym' in sub['service'].lower()]
+
+
+@wasteful_rule
+def duplicate_streaming_rule(index):
+    """Streaming services with multiple subscriptions"""
+    user_streaming = index.subscription_hits('streaming')
+    if len(user_streaming) <= 2:
+        return []
+    return [{
+        'type': 'duplicate_subscription',
+        'service': ', '.join([s['service'] for s in user_streaming]),
+        'amount': sum([s['amount'] for s in user_streaming]),
+        'reason': f'Multiple streaming subscriptions ({len(user_streaming)})',
+        'monthlySavings': min([s['amount'] for s in user_streaming])
+    }]
+
+
+@wasteful_rule
+def small_expenses_rule(index):
+    """Small repeated expenses (coffee, snacks)"""
+    count, total = index.small_stats(*SMALL_EXPENSES)
+    if count <= 20:  # More than 20 small food expenses
+        return []
+    return [{
+        'type': 'small_repeated_expenses',
+        'service': 'Small food purchases',
+        'amount': total,
+        'reason': f'{count} small food expenses',
+        'monthlySavings': total * 0.3  # Suggest 30% reduction
+    }]
+
+
+@wasteful_rule
+def gambling_rule(index):
+    """Gambling/betting apps"""
+    count, total = index.keyword_stats('gambling')
+    if not count:
+        return []
+    return [{
+        'type': 'gambling',
+        'service': 'Gaming/Betting apps',
+        'amount': total,
+        'reason': f'{count} gambling transactions',
+        'monthlySavings': total
+    }]
+
+
+class MerchantState:
+    """Running per-merchant state for SubscriptionDetector, bounded by the
+    span of the merchant's history rather than its number of charges"""
+    __slots__ = ('service', 'first_day', 'last_day', 'last_date', 'days', 'count', 'total',
+                 'mean', 'm2', 'gaps')
+
+    def __init__(self, service):
+        self.service = service      # merchant name of the earliest charge
+        self.first_day = None       # date ordinals of the earliest and latest charges
+        self.last_day = None
+        self.last_date = None       # date string of the latest charge
+        self.days = []              # sorted charge ordinals; None once not monthly
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0             # Welford running mean / M2 of amounts
+        self.m2 = 0.0
+        self.gaps = 0               # intervals in days longer than MAX_INTERVAL
+
+
+class SubscriptionDetector:
+    """Incremental counterpart of TransactionCategorizer.detect_subscription.
+    
+    Each merchant keeps its first and last charge dates and running amount
+    statistics. Only merchants that can still be monthly keep their charge
+    dates, with a count of the gaps longer than MAX_INTERVAL between them.
+    A late charge can fill a gap, so those dates are needed. Two charges
+    closer than MIN_INTERVAL rule the merchant out for good, because later
+    charges only split intervals further. The dates are then dropped. So
+    the kept dates are at least MIN_INTERVAL apart: about 15 a year of
+    history, however many rows arrive and in whatever order. Results
+    match detect_subscription exactly. The state can be saved with
+    to_dict() so the history never has to be replayed.
+    """
+    
+    # Monthly subscription (25-35 days interval)
+    MIN_INTERVAL = 25
+    MAX_INTERVAL = 35
+    
+    def __init__(self, transactions=()):
+        self.merchants = {}
+        for txn in transactions:
+            self.add(txn)
+    
+    def add(self, txn):
+        """Fold one transaction into its merchant's state"""
+        key = txn['merchant'].lower()
+        state = self.merchants.get(key)
+        if state is None:
+            state = self.merchants[key] = MerchantState(txn['merchant'])
         
-        # Gambling/betting apps
-        gambling_keywords = ['dream11', 'mpl', 'paytm first games', 'bet', 'casino']
-        gambling_txns = [t for t in transactions 
-                        if any(g in t['merchant'].lower() for g in gambling_keywords)]
-        if gambling_txns:
-            total = sum([t['amount'] for t in gambling_txns])
-            wasteful.append({
-                'type': 'gambling',
-                'service': 'Gaming/Betting apps',
-                'amount': total,
-                'reason': f'{len(gambling_txns)} gambling transactions',
-                'monthlySavings': total
-            })
+        day = datetime.fromisoformat(txn['date']).toordinal()
+        if not state.count:
+            state.first_day = state.last_day = day
+        if day >= state.last_day:
+            state.last_day = day
+            state.last_date = txn['date']
+        if day < state.first_day:
+            state.first_day = day
+            state.service = txn['merchant']
+        if state.days is not None:
+            self._add_day(state, day)
         
-        return wasteful
+        amount = txn['amount']
+        state.count += 1
+        state.total += amount
+        delta = amount - state.mean
+        state.mean += delta / state.count
+        state.m2 += delta * (amount - state.mean)
+    
+    def _add_day(self, state, day):
+        """Slot day between its neighbours, splitting the interval it falls in"""
+        days = state.days
+        pos = bisect.bisect_left(days, day)
+        before = days[pos - 1] if pos else None
+        after = days[pos] if pos < len(days) else None
+        if (before is not None and day - before < self.MIN_INTERVAL or
+                after is not None and after - day < self.MIN_INTERVAL):
+            state.days = None
+            return
+        if before is not None and after is not None and after - before > self.MAX_INTERVAL:
+            state.gaps -= 1
+        if before is not None and day - before > self.MAX_INTERVAL:
+            state.gaps += 1
+        if after is not None and after - day > self.MAX_INTERVAL:
+            state.gaps += 1
+        days.insert(pos, day)
+    
+    def is_subscription(self, merchant):
+        state = self.merchants.get(merchant.lower())
+        return bool(state and state.count >= 2 and state.days is not None and not state.gaps)
+    
+    def subscription(self, merchant):
+        """Subscription record for the merchant, or None"""
+        if not self.is_subscription(merchant):
+            return None
+        state = self.merchants[merchant.lower()]
+        return {
+            'service': state.service,
+            'amount': state.total / state.count,
+            'frequency': 'monthly',
+            'lastCharged': state.last_date,
+            'status': 'active',
+            'transactionCount': state.count
+        }
+    
+    def subscriptions(self):
+        """Same records as detect_subscription, without replaying history"""
+        return [self.subscription(key) for key in self.merchants
+                if self.is_subscription(key)]
+    
+    def merchant_stats(self, merchant):
+        """Running amount and interval statistics for one merchant"""
+        state = self.merchants[merchant.lower()]
+        return {
+            'count': state.count,
+            'amountMean': state.mean,
+            'amountVariance': state.m2 / state.count,
+            'meanInterval': (state.last_day - state.first_day) / (state.count - 1)
+                            if state.count > 1 else None,
+            'lastCharged': state.last_date
+        }
+    
+    def to_dict(self):
+        """JSON-serializable snapshot of the detector state"""
+        return {key: {slot: getattr(state, slot) for slot in MerchantState.__slots__}
+                for key, state in self.merchants.items()}
+    
+    @classmethod
+    def from_dict(cls, data):
+        detector = cls()
+        for key, fields in data.items():
+            state = MerchantState(fields['service'])
+            for slot in MerchantState.__slots__:
+                setattr(state, slot, fields[slot])
+            detector.merchants[key] = state
+        return detector
 
 
 class InvestmentRecommender:
-    def __init__(self):
-        self.investment_options = {
-            'gold_digital': {
-                'name': 'Digital Gold',
-                'risk': 'Low',
-                'return_6m': 0.04,
-                'return_12m': 0.057,
-                'min_investment': 100
-            },
-            'index_fund': {
-                'name': 'Index Fund SIP',
-                'risk': 'Medium',
-                'return_6m': 0.06,
-                'return_12m': 0.107,
-                'min_investment': 500
-            },
-            'high_yield_savings': {
-                'name': 'High-Yield Savings',
-                'risk': 'No Risk',
-                'return_6m': 0.02,
-                'return_12m': 0.04,
-                'min_investment': 1000
-            },
-            'debt_fund': {
-                'name': 'Debt Mutual Fund',
-                'risk': 'Low',
-                'return_6m': 0.035,
-                'return_12m': 0.065,
-                'min_investment': 1000
-            }
-        }
-    
-    def recommend_investments(self, monthly_savings):
-        """Recommend investment options based on savings"""
-        recommendations = []
+    def __init__(self, investment_options=None):
+        from investment_projections import INVESTMENT_OPTIONS
         
-        for key, option in self.investment_options.items():
-            if monthly_savings >= option['min_investment']:
-                # Calculate projections
-                amount_6m = monthly_savings * 6
-                amount_12m = monthly_savings * 12
-                
-                projected_6m = amount_6m * (1 + option['return_6m'])
-                projected_12m = amount_12m * (1 + option['return_12m'])
-                
-                gain_6m = projected_6m - amount_6m
-                gain_12m = projected_12m - amount_12m
-                
-                recommendations.append({
-                    'option': option['name'],
-                    'risk': option['risk'],
-                    'monthly_investment': monthly_savings,
-                    'projections': {
-                        '6_months': {
-                            'invested': amount_6m,
-                            'projected': round(projected_6m, 2),
-                            'gain': round(gain_6m, 2),
-                            'return_percent': round(option['return_6m'] * 100, 1)
-                        },
-                        '12_months': {
-                            'invested': amount_12m,
-                            'projected': round(projected_12m, 2),
-                            'gain': round(gain_12m, 2),
-                            'return_percent': round(option['return_12m'] * 100, 1)
-                        }
-                    },
-                    'reward_points': int(monthly_savings * 0.12)  # 12% of savings as points
-                })
+        self.investment_options = investment_options or INVESTMENT_OPTIONS
+    
+    def recommend_investments(self, monthly_savings, simulate=False):
+        """Recommend investment options based on savings, with what a
+        monthly SIP of the savings grows to in 6 and 12 months; simulate
+        adds P10/P50/P90 outcomes from simulated return paths"""
+        from investment_projections import engine_for
         
-        return sorted(recommendations, key=lambda x: x['projections']['12_months']['gain'], reverse=True)
+        engine = engine_for(self.investment_options)
+        recommendations = engine.recommend(monthly_savings)
+        if simulate:
+            outcomes = {row['option']: row['projections'] for row in engine.simulate(monthly_savings)}
+            for recommendation in recommendations:
+                recommendation['simulation'] = outcomes[recommendation['option']]
+        return recommendations
 
 
 # Lambda handler
 def lambda_handler(event, context):
-    """AWS Lambda for categorization and subscription detection"""
+    """AWS Lambda for categorization and subscription detection.
+    
+    With 'input' (an NDJSON path or s3:// URI) and 'output', runs the
+    streaming pipeline instead, see categorization_pipeline.
+    """
+    if event.get('input'):
+        import categorization_pipeline
+        return categorization_pipeline.lambda_handler(event, context)
     
     transactions = event.get('transactions', [])
     
-    categorizer = TransactionCategorizer()
+    categorizer = TransactionCategorizer(
+        backend=event.get('backend', os.environ.get('ANALYTICS_BACKEND', 'python')))
     
     # Categorize all transactions
-    categorized = [categorizer.categorize_transaction(t) for t in transactions]
+    categorized = categorizer.categorize_transactions(transactions)
     
     # Detect subscriptions
     subscriptions = categorizer.detect_subscription(categorized)
@@ -272,7 +668,7 @@ def lambda_handler(event, context):
     
     # Get investment recommendations
     recommender = InvestmentRecommender()
-    investments = recommender.recommend_investments(total_savings)
+    investments = recommender.recommend_investments(total_savings, simulate=event.get('simulate', False))
     
     return {
         'statusCode': 200,
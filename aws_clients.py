@@ -0,0 +1,96 @@
+"""
+AWS Clients - PFMS Hackathon MVP
+Shared boto3 clients and DynamoDB tables, created on first use and reused
+by every warm Lambda invocation
+"""
+
+import os
+import threading
+
+_lock = threading.RLock()
+_session = None
+_config = None
+_clients = {}
+
+# Resources are not thread-safe, so each thread gets its own. Lambda runs
+# handlers on one thread, which makes them process-wide there too.
+_local = threading.local()
+
+
+def session():
+    """Shared boto3 session; boto3 itself is imported on first use"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    return _session
+
+
+def client_config():
+    """Pooled keep-alive connections, and retries with backoff on throttling"""
+    global _config
+    if _config is None:
+        from botocore.config import Config
+        _config = Config(
+            max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50)),
+            tcp_keepalive=True,
+            connect_timeout=2,
+            read_timeout=10,
+            retries={'max_attempts': 5, 'mode': 'standard'}
+        )
+    return _config
+
+
+def client(service_name):
+    """Process-wide client for service_name (clients are thread-safe)"""
+    cached = _clients.get(service_name)
+    if cached is None:
+        with _lock:
+            cached = _clients.get(service_name)
+            if cached is None:
+                cached = _clients[service_name] = session().client(
+                    service_name, config=client_config())
+    return cached
+
+
+def resource(service_name):
+    """This thread's resource for service_name"""
+    resources = _local.__dict__.setdefault('resources', {})
+    cached = resources.get(service_name)
+    if cached is None:
+        # Building from the shared session is not thread-safe
+        with _lock:
+            cached = resources[service_name] = session().resource(
+                service_name, config=client_config())
+    return cached
+
+
+def table(name):
+    """This thread's DynamoDB Table object for name"""
+    tables = _local.__dict__.setdefault('tables', {})
+    cached = tables.get(name)
+    if cached is None:
+        cached = tables[name] = resource('dynamodb').Table(name)
+    return cached
+
+
+class LazyTable:
+    """Stands in for a module-level Table, resolved on first attribute use"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(table(self.name), attr)
+
+
+def reset():
+    """Forget the shared clients and this thread's resources, e.g. after
+    changing credentials or region"""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+    _local.__dict__.clear()
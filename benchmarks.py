@@ -0,0 +1,1492 @@
+"""
+Benchmarks - PFMS Hackathon MVP
+Times the optimized code paths against the original implementations on
+synthetic data. The originals and data generators here are also the
+references for the equivalence tests in tests/.
+
+Usage: python benchmarks.py [name ...]
+"""
+
+import json
+import itertools
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+# boto3 clients need a region even though no AWS call is made here
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = {}
+
+MERCHANTS = [
+    'Swiggy', 'Zomato', 'Starbucks', 'Amazon', 'Amazon Prime', 'Flipkart',
+    'Uber', 'Ola', 'Netflix', 'Hotstar', 'Spotify', 'Airtel Recharge',
+    'Electricity Bill', 'Zerodha', 'Groww', 'Apollo Pharmacy', 'Udemy',
+    'Gym Membership', 'Dream11', 'Local Kirana', 'Ramesh Traders',
+    'Sharma Sweets', 'ACME Corp', 'Unknown Merchant'
+]
+
+SUBJECTS = [
+    'Your order has been delivered', 'Payment received', 'Transaction alert',
+    'Amount debited from your account', 'Receipt for your purchase',
+    'Invoice #{n}', 'UPI payment successful', 'Your monthly statement'
+]
+
+
+def benchmark(func):
+    """Register a benchmark under its name without the bench_ prefix"""
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+
+def timed(func, *args):
+    """Run func once and return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def report(label, baseline, optimized):
+    print(f"  {label:<40} {baseline * 1000:10.1f} ms {optimized * 1000:10.1f} ms"
+          f" {baseline / optimized if optimized else float('inf'):8.1f}x")
+
+
+def synthetic_transactions(count, seed=42):
+    """Random transactions shaped like the Gmail parser output"""
+    rng = random.Random(seed)
+    transactions = []
+    for n in range(count):
+        merchant = rng.choice(MERCHANTS)
+        transactions.append({
+            'date': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'amount': float(rng.choice([49, 99, 119, 180, 299, 450, 599, 1499, 2500])),
+            'merchant': merchant,
+            'type': 'expense',
+            'source': 'Gmail',
+            'rawSubject': rng.choice(SUBJECTS).format(n=n)
+        })
+    return transactions
+
+
+def synthetic_history(merchants=500, months=36, seed=7):
+    """Multi-year history: monthly charges for some merchants, noise for the rest"""
+    from datetime import date, timedelta
+
+    rng = random.Random(seed)
+    start = date(2021, 1, 1)
+    transactions = []
+    for m in range(merchants):
+        name = f"{rng.choice(MERCHANTS)} {m}"
+        if m % 3 == 0:
+            # Regular monthly charge with a little jitter
+            day = start + timedelta(days=rng.randint(0, 30))
+            amount = float(rng.choice([119, 299, 599, 1500]))
+            for _ in range(rng.randint(2, months)):
+                transactions.append({'date': day.isoformat(), 'amount': amount,
+                                     'merchant': name, 'category': 'Subscriptions'})
+                day += timedelta(days=rng.randint(27, 33))
+        else:
+            for _ in range(rng.randint(1, months)):
+                day = start + timedelta(days=rng.randint(0, months * 30))
+                transactions.append({'date': day.isoformat(),
+                                     'amount': float(rng.randint(20, 3000)),
+                                     'merchant': name,
+                                     'category': rng.choice(['Food', 'Shopping', 'Bills'])})
+    rng.shuffle(transactions)
+    return transactions
+
+
+def same_subscriptions(expected, actual):
+    """Compare subscription lists, allowing float noise in averaged amounts"""
+    assert len(expected) == len(actual), (len(expected), len(actual))
+    for e, a in zip(expected, actual):
+        assert abs(e['amount'] - a['amount']) < 1e-6, (e, a)
+        assert dict(e, amount=0) == dict(a, amount=0), (e, a)
+
+
+def legacy_rule_category(category_rules, merchant, description):
+    """Original nested keyword scan from categorize_transaction"""
+    for category, keywords in category_rules.items():
+        if any(keyword in merchant or keyword in description for keyword in keywords):
+            return category
+    return None
+
+
+class StubComprehend:
+    """Local stand-in for the Comprehend client with a fixed per-call latency"""
+
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self.calls = 0
+
+    def _entities(self, text):
+        if any(w in text for w in ('corp', 'traders', 'sweets')):
+            return [{'Type': 'ORGANIZATION', 'Text': text}]
+        return []
+
+    def detect_entities(self, Text, LanguageCode):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {'Entities': self._entities(Text)}
+
+    def batch_detect_entities(self, TextList, LanguageCode):
+        assert len(TextList) <= 25
+        self.calls += 1
+        time.sleep(self.latency)
+        return {
+            'ResultList': [{'Index': i, 'Entities': self._entities(text)}
+                           for i, text in enumerate(TextList)],
+            'ErrorList': []
+        }
+
+
+def legacy_categorize(categorizer, transaction):
+    """Original categorize_transaction: one detect_entities call per miss"""
+    merchant = transaction.get('merchant', '').lower()
+    description = transaction.get('rawSubject', '').lower()
+    category = legacy_rule_category(categorizer.category_rules, merchant, description)
+    if category is None:
+        response = categorizer.comprehend.detect_entities(
+            Text=f"{merchant} {description}", LanguageCode='en')
+        entities = [e['Type'] for e in response['Entities']]
+        category = 'Shopping' if 'ORGANIZATION' in entities else 'Others'
+    return dict(transaction, category=category)
+
+
+def legacy_detect_wasteful_expenses(transactions, subscriptions):
+    """Original detect_wasteful_expenses: rescans everything per subscription"""
+    wasteful = []
+
+    # Check for unused subscriptions (no usage pattern)
+    for sub in subscriptions:
+        service = sub['service'].lower()
+
+        # Gym membership with no other fitness expenses
+        if 'gym' in service:
+            fitness_txns = [t for t in transactions
+                           if any(w in t['merchant'].lower()
+                                 for w in ['gym', 'fitness', 'yoga', 'sports'])]
+            if len(fitness_txns) <= 2:  # Only subscription charges
+                wasteful.append({
+                    'type': 'unused_subscription',
+                    'service': sub['service'],
+                    'amount': sub['amount'],
+                    'reason': 'Gym membership with no usage',
+                    'monthlySavings': sub['amount']
+                })
+
+        # Streaming services with multiple subscriptions
+        streaming = ['netflix', 'hotstar', 'amazon prime', 'youtube']
+        user_streaming = [s for s in subscriptions
+                        if any(st in s['service'].lower() for st in streaming)]
+        if len(user_streaming) > 2:
+            wasteful.append({
+                'type': 'duplicate_subscription',
+                'service': ', '.join([s['service'] for s in user_streaming]),
+                'amount': sum([s['amount'] for s in user_streaming]),
+                'reason': f'Multiple streaming subscriptions ({len(user_streaming)})',
+                'monthlySavings': min([s['amount'] for s in user_streaming])
+            })
+
+    # Small repeated expenses (coffee, snacks)
+    small_expenses = [t for t in transactions
+                     if t['amount'] < 200 and t['category'] == 'Food']
+    if len(small_expenses) > 20:  # More than 20 small food expenses
+        total = sum([t['amount'] for t in small_expenses])
+        wasteful.append({
+            'type': 'small_repeated_expenses',
+            'service': 'Small food purchases',
+            'amount': total,
+            'reason': f'{len(small_expenses)} small food expenses',
+            'monthlySavings': total * 0.3  # Suggest 30% reduction
+        })
+
+    # Gambling/betting apps
+    gambling_keywords = ['dream11', 'mpl', 'paytm first games', 'bet', 'casino']
+    gambling_txns = [t for t in transactions
+                    if any(g in t['merchant'].lower() for g in gambling_keywords)]
+    if gambling_txns:
+        total = sum([t['amount'] for t in gambling_txns])
+        wasteful.append({
+            'type': 'gambling',
+            'service': 'Gaming/Betting apps',
+            'amount': total,
+            'reason': f'{len(gambling_txns)} gambling transactions',
+            'monthlySavings': total
+        })
+
+    return wasteful
+
+
+@benchmark
+def bench_categorize(count=100000):
+    """Keyword matcher vs nested keyword scan"""
+    from ai_categorization import TransactionCategorizer
+
+    categorizer = TransactionCategorizer()
+    rules = categorizer.category_rules
+    texts = [(t['merchant'].lower(), t['rawSubject'].lower())
+             for t in synthetic_transactions(count)]
+
+    legacy, legacy_time = timed(
+        lambda: [legacy_rule_category(rules, m, d) for m, d in texts])
+    matched, matcher_time = timed(
+        lambda: [categorizer.matcher.match(m, d) for m, d in texts])
+
+    assert legacy == matched, 'matcher disagrees with the keyword scan'
+    report(f'rule categorization ({count} txns)', legacy_time, matcher_time)
+
+
+@benchmark
+def bench_comprehend_batch(count=2000):
+    """Batched, cached Comprehend fallback vs one call per unmatched txn"""
+    from ai_categorization import TransactionCategorizer
+    from category_store import MemoryCategoryStore, MerchantCategoryStore
+
+    transactions = synthetic_transactions(count)
+
+    legacy_client = StubComprehend()
+    legacy_categorizer = TransactionCategorizer(comprehend=legacy_client)
+    legacy, legacy_time = timed(
+        lambda: [legacy_categorize(legacy_categorizer, t) for t in transactions])
+
+    batch_client = StubComprehend()
+    categorizer = TransactionCategorizer(
+        comprehend=batch_client, store=MerchantCategoryStore([MemoryCategoryStore()]))
+    batched, batch_time = timed(
+        categorizer.categorize_transactions, [dict(t) for t in transactions])
+
+    assert [t['category'] for t in legacy] == [t['category'] for t in batched]
+    report(f'comprehend fallback ({count} txns)', legacy_time, batch_time)
+    print(f"    comprehend calls: {legacy_client.calls} -> {batch_client.calls}")
+
+
+@benchmark
+def bench_merchant_store(count=100000):
+    """Categorization with a warm merchant store vs a cold one"""
+    import tempfile
+    from ai_categorization import TransactionCategorizer
+    from category_store import (MemoryCategoryStore, MerchantCategoryStore,
+                                SQLiteCategoryStore)
+
+    transactions = synthetic_transactions(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MerchantCategoryStore([
+            MemoryCategoryStore(), SQLiteCategoryStore(os.path.join(tmp, 'store.db'))])
+        categorizer = TransactionCategorizer(comprehend=StubComprehend(), store=store)
+        cold, cold_time = timed(
+            categorizer.categorize_transactions, [dict(t) for t in transactions])
+
+        # A new invocation in the same container: fresh categorizer, same store
+        categorizer = TransactionCategorizer(comprehend=StubComprehend(), store=store)
+        warm, warm_time = timed(
+            categorizer.categorize_transactions, [dict(t) for t in transactions])
+
+        assert [t['category'] for t in cold] == [t['category'] for t in warm]
+        report(f'cold vs warm store ({count} txns)', cold_time, warm_time)
+        print(f"    store stats: {store.stats()}")
+
+
+@benchmark
+def bench_subscriptions(updates=50):
+    """Incremental subscription detector vs re-running detect_subscription"""
+    from ai_categorization import SubscriptionDetector, TransactionCategorizer
+
+    categorizer = TransactionCategorizer(comprehend=StubComprehend())
+    history = synthetic_history()
+    past, new = history[:-updates], history[-updates:]
+
+    def replay():
+        seen = list(past)
+        for txn in new:
+            seen.append(txn)
+            result = categorizer.detect_subscription(seen)
+        return result
+
+    def incremental():
+        detector = SubscriptionDetector(past)
+        for txn in new:
+            detector.add(txn)
+            result = detector.subscriptions()
+        return result
+
+    _, replay_time = timed(replay)
+    _, incremental_time = timed(incremental)
+    report(f'{updates} updates on {len(past)} txns', replay_time, incremental_time)
+
+
+@benchmark
+def bench_analytics(sizes=(10000, 100000, 1000000)):
+    """NumPy analytics backend vs the pure-Python detectors"""
+    from ai_categorization import TransactionCategorizer
+
+    python = TransactionCategorizer(comprehend=StubComprehend())
+    numpy = TransactionCategorizer(comprehend=StubComprehend(), backend='numpy')
+
+    def detect(categorizer, transactions):
+        subscriptions = categorizer.detect_subscription(transactions)
+        return subscriptions, categorizer.detect_wasteful_expenses(transactions, subscriptions)
+
+    for size in sizes:
+        # ~250 rows per month of history across 500 merchants
+        transactions = synthetic_history(merchants=500, months=size // 250)
+        _, python_time = timed(detect, python, transactions)
+        _, numpy_time = timed(detect, numpy, transactions)
+        report(f'detectors ({len(transactions)} rows)', python_time, numpy_time)
+
+
+@benchmark
+def bench_wasteful(merchants=3000, months=24):
+    """Single-pass wasteful-expense rules vs the per-subscription rescans"""
+    from ai_categorization import TransactionCategorizer
+
+    categorizer = TransactionCategorizer(comprehend=StubComprehend())
+    transactions = synthetic_history(merchants=merchants, months=months)
+    subscriptions = categorizer.detect_subscription(transactions)
+
+    legacy, legacy_time = timed(legacy_detect_wasteful_expenses, transactions, subscriptions)
+    wasteful, rules_time = timed(
+        categorizer.detect_wasteful_expenses, transactions, subscriptions)
+
+    report(f'wasteful rules ({len(transactions)} txns, {len(subscriptions)} subs)',
+           legacy_time, rules_time)
+    print(f"    records: {len(legacy)} -> {len(wasteful)}")
+
+
+def legacy_fetch_transaction_emails(fetcher, max_results=50):
+    """Original fetch: one list page, then one messages.get per id"""
+    results = fetcher.service.users().messages().list(
+        userId='me', q='', maxResults=max_results).execute()
+    transactions = []
+    for msg in results.get('messages', []):
+        full = fetcher.service.users().messages().get(
+            userId='me', id=msg['id'], format='full').execute()
+        transaction = fetcher.parse_message(full)
+        if transaction:
+            transactions.append(transaction)
+    return transactions
+
+
+@benchmark
+def bench_gmail_fetch(count=50, mailbox=20000, latency=0.005):
+    """Batched, paginated Gmail fetch vs one round trip per message"""
+    import tracemalloc
+    from fake_gmail import FakeGmailService, sample_mailbox
+    from gmail_integration import GmailTransactionFetcher
+
+    messages = sample_mailbox(mailbox)
+
+    legacy_service = FakeGmailService(messages, latency=latency)
+    _, legacy_time = timed(
+        legacy_fetch_transaction_emails, GmailTransactionFetcher(legacy_service), count)
+
+    service = FakeGmailService(messages, latency=latency, rate_limit_every=7)
+    fetcher = GmailTransactionFetcher(service, retry_delay=0.001)
+    _, fetch_time = timed(fetcher.fetch_transaction_emails, count)
+
+    report(f'sync {count} messages', legacy_time, fetch_time)
+    print(f"    http round trips: {legacy_service.calls['http']} -> {service.calls['http']}"
+          f" (with a 429 every 7th get)")
+
+    # Whole mailbox: peak memory should not grow with the number of messages
+    service = FakeGmailService(messages, rate_limit_every=50)
+    fetcher = GmailTransactionFetcher(service, retry_delay=0.0)
+    tracemalloc.start()
+    synced = sum(1 for _ in fetcher.iter_transactions())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"    full mailbox: {synced} messages, peak {peak / 1024:.0f} KiB,"
+          f" {service.calls['http']} round trips")
+
+
+@benchmark
+def bench_gmail_incremental(syncs=20, new_per_sync=2, latency=0.005):
+    """historyId incremental syncs vs re-fetching the newest 50 every time"""
+    from fake_gmail import FakeGmailService, make_message, sample_mailbox
+    from gmail_integration import GmailTransactionFetcher
+
+    def deliver(service, n):
+        for i in range(new_per_sync):
+            service.add_message(make_message(
+                f'new{n:04d}{i}', f'Payment of Rs.{200 + i}.00 debited at Swiggy',
+                f'Rs.{200 + i}.00 debited from your account via UPI'))
+
+    legacy_service = FakeGmailService(sample_mailbox(5000), latency=latency)
+    legacy_fetcher = GmailTransactionFetcher(legacy_service)
+
+    def legacy_syncs():
+        for n in range(syncs):
+            deliver(legacy_service, n)
+            legacy_fetch_transaction_emails(legacy_fetcher, 50)
+
+    service = FakeGmailService(sample_mailbox(5000), latency=latency)
+    fetcher = GmailTransactionFetcher(service)
+    _, _, checkpoint = fetcher.sync(None)
+    service.calls.clear()
+
+    def incremental_syncs():
+        nonlocal checkpoint
+        found = 0
+        for n in range(syncs):
+            deliver(service, n)
+            transactions, mode, checkpoint = fetcher.sync(checkpoint)
+            assert mode == 'incremental'
+            found += len(transactions)
+        return found
+
+    _, legacy_time = timed(legacy_syncs)
+    found, incremental_time = timed(incremental_syncs)
+    assert found == syncs * new_per_sync
+    report(f'{syncs} syncs, {new_per_sync} new mails each', legacy_time, incremental_time)
+    print(f"    http round trips: {legacy_service.calls['http']} -> {service.calls['http']},"
+          f" messages fetched: {legacy_service.calls['get']} -> {service.calls['get']}")
+
+
+@benchmark
+def bench_gmail_two_phase(count=300, latency=0.005):
+    """Metadata-first parsing vs downloading every message in full"""
+    from fake_gmail import FakeGmailService, mixed_mailbox
+    from gmail_integration import GmailTransactionFetcher
+
+    messages = mixed_mailbox(count)
+
+    full_service = FakeGmailService(messages, latency=latency)
+    full, full_time = timed(
+        GmailTransactionFetcher(full_service).fetch_transaction_emails, count)
+
+    service = FakeGmailService(messages, latency=latency)
+    fetcher = GmailTransactionFetcher(service, two_phase=True)
+    two_phase, two_phase_time = timed(fetcher.fetch_transaction_emails, count)
+
+    assert full == two_phase
+    report(f'two-phase sync ({count} messages)', full_time, two_phase_time)
+    print(f"    bytes downloaded: {full_service.calls['bytes']} -> {service.calls['bytes']},"
+          f" estimated saved: {fetcher.stats['bytesSavedEstimate']},"
+          f" skipped {fetcher.stats['skipped']} of {count}")
+
+
+def legacy_extract_amount(subject, body):
+    """Original amount extraction: four uncompiled patterns over body + subject"""
+    import re
+    amount_patterns = [
+        r'₹\s*([0-9,]+\.?[0-9]*)',
+        r'Rs\.?\s*([0-9,]+\.?[0-9]*)',
+        r'INR\s*([0-9,]+\.?[0-9]*)',
+        r'amount.*?([0-9,]+\.?[0-9]*)'
+    ]
+    for pattern in amount_patterns:
+        match = re.search(pattern, body + ' ' + subject, re.IGNORECASE)
+        if match:
+            return float(match.group(1).replace(',', ''))
+    return None
+
+
+def email_corpus():
+    """sample_emails.json: bank alerts with the fields they must parse to"""
+    with open(os.path.join(ROOT, 'sample_emails.json'), encoding='utf-8') as f:
+        return json.load(f)['emails']
+
+
+@benchmark
+def bench_extract(rounds=2000):
+    """Bank templates + precompiled patterns vs the original regex sequence"""
+    from gmail_integration import GmailTransactionFetcher
+
+    fetcher = GmailTransactionFetcher()
+    emails = email_corpus()
+
+    # Alerts usually come wrapped in a long HTML footer
+    footer = ' <p>This is a system generated mail. Please do not reply.</p>' * 200
+    padded = [(e['subject'], e['body'] + footer, e['sender']) for e in emails]
+
+    def legacy():
+        for _ in range(rounds):
+            for subject, body, _ in padded:
+                legacy_extract_amount(subject, body)
+
+    def templated():
+        for _ in range(rounds):
+            for subject, body, sender in padded:
+                fetcher.extract_amount(subject, body, sender)
+
+    _, legacy_time = timed(legacy)
+    _, template_time = timed(templated)
+    report(f'amount extraction ({rounds * len(padded)} emails)', legacy_time, template_time)
+
+
+def dynamo_transactions_table():
+    """Transactions table (with its date index) in moto's in-memory
+    DynamoDB, call inside mock_aws()"""
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return dynamodb.create_table(
+        TableName='Transactions',
+        KeySchema=[{'AttributeName': 'userId', 'KeyType': 'HASH'},
+                   {'AttributeName': 'transactionId', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'userId', 'AttributeType': 'S'},
+                              {'AttributeName': 'transactionId', 'AttributeType': 'S'},
+                              {'AttributeName': 'date', 'AttributeType': 'S'}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'userId-date-index',
+            'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'},
+                          {'AttributeName': 'date', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'INCLUDE',
+                           'NonKeyAttributes': ['amount', 'merchant', 'category', 'type']}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def count_requests(table):
+    """Counter of DynamoDB operations the table's client sends"""
+    calls = Counter()
+    table.meta.client.meta.events.register(
+        'before-call.dynamodb', lambda model, **kwargs: calls.update([model.name]))
+    return calls
+
+
+@benchmark
+def bench_dynamo_writes(count=500, syncs=2):
+    """Batched upserts with message-id keys vs one put_item per transaction"""
+    from moto import mock_aws
+    from fake_gmail import FakeGmailService, sample_mailbox
+    from gmail_integration import GmailTransactionFetcher, save_transactions, to_dynamo
+
+    fetcher = GmailTransactionFetcher(FakeGmailService(sample_mailbox(count)))
+    transactions = fetcher.fetch_transaction_emails(count)
+
+    with mock_aws():
+        table = dynamo_transactions_table()
+        calls = count_requests(table)
+
+        def legacy():
+            for _ in range(syncs):
+                for txn in transactions:
+                    item = dict(txn, userId='user1',
+                                transactionId=f"txn_{datetime.now().timestamp()}")
+                    table.put_item(Item=to_dynamo(item))
+
+        _, legacy_time = timed(legacy)
+        legacy_rows = table.scan(Select='COUNT')['Count']
+        legacy_calls = calls['PutItem']
+
+        table.delete()
+        table = dynamo_transactions_table()
+        calls = count_requests(table)
+
+        def batched():
+            for _ in range(syncs):
+                save_transactions(table, 'user1', [dict(t) for t in transactions])
+
+        _, batch_time = timed(batched)
+        rows = table.scan(Select='COUNT')['Count']
+
+    # Re-syncing the same emails must upsert, not duplicate
+    assert rows == len(transactions), rows
+    report(f'{syncs} syncs of {len(transactions)} transactions', legacy_time, batch_time)
+    print(f"    requests: {legacy_calls} -> {calls['BatchWriteItem']},"
+          f" rows stored: {legacy_rows} -> {rows}")
+
+
+class MemoryTable:
+    """Just enough of a DynamoDB Table for save_transactions, thread-safe"""
+
+    def __init__(self):
+        import threading
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        with self.lock:
+            self.items[Item['userId'], Item['transactionId']] = Item
+
+
+@benchmark
+def bench_sync_scheduler(users=40, workers=8, latency=0.005):
+    """One worker syncing a shard of users concurrently vs one after another"""
+    from fake_gmail import FakeGmailService, sample_mailbox
+    from gmail_integration import GmailTransactionFetcher, MemorySyncStateStore, sync_user
+    from sync_scheduler import SyncScheduler
+
+    mailbox = sample_mailbox(200)
+    broken = f'user{users - 1:03d}'
+
+    def fetcher_factory(user_id):
+        if user_id == broken:
+            raise RuntimeError('token revoked')
+        return GmailTransactionFetcher(FakeGmailService(mailbox, latency=latency))
+
+    user_ids = [f'user{n:03d}' for n in range(users)]
+
+    sequential_table = MemoryTable()
+
+    def sequential():
+        sync_state = MemorySyncStateStore()
+        for user_id in user_ids:
+            try:
+                sync_user(fetcher_factory(user_id), user_id, sync_state, sequential_table)
+            except RuntimeError:
+                pass
+
+    table = MemoryTable()
+    sync_state = MemorySyncStateStore()
+    scheduler = SyncScheduler(fetcher_factory, resources=lambda: (sync_state, table),
+                              max_workers=workers)
+
+    _, sequential_time = timed(sequential)
+    results, scheduler_time = timed(scheduler.run, user_ids)
+    assert len(table.items) == len(sequential_table.items) == (users - 1) * 50
+    assert [r['userId'] for r in results if r['status'] == 'error'] == [broken]
+    assert len(sync_state) == users - 1
+
+    report(f'{users} users, {workers} workers', sequential_time, scheduler_time)
+    latencies = sorted(r['latencyMs'] for r in results if r['status'] == 'ok')
+    throttled = sum(r['throttledMs'] for r in results)
+    print(f"    per-user latency p50 {latencies[len(latencies) // 2]} ms,"
+          f" max {latencies[-1]} ms, {throttled:.0f} ms waiting on rate budgets,"
+          f" {results[-1]['userId']}: {results[-1]['error']}")
+
+
+def legacy_authenticate(token_path):
+    """The original authenticate(): unpickle token.pickle, rebuild the client"""
+    import pickle
+    from googleapiclient.discovery import build
+
+    with open(token_path, 'rb') as token:
+        creds = pickle.load(token)
+    assert creds.valid
+    return build('gmail', 'v1', credentials=creds)
+
+
+def oauth_credentials(expires_in, cls=None):
+    from datetime import timedelta
+    from google.oauth2.credentials import Credentials
+    from gmail_integration import utcnow
+
+    return (cls or Credentials)(
+        token='access-token', refresh_token='refresh-token',
+        token_uri='https://oauth2.googleapis.com/token',
+        client_id='client-id', client_secret='client-secret',
+        expiry=utcnow() + timedelta(seconds=expires_in))
+
+
+@benchmark
+def bench_gmail_auth(invocations=500, refresh_delay=0.05):
+    """Cached credentials and client vs unpickling and rebuilding per call"""
+    import pickle
+    import tempfile
+    import threading
+    from datetime import timedelta
+    from google.oauth2.credentials import Credentials
+    from gmail_integration import (CredentialCache, FileTokenStore, GmailTransactionFetcher,
+                                   utcnow)
+
+    class SlowRefreshCredentials(Credentials):
+        """Refresh takes refresh_delay, like a round trip to the token endpoint"""
+        refreshed = threading.Event()
+
+        def refresh(self, request):
+            time.sleep(refresh_delay)
+            self.token = 'refreshed-token'
+            self.expiry = utcnow() + timedelta(hours=1)
+            self.refreshed.set()
+
+    with tempfile.TemporaryDirectory() as directory:
+        token_path = os.path.join(directory, 'token.pickle')
+        with open(token_path, 'wb') as token:
+            pickle.dump(oauth_credentials(3600), token)
+
+        store = FileTokenStore(directory)
+        store.save('user1', oauth_credentials(3600))
+        cache = CredentialCache(store)
+        fetcher = GmailTransactionFetcher()
+
+        def legacy():
+            for _ in range(invocations):
+                legacy_authenticate(token_path)
+
+        def cached():
+            for _ in range(invocations):
+                fetcher.authenticate('user1', credentials=cache, interactive=False)
+
+        _, cold_time = timed(fetcher.authenticate, 'user1', cache, False)
+        _, legacy_time = timed(legacy)
+        _, cached_time = timed(cached)
+        with open(store.path('user1')) as f:
+            assert json.load(f)['refresh_token'] == 'refresh-token'
+
+        # Near expiry: served at once, refreshed in the background
+        cache.credentials['user2'] = oauth_credentials(300, SlowRefreshCredentials)
+        creds, warm_time = timed(cache.get, 'user2')
+        assert creds.token == 'access-token' and warm_time < refresh_delay / 2
+        assert SlowRefreshCredentials.refreshed.wait(5)
+
+        # Expired: refreshed inline
+        cache.credentials['user3'] = oauth_credentials(-60, SlowRefreshCredentials)
+        creds, expired_time = timed(cache.get, 'user3')
+        assert creds.token == 'refreshed-token' and expired_time >= refresh_delay
+
+    report(f'authenticate x{invocations}', legacy_time, cached_time)
+    print(f"    cold {cold_time * 1000:.1f} ms, near expiry {warm_time * 1000:.2f} ms"
+          f" (background refresh), expired {expired_time * 1000:.1f} ms (inline refresh)")
+
+
+def legacy_filter_by_time_period(transactions, time_period):
+    """The original chatbot filter: strptime on every row of the history"""
+    from datetime import timedelta
+
+    today = datetime.now()
+    if time_period == 'this week':
+        start_date = today - timedelta(days=7)
+    elif time_period == 'this month':
+        start_date = today.replace(day=1, hour=0, minute=0, second=0)
+    else:
+        start_date = today - timedelta(days=30)
+    return [t for t in transactions
+            if start_date <= datetime.strptime(t['date'], '%Y-%m-%d') <= today]
+
+
+def customer_history(user_id, years, per_day, seed=11):
+    """Transactions for every day of the last `years` years, as stored"""
+    from datetime import date, timedelta
+    from decimal import Decimal
+    from gmail_integration import transaction_id
+
+    rng = random.Random(seed)
+    today = date.today()
+    history = []
+    for day in range(years * 365):
+        for n in range(per_day):
+            txn = {
+                'userId': user_id,
+                'date': (today - timedelta(days=day)).isoformat(),
+                'amount': Decimal(rng.randint(50, 5000)),
+                'merchant': rng.choice(MERCHANTS),
+                'category': rng.choice(['Food', 'Shopping', 'Transport', 'Bills']),
+                'type': 'expense' if n else 'income',
+                'paymentMethod': 'UPI',
+                'source': 'Gmail',
+                'rawSubject': 'Transaction alert: amount debited from your account'
+            }
+            txn['transactionId'] = transaction_id(dict(txn, messageId=f'{day}-{n}'))
+            history.append(txn)
+    return history
+
+
+@benchmark
+def bench_chatbot_window(years=2, per_day=7, queries=3):
+    """Date-index window queries vs reading the full history per question"""
+    from moto import mock_aws
+
+    history = customer_history('user1', years, per_day)
+    with mock_aws():
+        table = dynamo_transactions_table()
+        with table.batch_writer() as batch:
+            for txn in history:
+                batch.put_item(Item=txn)
+
+        import chatbot_fulfillment
+        chatbot_fulfillment.transactions_table = table
+        calls = count_requests(table)
+
+        def legacy(period):
+            items = table.query(
+                KeyConditionExpression='userId = :uid',
+                ExpressionAttributeValues={':uid': 'user1'}
+            ).get('Items', [])
+            return legacy_filter_by_time_period(items, period)
+
+        def windowed(period):
+            return chatbot_fulfillment.query_transactions(
+                'user1', *chatbot_fulfillment.period_range(period))
+
+        # The legacy query stops at the first 1 MB page, so check against the
+        # data. Its 'this month' also drops the 1st (start keeps microseconds).
+        month_start = datetime.now().date().replace(day=1).isoformat()
+        expected = {
+            'this week': legacy_filter_by_time_period(history, 'this week'),
+            'this month': [t for t in history if t['date'] >= month_start]
+        }
+        for period, rows in expected.items():
+            assert (sorted(t['amount'] for t in rows) ==
+                    sorted(t['amount'] for t in windowed(period))), period
+        legacy_rows = len(table.query(
+            KeyConditionExpression='userId = :uid',
+            ExpressionAttributeValues={':uid': 'user1'})['Items'])
+        calls.clear()
+
+        _, legacy_time = timed(lambda: [legacy('this week') for _ in range(queries)])
+        calls.clear()
+        _, window_time = timed(lambda: [windowed('this week') for _ in range(queries)])
+
+    report(f"'this week' x{queries}, {years}y history", legacy_time, window_time)
+    print(f"    items read per question: {legacy_rows} of {len(history)} (truncated)"
+          f" -> {7 * per_day}, query requests: {calls['Query'] // queries}")
+
+
+def dynamo_table(name, range_key=None, region='us-east-1'):
+    """Table keyed on userId (+ range_key) in moto's DynamoDB, call inside mock_aws()"""
+    import boto3
+
+    keys = [('userId', 'HASH')] + ([(range_key, 'RANGE')] if range_key else [])
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': k, 'KeyType': t} for k, t in keys],
+        AttributeDefinitions=[{'AttributeName': k, 'AttributeType': 'S'} for k, _ in keys],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+# Stream sequence numbers, increasing across every stream_record; they
+# cross from 39 to 40 digits, more than a DynamoDB number holds
+stream_sequence = itertools.count(10 ** 39 - 500)
+
+
+def stream_record(table, old=None, new=None):
+    """DynamoDB stream record (NEW_AND_OLD_IMAGES) for a write to table"""
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    record = {
+        'eventName': 'MODIFY' if old and new else 'INSERT' if new else 'REMOVE',
+        'eventSourceARN': f'arn:aws:dynamodb:us-east-1:123456789012:table/{table}/stream/2024',
+        'dynamodb': {'SequenceNumber': str(next(stream_sequence))}
+    }
+    for name, item in [('OldImage', old), ('NewImage', new)]:
+        if item:
+            record['dynamodb'][name] = {k: serializer.serialize(v) for k, v in item.items()}
+    return record
+
+
+@benchmark
+def bench_rollups(years=1, per_day=7, rewards=40, stream_batch=100):
+    """Chatbot answers from spending rollups vs from raw transactions"""
+    from datetime import timedelta
+    from decimal import Decimal
+    import boto3
+    from moto import mock_aws
+    from spending_rollups import RollupStore, check, rebuild, stream_deltas
+
+    history = customer_history('user1', years, per_day)
+    start = datetime(2024, 1, 1)
+    reward_items = [{'userId': 'user1', 'rewardId': f'rwd_{n:04d}', 'action': 'weekly_streak',
+                     'points': Decimal(25 + n), 'description': f'Streak week {n}',
+                     'timestamp': (start + timedelta(days=7 * n)).isoformat()}
+                    for n in range(rewards)]
+
+    with mock_aws():
+        transactions = dynamo_transactions_table()
+        rewards_table = dynamo_table('Rewards', 'rewardId')
+        dynamo_table('SpendingRollups', 'rollupKey')
+        store = RollupStore(dynamodb=boto3.resource('dynamodb', region_name='us-east-1'))
+        for table, items in [(transactions, history), (rewards_table, reward_items)]:
+            with table.batch_writer() as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+
+        # Replay the writes through the stream handler, plus a re-sync that
+        # rewrites unchanged items and one edited transaction
+        records = ([stream_record('Transactions', new=t) for t in history] +
+                   [stream_record('Rewards', new=r) for r in reversed(reward_items)] +
+                   [stream_record('Transactions', t, t) for t in history[:50]])
+        edited = dict(history[0], amount=history[0]['amount'] + 1)
+        records.append(stream_record('Transactions', history[0], edited))
+        transactions.put_item(Item=edited)
+        for n in range(0, len(records), stream_batch):
+            store.apply(*stream_deltas(records[n:n + stream_batch]))
+        assert check('user1', transactions, rewards_table, store) == []
+
+        # Drift is reported, and a rebuild repairs it
+        store.table.put_item(Item={'userId': 'user1', 'rollupKey': 'D#1999-01-01',
+                                   'expense': Decimal(5)})
+        assert len(check('user1', transactions, rewards_table, store)) == 1
+        rebuild('user1', transactions, rewards_table, store)
+        assert check('user1', transactions, rewards_table, store) == []
+
+        import chatbot_fulfillment
+        chatbot_fulfillment.transactions_table = transactions
+        chatbot_fulfillment.rewards_table = rewards_table
+        chatbot_fulfillment.rollups = store
+
+        questions = [('SpendingQuery', {'TimePeriod': period, 'Category': category})
+                     for period in ['today', 'this week', 'this month', 'last month', 'last 30 days']
+                     for category in [None, 'Food']]
+        questions += [('InvestmentQuery', {}), ('RewardQuery', {})]
+
+        def answers(use_rollups):
+            chatbot_fulfillment.USE_ROLLUPS = use_rollups
+            return [chatbot_fulfillment.lambda_handler(
+                {'currentIntent': {'name': intent, 'slots': slots}, 'userId': 'user1'}, None)
+                for intent, slots in questions]
+
+        use_rollups = chatbot_fulfillment.USE_ROLLUPS
+        raw, raw_time = timed(answers, False)
+        rolled, rollup_time = timed(answers, True)
+        chatbot_fulfillment.USE_ROLLUPS = use_rollups
+
+    assert raw == rolled
+    report(f'{len(questions)} chatbot questions, {len(history)} txns', raw_time, rollup_time)
+    print(f"    {len(records)} stream records, rollups consistent after replay and rebuild")
+
+
+@benchmark
+def bench_aws_clients(invocations=50):
+    """Warm invocations reusing shared clients vs building them per call"""
+    import boto3
+    from moto import mock_aws
+    import aws_clients
+
+    def legacy_invocation():
+        # What RewardSystem and TransactionCategorizer did in every handler call
+        dynamodb = boto3.resource('dynamodb')
+        rewards = dynamodb.Table('Rewards')
+        dynamodb.Table('Users')
+        boto3.client('comprehend')
+        return rewards.get_item(Key={'userId': 'user1', 'rewardId': 'rwd_1'})
+
+    def shared_invocation():
+        aws_clients.table('Users')
+        aws_clients.client('comprehend')
+        return aws_clients.table('Rewards').get_item(Key={'userId': 'user1', 'rewardId': 'rwd_1'})
+
+    with mock_aws():
+        dynamo_table('Rewards', 'rewardId', os.environ['AWS_DEFAULT_REGION']).put_item(
+            Item={'userId': 'user1', 'rewardId': 'rwd_1', 'points': 50})
+
+        aws_clients.reset()
+        cold, cold_time = timed(shared_invocation)
+        _, legacy_time = timed(lambda: [legacy_invocation() for _ in range(invocations)])
+        warm, warm_time = timed(lambda: [shared_invocation() for _ in range(invocations)])
+        aws_clients.reset()
+
+    assert cold['Item'] == warm[-1]['Item']
+    report(f'{invocations} handler invocations', legacy_time, warm_time)
+    print(f"    cold start {cold_time * 1000:.1f} ms,"
+          f" warm {warm_time / invocations * 1000:.2f} ms per invocation")
+
+
+class atomic_moto_updates:
+    """Make moto's update_item atomic per call, as DynamoDB's is; moto
+    applies concurrent updates without a lock and can lose some"""
+
+    def __enter__(self):
+        import threading
+        from moto.dynamodb.models import DynamoDBBackend
+
+        lock = threading.Lock()
+        self.original = original = DynamoDBBackend.update_item
+
+        def update_item(backend, *args, **kwargs):
+            with lock:
+                return original(backend, *args, **kwargs)
+
+        DynamoDBBackend.update_item = update_item
+        return self
+
+    def __exit__(self, *exc):
+        from moto.dynamodb.models import DynamoDBBackend
+        DynamoDBBackend.update_item = self.original
+
+
+def legacy_update_user_points(system, user_id, points_to_add):
+    """The original read-modify-write of totalPoints"""
+    user = system.users_table.get_item(Key={'userId': user_id}).get('Item', {})
+    new_total = user.get('totalPoints', 0) + points_to_add
+    system.users_table.update_item(
+        Key={'userId': user_id},
+        UpdateExpression='SET totalPoints = :points, tier = :tier',
+        ExpressionAttributeValues={':points': new_total, ':tier': system.tier_for(new_total)}
+    )
+
+
+@benchmark
+def bench_reward_points(threads=8, awards=40):
+    """Atomic ADD of reward points vs get + SET, under concurrent awards"""
+    from concurrent.futures import ThreadPoolExecutor
+    from moto import mock_aws
+    from reward_system import RewardSystem
+
+    rng = random.Random(5)
+    deltas = [[rng.randint(5, 60) for _ in range(awards)] for _ in range(threads)]
+    expected = sum(map(sum, deltas))
+
+    def run(update):
+        def worker(points):
+            system = RewardSystem()
+            for delta in points:
+                update(system, 'user1', delta)
+
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(worker, deltas))
+
+    import aws_clients
+
+    with mock_aws(), atomic_moto_updates():
+        users = dynamo_table('Users', region=os.environ['AWS_DEFAULT_REGION'])
+
+        # Count what every RewardSystem client sends
+        aws_clients.reset()
+        calls = Counter()
+        aws_clients.session().events.register(
+            'before-call.dynamodb', lambda model, **kwargs: calls.update([model.name]))
+
+        _, legacy_time = timed(run, legacy_update_user_points)
+        legacy_total = users.get_item(Key={'userId': 'user1'})['Item']['totalPoints']
+
+        users.delete_item(Key={'userId': 'user1'})
+        legacy_calls = sum(calls.values())
+        calls.clear()
+        _, atomic_time = timed(run, RewardSystem.update_user_points)
+        user = users.get_item(Key={'userId': 'user1'})['Item']
+        atomic_calls = sum(calls.values())
+        aws_clients.reset()
+
+    report(f'{threads} threads x {awards} awards', legacy_time, atomic_time)
+    print(f"    total {expected} expected: get+SET kept {legacy_total}, ADD kept {user['totalPoints']};"
+          f" requests {legacy_calls} -> {atomic_calls} (tier writes only on a change)")
+
+
+
+def legacy_badges(rewards):
+    """The original badge derivation over a user's full reward history"""
+    badges = set()
+    if any(r['action'] == 'cancel_subscription' for r in rewards):
+        badges.add('first_cancel')
+    if any(r['action'] == 'invest_savings' for r in rewards):
+        badges.add('first_investment')
+    saved = [r.get('metadata', {}).get('saved_amount', 0) for r in rewards
+             if r['action'] == 'meet_savings_target']
+    if saved and max(saved) >= 10:
+        badges.add('savings_10')
+    if saved and max(saved) >= 20:
+        badges.add('savings_20')
+    return badges
+
+
+@benchmark
+def bench_reward_summary(history=2000, checks=20):
+    """First-time bonus checks and badges: summary item vs full reward history"""
+    from moto import mock_aws
+    from reward_system import RewardSystem
+    import aws_clients
+
+    rng = random.Random(19)
+    actions = ['weekly_streak', 'monthly_goal_achieved', 'meet_savings_target', 'cancel_subscription']
+    with mock_aws():
+        region = os.environ['AWS_DEFAULT_REGION']
+        rewards = dynamo_table('Rewards', 'rewardId', region=region)
+        dynamo_table('Users', region=region)
+        aws_clients.reset()
+        system = RewardSystem()
+
+        with rewards.batch_writer() as batch:
+            for i in range(history):
+                action = rng.choice(actions)
+                metadata = {'saved_amount': rng.randint(1, 15)} if action == 'meet_savings_target' else {}
+                batch.put_item(Item={'userId': 'user1', 'rewardId': f'rwd_{i:06d}', 'action': action,
+                                     'points': 10, 'metadata': metadata,
+                                     'timestamp': f'2024-01-01T00:00:{i:06d}'})
+
+        def legacy():
+            for _ in range(checks):
+                history_items = system.get_user_rewards('user1')
+                first = not any(r['action'] == 'invest_savings' for r in history_items)
+            return first, legacy_badges(system.get_user_rewards('user1'))
+
+        def summary():
+            for _ in range(checks):
+                first = not system.has_done('user1', 'invest_savings')
+            return first, system.get_action_summary('user1')['badges']
+
+        backfilled = system.backfill_action_summary('user1')
+        (legacy_first, expected), legacy_time = timed(legacy)
+        (first, badges), summary_time = timed(summary)
+        assert (first, badges) == (legacy_first, expected) == (True, backfilled['badges'])
+
+        # Awards keep the summary in step with the history
+        system.award_points('user1', 'invest_savings', {'investment_amount': 500})
+        system.award_points('user1', 'meet_savings_target', {'saved_amount': 25, 'budget': 100})
+        after = system.get_action_summary('user1')
+        assert after['badges'] == legacy_badges(system.get_user_rewards('user1'))
+        assert after['rewardCount'] == history + 2 and after['maxSavedAmount'] == 25
+        aws_clients.reset()
+
+    report(f'{checks} first-time checks + badges, {history} rewards', legacy_time, summary_time)
+    print(f"    badges {sorted(badges)}; items read per check: {history} -> 1")
+
+
+
+def legacy_leaderboard(users_table, limit=10):
+    """The original scan-and-sort leaderboard"""
+    users = users_table.scan().get('Items', [])
+    leaderboard = sorted(users, key=lambda x: x.get('totalPoints', 0), reverse=True)[:limit]
+    return [user['userId'] for user in leaderboard]
+
+
+@benchmark
+def bench_leaderboard(users=3000, requests=20):
+    """Leaderboard top-10 and rank: sharded points index vs scanning Users"""
+    import boto3
+    from moto import mock_aws
+    import leaderboard
+    from leaderboard import Leaderboard, POINTS_INDEX, shard_for
+
+    rng = random.Random(20)
+    points = {f'user{i:05d}': rng.randint(0, 50000) for i in range(users)}
+    expected = sorted(points, key=lambda u: (-points[u], u))[:10]
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = dynamodb.create_table(
+            TableName='Users',
+            KeySchema=[{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'userId', 'AttributeType': 'S'},
+                                  {'AttributeName': 'lbShard', 'AttributeType': 'S'},
+                                  {'AttributeName': 'totalPoints', 'AttributeType': 'N'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': POINTS_INDEX,
+                'KeySchema': [{'AttributeName': 'lbShard', 'KeyType': 'HASH'},
+                              {'AttributeName': 'totalPoints', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['email', 'tier']}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        with table.batch_writer() as batch:
+            for user_id, total in points.items():
+                # Padding stands in for the action summary and profile
+                batch.put_item(Item={'userId': user_id, 'totalPoints': total, 'lbShard': shard_for(user_id),
+                                     'email': f'{user_id}@example.com', 'profile': 'x' * 400})
+
+        calls = count_requests(table)
+        board = Leaderboard(table)
+        legacy, legacy_time = timed(lambda: [legacy_leaderboard(table) for _ in range(requests)][-1])
+        legacy_calls = sum(calls.values())
+        calls.clear()
+        leaderboard.clear_cache()
+        top, index_time = timed(lambda: [board.query_top(10) for _ in range(requests)][-1])
+        index_calls = sum(calls.values())
+        _, cached_time = timed(lambda: [board.top(10) for _ in range(requests)])
+
+        # Own rank for a mid-table user, against the in-memory order
+        user_id = sorted(points, key=lambda u: -points[u])[users // 10]
+        rank = board.rank(user_id)
+        assert rank['rank'] == 1 + sum(p > points[user_id] for p in points.values())
+
+        snapshots = dynamodb.create_table(
+            TableName='LeaderboardSnapshots',
+            KeySchema=[{'AttributeName': 'board', 'KeyType': 'HASH'},
+                       {'AttributeName': 'takenAt', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'board', 'AttributeType': 'S'},
+                                  {'AttributeName': 'takenAt', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        board.snapshot(snapshots, k=10)
+        stored = leaderboard.latest_snapshot(snapshots)
+        leaderboard.clear_cache()
+
+    assert [e['userId'] for e in top] == expected == [e['userId'] for e in stored['entries']]
+    report(f'{requests} top-10 requests, {users} users', legacy_time, index_time)
+    report('  ... served from the TTL cache', legacy_time, cached_time)
+    print(f"    requests {legacy_calls} scans -> {index_calls} index queries; scan top-10 correct: {legacy == expected}"
+          f" (one 1 MB page); rank of {user_id}: {rank['rank']}")
+
+
+
+@benchmark
+def bench_bulk_awards(users=200, per_user=3):
+    """Nightly awards: bulk batched writes vs award_points per record"""
+    from moto import mock_aws
+    from bulk_awards import BulkAwarder
+    from reward_system import RewardSystem
+    import aws_clients
+
+    rng = random.Random(21)
+    records = []
+    for i in range(users):
+        for _ in range(per_user):
+            action = rng.choice(['weekly_streak', 'monthly_goal_achieved', 'cancel_subscription'])
+            metadata = {'goal_name': 'Budget'} if action == 'monthly_goal_achieved' else \
+                {'subscription_name': 'Netflix', 'monthly_cost': rng.randint(100, 700)} \
+                if action == 'cancel_subscription' else {}
+            records.append({'userId': f'user{i:04d}', 'action': action, 'metadata': metadata})
+    records.append({'userId': 'broken'})
+
+    def totals(users_table):
+        items = users_table.scan()['Items']
+        return {u['userId']: (int(u['totalPoints']), int(u['rewardCount']), u.get('badges', set()))
+                for u in items}
+
+    region = os.environ['AWS_DEFAULT_REGION']
+    results = []
+    for bulk in (False, True):
+        with mock_aws():
+            rewards = dynamo_table('Rewards', 'rewardId', region=region)
+            users_table = dynamo_table('Users', region=region)
+            aws_clients.reset()
+            calls = Counter()
+            aws_clients.session().events.register(
+                'before-call.dynamodb', lambda model, **kwargs: calls.update([model.name]))
+
+            def one_by_one(records):
+                system = RewardSystem()
+                for record in records[:-1]:
+                    system.award_points(record['userId'], record['action'], record['metadata'])
+
+            summary, seconds = timed(BulkAwarder(max_workers=8).run if bulk else one_by_one, records)
+            results.append((totals(users_table), rewards.scan(Select='COUNT')['Count'],
+                            sum(calls.values()), seconds, summary))
+            aws_clients.reset()
+
+    (legacy, _, legacy_calls, legacy_time, _), (bulk, written, bulk_calls, bulk_time, summary) = results
+    assert bulk == legacy, 'bulk totals differ from award_points'
+    assert written == summary['rewardsWritten'] == len(records) - 1
+    assert [f['stage'] for f in summary['failed']] == ['parse']
+    report(f"{len(records) - 1} awards, {users} users", legacy_time, bulk_time)
+    print(f"    requests {legacy_calls} -> {bulk_calls}; {summary['recordsPerSecond']} records/s,"
+          f" {summary['usersUpdated']} users updated, failed: {summary['failed']}")
+
+
+
+@benchmark
+def bench_reward_ids(history=2000, requests=20):
+    """Latest 5 rewards: sortable reward ids vs fetching and sorting all"""
+    from moto import mock_aws
+    from reward_system import REWARD_ID, RewardSystem, new_reward_id
+    import aws_clients
+
+    ids = [new_reward_id(1700000000.0) for _ in range(10000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids) and all(map(REWARD_ID.match, ids))
+
+    with mock_aws():
+        rewards = dynamo_table('Rewards', 'rewardId', region=os.environ['AWS_DEFAULT_REGION'])
+        dynamo_table('Users', region=os.environ['AWS_DEFAULT_REGION'])
+        aws_clients.reset()
+        system = RewardSystem()
+
+        # Old-style ids, which sort by user and second only as strings
+        with rewards.batch_writer() as batch:
+            for i in range(history):
+                ts = 1700000000 + i * 3607
+                batch.put_item(Item={'userId': 'user1', 'rewardId': f'rwd_user1_{ts}', 'action': 'weekly_streak',
+                                     'points': 25, 'timestamp': datetime.fromtimestamp(ts).isoformat()})
+
+        def legacy():
+            everything = system.get_user_rewards('user1')
+            return sorted(everything, key=lambda x: x['timestamp'], reverse=True)[:5]
+
+        expected, legacy_time = timed(lambda: [legacy() for _ in range(requests)][-1])
+        moved, migrate_time = timed(system.migrate_reward_ids)
+        assert system.migrate_reward_ids('user1') == 0
+        latest, latest_time = timed(lambda: [system.get_recent_rewards('user1') for _ in range(requests)][-1])
+        assert [r['legacyRewardId'] for r in latest] == [r['rewardId'] for r in expected]
+
+        # Two awards in the same second both survive, newest first
+        first = system.award_points('user1', 'weekly_streak')
+        second = system.award_points('user1', 'weekly_streak')
+        newest = system.get_recent_rewards('user1', 2)
+        assert [r['rewardId'] for r in newest] == [second['rewardId'], first['rewardId']]
+        assert rewards.scan(Select='COUNT')['Count'] == history + 2
+        aws_clients.reset()
+
+    report(f'{requests} x latest 5 of {history} rewards', legacy_time, latest_time)
+    print(f"    items read per request: {history} -> 5; migrated {moved} rewards in {migrate_time * 1000:.0f} ms")
+
+
+
+def python_sip_value(amount, annual_return, months):
+    """Monthly SIP of amount, month by month in plain Python"""
+    monthly = (1 + annual_return) ** (1 / 12) - 1
+    value = 0.0
+    for _ in range(months):
+        value = (value + amount) * (1 + monthly)
+    return value
+
+
+def grid_recommendations(engine, amount):
+    """recommend() rows for one amount taken from the project() grid"""
+    invested, projected, eligible = engine.project([amount])
+    rows = [engine.row(key, amount, invested[0].tolist(), projected[0, o].tolist())
+            for o, key in enumerate(engine.keys) if eligible[0, o]]
+    rank = f'{max(engine.horizons)}_months'
+    return sorted(rows, key=lambda x: x['projections'][rank]['gain'], reverse=True)
+
+
+@benchmark
+def bench_projections(amounts=50000, horizons=(3, 6, 12, 24, 36)):
+    """Projection grid of amounts x options x horizons: NumPy vs a Python loop"""
+    import numpy as np
+    from investment_projections import INVESTMENT_OPTIONS, ProjectionEngine, engine_for
+
+    engine = ProjectionEngine(INVESTMENT_OPTIONS, horizons)
+    grid = np.linspace(100, 100000, amounts)
+    rates = [option['return_12m'] for option in INVESTMENT_OPTIONS.values()]
+    scenarios = amounts * len(rates) * len(horizons)
+
+    def loop():
+        return [[[python_sip_value(a, r, n) for n in horizons] for r in rates] for a in grid.tolist()]
+
+    expected, loop_time = timed(loop)
+    (_, projected, _), numpy_time = timed(engine.project, grid)
+    assert np.allclose(projected, np.array(expected), rtol=1e-9)
+
+    # The chatbot and dashboard ask for the same few amounts over and over
+    engine = engine_for()
+    rng = random.Random(23)
+    asks = [rng.choice([500, 1000, 1500, 2000, 5000]) for _ in range(1000)]
+    _, first_time = timed(lambda: [grid_recommendations(engine, a) for a in asks])
+    _, memo_time = timed(lambda: [engine.recommend(a) for a in asks])
+
+    report(f'{scenarios:,} SIP scenarios', loop_time, numpy_time)
+    report('1000 recommendations, unit values', first_time, memo_time)
+
+
+
+def python_simulation(options, paths, months, seed):
+    """P10/P50/P90 of 12-month SIP values per option, one path at a time"""
+    rng = random.Random(seed)
+    result = []
+    for option in options.values():
+        mean = (1 + option['return_12m']) ** (1 / 12) - 1
+        sd = option['volatility'] / 12 ** 0.5
+        values = []
+        for _ in range(paths):
+            value = 0.0
+            for _ in range(months):
+                value = (value + 1) * (1 + rng.gauss(mean, sd))
+            values.append(value)
+        values.sort()
+        result.append([values[int(paths * p / 100)] for p in (10, 50, 90)])
+    return result
+
+
+@benchmark
+def bench_simulation(paths=10000, runs=5):
+    """Monte Carlo P10/P50/P90 per option: NumPy paths vs a Python loop"""
+    import numpy as np
+    from investment_projections import INVESTMENT_OPTIONS, ProjectionEngine
+
+    engine = ProjectionEngine(INVESTMENT_OPTIONS, (12,))
+    normal = {key: {'distribution': 'normal'} for key in INVESTMENT_OPTIONS}
+
+    _, loop_time = timed(python_simulation, INVESTMENT_OPTIONS, paths, 12, 7)
+    times = []
+    for _ in range(runs):
+        unit, seconds = timed(engine.simulate_unit, paths, 7, normal)
+        times.append(seconds)
+    numpy_time = sorted(times)[runs // 2]
+
+    # Same seed, same answer; medians land on the deterministic SIP value
+    assert np.array_equal(unit, engine.simulate_unit(paths, 7, normal))
+    assert not np.array_equal(unit, engine.simulate_unit(paths, 8, normal))
+    deterministic = engine.factors[:, 0]
+    assert np.allclose(unit[:, 0, 1], deterministic, rtol=0.01)
+    expected = np.array(python_simulation(INVESTMENT_OPTIONS, 2000, 12, 7))
+    assert np.allclose(unit[:, 0, :], expected, rtol=0.03)
+
+    default = [timed(engine.simulate_unit, paths, seed)[1] for seed in range(runs)]
+    per_option = numpy_time / len(INVESTMENT_OPTIONS)
+    assert per_option < 0.05, f'{per_option * 1000:.1f} ms per option'
+    report(f'{len(INVESTMENT_OPTIONS)} options x {paths} paths x 12 months', loop_time, numpy_time)
+    print(f"    {per_option * 1000:.1f} ms per option; default distributions"
+          f" {sorted(default)[runs // 2] * 1000:.1f} ms for all options")
+
+
+
+@benchmark
+def bench_categorize_stream(count=100000):
+    """Categorization of an NDJSON import: streaming pipeline vs the batch handler"""
+    import tempfile
+    import tracemalloc
+    import boto3
+    from moto import mock_aws
+    from ai_categorization import InvestmentRecommender, TransactionCategorizer
+    from categorization_pipeline import run
+    from category_store import MemoryCategoryStore, MerchantCategoryStore
+    import aws_clients
+
+    def categorizer():
+        return TransactionCategorizer(comprehend=StubComprehend(latency=0),
+                                      store=MerchantCategoryStore([MemoryCategoryStore()]))
+
+    def batch(source, target):
+        """The batch handler's steps on the whole file, as lambda_handler runs them"""
+        with open(source) as f:
+            transactions = [json.loads(line) for line in f]
+        handler = categorizer()
+        categorized = handler.categorize_transactions(transactions)
+        subscriptions = handler.detect_subscription(categorized)
+        wasteful = handler.detect_wasteful_expenses(categorized, subscriptions)
+        total_savings = sum([w['monthlySavings'] for w in wasteful])
+        body = json.dumps({
+            'transactions': categorized,
+            'subscriptions': subscriptions,
+            'wasteful_expenses': wasteful,
+            'potential_monthly_savings': total_savings,
+            'investment_recommendations': InvestmentRecommender().recommend_investments(total_savings)
+        })
+        with open(target, 'w') as f:
+            f.write(body)
+        return json.loads(body)
+
+    def peak(func, *args):
+        tracemalloc.start()
+        result, seconds = timed(func, *args)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, seconds, peak_bytes
+
+    transactions = synthetic_history() + synthetic_transactions(count)
+    random.Random(25).shuffle(transactions)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'import.ndjson')
+        with open(source, 'w') as f:
+            for txn in transactions:
+                f.write(json.dumps(txn) + '\n')
+
+        expected, batch_time, batch_peak = peak(batch, source, os.path.join(tmp, 'batch.json'))
+        summary, stream_time, stream_peak = peak(run, source, os.path.join(tmp, 'out.ndjson'), categorizer())
+        with open(os.path.join(tmp, 'out.ndjson')) as f:
+            streamed = [json.loads(line) for line in f]
+
+        # Through S3 as well
+        with mock_aws():
+            region = os.environ['AWS_DEFAULT_REGION']
+            s3 = boto3.client('s3', region_name=region)
+            s3.create_bucket(Bucket='imports', CreateBucketConfiguration={'LocationConstraint': region})
+            s3.upload_file(source, 'imports', 'user1.ndjson')
+            aws_clients.reset()
+            from_s3 = run('s3://imports/user1.ndjson', 's3://imports/user1.out.ndjson', categorizer())
+            body = s3.get_object(Bucket='imports', Key='user1.out.ndjson')['Body'].read()
+            aws_clients.reset()
+
+    assert [t['category'] for t in streamed] == [t['category'] for t in expected['transactions']]
+    same_subscriptions(expected['subscriptions'], summary['subscriptions'])
+    assert summary['wasteful_expenses'] == expected['wasteful_expenses']
+    assert summary['investment_recommendations'] == expected['investment_recommendations']
+    assert from_s3['transactionCount'] == len(transactions) == body.count(b'\n')
+    report(f'{len(transactions)} txns from NDJSON', batch_time, stream_time)
+    print(f"    peak traced memory {batch_peak / 2**20:.0f} MB -> {stream_peak / 2**20:.1f} MB;"
+          f" {len(summary['subscriptions'])} subscriptions, S3 output {len(body) / 2**20:.1f} MB")
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    print(f"  {'benchmark':<40} {'baseline':>13} {'optimized':>13} {'speedup':>9}")
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,188 @@
+"""
+Bulk Awards - PFMS Hackathon MVP
+Awards points for a stream of (user, action, metadata) records, e.g. the
+nightly weekly-streak and monthly-goal run, in batched writes
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from reward_system import FIRST_TIME_BONUS, RewardSystem, new_reward_id, predates_summary
+
+# Worker threads for reward batches and per-user updates
+MAX_WORKERS = int(os.environ.get('AWARD_WORKERS', 8))
+
+# Records held in memory at once; a user appearing in several chunks gets
+# one Users update per chunk
+CHUNK_SIZE = int(os.environ.get('AWARD_CHUNK_SIZE', 10000))
+
+# Rewards per batch_writer, i.e. per worker task
+BATCH_SIZE = 500
+
+# batch_get_item takes at most this many keys
+BATCH_GET_KEYS = 100
+
+
+def record_fields(record):
+    """(userId, action, metadata) from a dict or a tuple"""
+    if isinstance(record, dict):
+        return record['userId'], record['action'], record.get('metadata') or {}
+    user_id, action, *rest = record
+    return user_id, action, (rest[0] if rest else None) or {}
+
+
+class BulkAwarder:
+    """Awards a stream of records chunk by chunk.
+
+    For each chunk, points are computed in memory (first-time bonuses from
+    one batch_get_item per 100 users), rewards are written with
+    batch_writer, and each user's points, action counts and badges are
+    added with a single update_user_points. Both write phases run on at
+    most max_workers threads, each with its own RewardSystem.
+
+    A user whose update fails keeps the rewards already written; they are
+    reported in failed with stage 'user', and retrying the record would
+    write the reward again.
+    """
+
+    def __init__(self, system_factory=RewardSystem, max_workers=MAX_WORKERS,
+                 chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+        self.system_factory = system_factory
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+    def run(self, records):
+        """Award every record; returns counts, throughput and failed items"""
+        started = time.perf_counter()
+        report = {'records': 0, 'rewardsWritten': 0, 'usersUpdated': 0, 'points': 0, 'failed': []}
+        system = self.system_factory()
+        records = iter(records)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bulk-award') as pool:
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                self.award_chunk(system, pool, chunk, report)
+
+        elapsed = time.perf_counter() - started
+        report['elapsedMs'] = round(elapsed * 1000)
+        report['recordsPerSecond'] = round(report['records'] / elapsed, 1) if elapsed else 0
+        return report
+
+    def award_chunk(self, system, pool, chunk, report):
+        rewards = []
+        for n, record in enumerate(chunk):
+            try:
+                user_id, action, metadata = record_fields(record)
+            except (KeyError, TypeError, ValueError) as e:
+                report['failed'].append({'record': report['records'] + n, 'stage': 'parse',
+                                         'error': f'{type(e).__name__}: {e}'})
+                continue
+            rewards.append((report['records'] + n, user_id, action, metadata))
+        report['records'] += len(chunk)
+
+        seen = self.actions_seen(system, {user_id for _, user_id, action, _ in rewards
+                                          if action in FIRST_TIME_BONUS})
+        items = []
+        for index, user_id, action, metadata in rewards:
+            first_time = action in FIRST_TIME_BONUS and action not in seen.setdefault(user_id, set())
+            if first_time:
+                seen[user_id].add(action)
+            points, description = system.compute_award(action, metadata, first_time)
+            now = time.time()
+            items.append((index, {
+                'rewardId': new_reward_id(now),
+                'userId': user_id,
+                'action': action,
+                'points': points,
+                'description': description,
+                'metadata': metadata,
+                'timestamp': datetime.fromtimestamp(now).isoformat()
+            }))
+
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        written = []
+        for batch, error in zip(batches, pool.map(self.write_rewards, batches)):
+            if error:
+                report['failed'].extend({'record': index, 'userId': item['userId'], 'stage': 'reward',
+                                         'error': error} for index, item in batch)
+            else:
+                written.extend(item for _, item in batch)
+        report['rewardsWritten'] += len(written)
+
+        deltas = {}
+        for item in written:
+            delta = deltas.setdefault(item['userId'], {'points': 0, 'counts': {}, 'badges': set(),
+                                                       'saved': None})
+            delta['points'] += item['points']
+            delta['counts'][item['action']] = delta['counts'].get(item['action'], 0) + 1
+            delta['badges'].update(system.badges_for(item['action'], item['metadata']))
+            if item['action'] == 'meet_savings_target':
+                saved = item['metadata'].get('saved_amount', 0)
+                delta['saved'] = saved if delta['saved'] is None else max(delta['saved'], saved)
+
+        for user_id, delta, error in pool.map(lambda d: (*d, self.update_user(*d)), deltas.items()):
+            if error:
+                report['failed'].append({'userId': user_id, 'stage': 'user', 'error': error})
+            else:
+                report['usersUpdated'] += 1
+                report['points'] += delta['points']
+
+    def actions_seen(self, system, user_ids):
+        """{userId: actionsSeen} for users, 100 keys per batch_get_item;
+        users rewarded before the action summary get it backfilled"""
+        seen = {}
+        users = sorted(user_ids)
+        table = system.users_table.name
+        for i in range(0, len(users), BATCH_GET_KEYS):
+            request = {table: {'Keys': [{'userId': u} for u in users[i:i + BATCH_GET_KEYS]],
+                               'ProjectionExpression': 'userId, actionsSeen, rewardCount, totalPoints'}}
+            while request:
+                response = system.dynamodb.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(table, []):
+                    if predates_summary(item):
+                        seen[item['userId']] = system.backfill_action_summary(item['userId'])['actions']
+                    else:
+                        seen[item['userId']] = set(item.get('actionsSeen', ()))
+                request = response.get('UnprocessedKeys')
+        return seen
+
+    def write_rewards(self, batch):
+        """Write one batch of rewards; returns an error message or None"""
+        try:
+            system = self.system_factory()
+            with system.rewards_table.batch_writer() as writer:
+                for _, item in batch:
+                    writer.put_item(Item=item)
+        except Exception as e:
+            return f'{type(e).__name__}: {e}'
+        return None
+
+    def update_user(self, user_id, delta):
+        """Add one user's aggregated delta; returns an error message or None"""
+        try:
+            system = self.system_factory()
+            saved = () if delta['saved'] is None else [delta['saved']]
+            system.update_user_points(user_id, delta['points'], badges=delta['badges'],
+                                      counts=delta['counts'], saved_amounts=saved)
+        except Exception as e:
+            return f'{type(e).__name__}: {e}'
+        return None
+
+
+# Lambda handler for bulk awards
+def lambda_handler(event, context):
+    """Award event['records'], each {'userId', 'action', 'metadata'}"""
+    report = BulkAwarder().run(event.get('records', []))
+    failed = report['failed']
+    report['failed'] = failed[:100]
+    report['failedCount'] = len(failed)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report)
+    }
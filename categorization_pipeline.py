@@ -0,0 +1,176 @@
+"""
+Categorization Pipeline - PFMS Hackathon MVP
+Streaming mode of the AI categorization Lambda: reads transactions as
+NDJSON from a file or S3 object, categorizes them chunk by chunk and
+writes the enriched transactions back out as NDJSON
+
+Usage: python categorization_pipeline.py INPUT OUTPUT  (paths or s3:// URIs)
+"""
+
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from ai_categorization import (
+    WASTE_KEYWORDS, InvestmentRecommender, RunningExpenseIndex, SubscriptionDetector,
+    TransactionCategorizer, wasteful_expenses
+)
+
+# Transactions categorized per Comprehend round and held in memory at once
+CHUNK_SIZE = int(os.environ.get('CATEGORIZE_CHUNK_SIZE', 1000))
+
+# S3 multipart uploads need parts of at least 5 MB, except the last one
+PART_SIZE = 8 * 1024 * 1024
+
+
+def split_s3_uri(uri):
+    """'s3://bucket/key' -> ('bucket', 'key'), None for a local path"""
+    if not uri.startswith('s3://'):
+        return None
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def read_ndjson(source):
+    """Transactions from an NDJSON path or s3:// URI, one at a time"""
+    s3_location = split_s3_uri(source)
+    if s3_location:
+        import aws_clients
+
+        bucket, key = s3_location
+        body = aws_clients.client('s3').get_object(Bucket=bucket, Key=key)['Body']
+        lines = body.iter_lines()
+    else:
+        lines = open(source, 'rb')
+    try:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if hasattr(lines, 'close'):
+            lines.close()
+
+
+class S3NdjsonWriter:
+    """File-like writer that streams to an S3 object with a multipart upload"""
+
+    def __init__(self, bucket, key, s3=None, part_size=PART_SIZE):
+        if s3 is None:
+            import aws_clients
+            s3 = aws_clients.client('s3')
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = s3.create_multipart_upload(
+            Bucket=bucket, Key=key, ContentType='application/x-ndjson')['UploadId']
+
+    def write(self, text):
+        self.buffer += text.encode('utf-8')
+        if len(self.buffer) >= self.part_size:
+            self.flush_part()
+
+    def flush_part(self):
+        number = len(self.parts) + 1
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+        self.buffer.clear()
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self.flush_part()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def open_output(target):
+    s3_location = split_s3_uri(target)
+    if s3_location:
+        return S3NdjsonWriter(*s3_location)
+    return open(target, 'w', encoding='utf-8')
+
+
+def categorize_stream(transactions, output, categorizer=None, chunk_size=CHUNK_SIZE,
+                      simulate=False):
+    """Categorize an iterable of transactions into output, chunk by chunk.
+
+    Each chunk is categorized in one categorize_transactions call (so
+    Comprehend still sees batches of unseen merchants), folded into the
+    incremental SubscriptionDetector and RunningExpenseIndex, and written
+    to output as NDJSON before the next chunk is read. Returns the same
+    summary as the batch handler, without the transactions.
+    
+    Memory is one chunk plus state per distinct merchant, not per row:
+    the detector's MerchantState, whose dates are bounded by the span of
+    the history, and the index's cached keyword hits. Its totals are fixed
+    size, and an S3 output holds at most one part in memory.
+    """
+    categorizer = categorizer or TransactionCategorizer()
+    detector = SubscriptionDetector()
+    index = RunningExpenseIndex(WASTE_KEYWORDS)
+    count = 0
+    transactions = iter(transactions)
+    while True:
+        chunk = list(islice(transactions, chunk_size))
+        if not chunk:
+            break
+        for txn in categorizer.categorize_transactions(chunk):
+            detector.add(txn)
+            index.add(txn)
+            output.write(json.dumps(txn) + '\n')
+        count += len(chunk)
+
+    subscriptions = detector.subscriptions()
+    wasteful = wasteful_expenses(index.finish(subscriptions))
+    total_savings = sum([w['monthlySavings'] for w in wasteful])
+    investments = InvestmentRecommender().recommend_investments(total_savings, simulate=simulate)
+    return {
+        'transactionCount': count,
+        'subscriptions': subscriptions,
+        'wasteful_expenses': wasteful,
+        'potential_monthly_savings': total_savings,
+        'investment_recommendations': investments
+    }
+
+
+def run(source, target, categorizer=None, chunk_size=CHUNK_SIZE, simulate=False):
+    """categorize_stream from an NDJSON path/s3:// URI to another"""
+    output = open_output(target)
+    try:
+        summary = categorize_stream(read_ndjson(source), output, categorizer, chunk_size, simulate)
+    except BaseException:
+        if isinstance(output, S3NdjsonWriter):
+            output.abort()
+        else:
+            output.close()
+        raise
+    output.close()
+    return {**summary, 'output': target}
+
+
+# Streaming mode of ai_categorization.lambda_handler
+def lambda_handler(event, context):
+    """Categorize event['input'] into event['output'] (paths or s3:// URIs)"""
+    started = time.perf_counter()
+    summary = run(event['input'], event['output'], simulate=event.get('simulate', False),
+                  chunk_size=int(event.get('chunkSize', CHUNK_SIZE)))
+    summary['elapsedMs'] = round((time.perf_counter() - started) * 1000)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(summary)
+    }
+
+
+if __name__ == '__main__':
+    result = json.loads(lambda_handler({'input': sys.argv[1], 'output': sys.argv[2]}, None)['body'])
+    print(f"{result['transactionCount']} transactions -> {result['output']} in {result['elapsedMs']} ms;"
+          f" {len(result['subscriptions'])} subscriptions,"
+          f" potential savings {result['potential_monthly_savings']:.0f}/month")
@@ -0,0 +1,201 @@
+"""
+Merchant Category Store - PFMS Hackathon MVP
+Remembers merchant -> category results across Lambda invocations
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Stamped on every stored entry; entries from other versions are stale.
+# The store only holds Comprehend results (the keyword rules are checked
+# before it), so rule edits leave it valid. Bump this when the way a
+# Comprehend response becomes a category changes.
+STORE_VERSION = '2'
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=10000, ttl=24 * 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryCategoryStore:
+    """Bounded in-process tier"""
+    name = 'memory'
+
+    def __init__(self, maxsize=10000, ttl=24 * 3600):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def get(self, key, version):
+        entry = self.cache.get(key)
+        if entry and entry[1] == version:
+            return entry[0]
+        return None
+
+    def set(self, key, category, version):
+        self.cache.set(key, (category, version))
+
+
+class SQLiteCategoryStore:
+    """On-disk tier in /tmp, survives as long as the Lambda container"""
+    name = 'sqlite'
+
+    def __init__(self, path='/tmp/pfms_merchant_categories.db', max_rows=100000):
+        self.max_rows = max_rows
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=OFF')  # it is only a cache
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS merchant_categories ('
+            'merchant TEXT PRIMARY KEY, category TEXT NOT NULL, '
+            'version TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def get(self, key, version):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT category FROM merchant_categories WHERE merchant = ? AND version = ?',
+                (key, version)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, category, version):
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO merchant_categories VALUES (?, ?, ?, ?)',
+                (key, category, version, time.time())
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._prune(version)
+
+    def _prune(self, version):
+        """Drop stale versions, then the oldest rows above max_rows"""
+        self.conn.execute('DELETE FROM merchant_categories WHERE version != ?', (version,))
+        self.conn.execute(
+            'DELETE FROM merchant_categories WHERE merchant IN ('
+            'SELECT merchant FROM merchant_categories ORDER BY updated '
+            'LIMIT max(0, (SELECT count(*) FROM merchant_categories) - ?))',
+            (self.max_rows,)
+        )
+
+
+class DynamoCategoryStore:
+    """Optional shared tier: a DynamoDB table keyed on merchant"""
+    name = 'dynamodb'
+
+    def __init__(self, table_name='MerchantCategories', dynamodb=None):
+        if dynamodb is None:
+            import aws_clients
+            dynamodb = aws_clients.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.warned = False
+
+    def get(self, key, version):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            item = self.table.get_item(Key={'merchant': key}).get('Item')
+        except (BotoCoreError, ClientError) as e:
+            self.warn(e)
+            return None
+        if item and item.get('storeVersion') == version:
+            return item['category']
+        return None
+
+    def set(self, key, category, version):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            self.table.put_item(Item={
+                'merchant': key,
+                'category': category,
+                'storeVersion': version
+            })
+        except (BotoCoreError, ClientError) as e:
+            self.warn(e)
+
+    def warn(self, error):
+        """Log the first failure; the other tiers keep answering meanwhile"""
+        if not self.warned:
+            self.warned = True
+            logger.warning('Merchant category table %s unavailable: %s', self.table.name, error)
+
+
+class MerchantCategoryStore:
+    """Looks merchants up tier by tier, fastest first, with hit/miss counters"""
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.hits = {tier.name: 0 for tier in tiers}
+        self.misses = 0
+
+    def get(self, key, version):
+        for i, tier in enumerate(self.tiers):
+            category = tier.get(key, version)
+            if category is not None:
+                self.hits[tier.name] += 1
+                # Promote into the faster tiers
+                for faster in self.tiers[:i]:
+                    faster.set(key, category, version)
+                return category
+        self.misses += 1
+        return None
+
+    def set(self, key, category, version):
+        for tier in self.tiers:
+            tier.set(key, category, version)
+
+    def stats(self):
+        return {'hits': dict(self.hits), 'misses': self.misses}
+
+
+_default_store = None
+
+
+def default_category_store():
+    """Process-wide store: memory + SQLite, plus DynamoDB when configured"""
+    global _default_store
+    if _default_store is None:
+        tiers = [MemoryCategoryStore()]
+        try:
+            tiers.append(SQLiteCategoryStore(
+                os.environ.get('MERCHANT_CATEGORY_DB', '/tmp/pfms_merchant_categories.db')))
+        except sqlite3.Error:
+            pass
+        table_name = os.environ.get('MERCHANT_CATEGORY_TABLE')
+        if table_name:
+            tiers.append(DynamoCategoryStore(table_name))
+        _default_store = MerchantCategoryStore(tiers)
+    return _default_store
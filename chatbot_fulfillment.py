@@ -4,13 +4,33 @@ Handles Amazon Lex chatbot queries
 """
 
 import json
-from datetime import datetime, timedelta
-import boto3
-
-dynamodb = boto3.resource('dynamodb')
-transactions_table = dynamodb.Table('Transactions')
-subscriptions_table = dynamodb.Table('Subscriptions')
-rewards_table = dynamodb.Table('Rewards')
+import os
+from datetime import date, timedelta
+import aws_clients
+from spending_rollups import REWARD_KEY, RollupStore, compute_rollups, read_all, spending_summary
+
+# Transactions GSI: userId (HASH) + date (RANGE, 'YYYY-MM-DD'). Tables
+# created before the index read the user's partition with a date filter
+TRANSACTIONS_BY_DATE = 'userId-date-index'
+
+# What the spending and investment intents read from each transaction
+SPENDING_ATTRIBUTES = ['date', 'amount', 'merchant', 'category', 'type']
+
+# Answer from SpendingRollups once they are backfilled
+# (python spending_rollups.py rebuild USER_ID) and fed by the stream
+# handler; until then, read the raw Transactions and Rewards
+USE_ROLLUPS = os.environ.get('SPENDING_ROLLUPS', '0') == '1'
+
+# Add the simulated range of outcomes to investment answers
+SIMULATE_RETURNS = os.environ.get('INVESTMENT_SIMULATION', '0') == '1'
+
+# Opened on first use, so each intent only pays for the tables it reads
+transactions_table = aws_clients.LazyTable('Transactions')
+subscriptions_table = aws_clients.LazyTable('Subscriptions')
+rewards_table = aws_clients.LazyTable('Rewards')
+rollups = None
+# Cleared the first time a query finds TRANSACTIONS_BY_DATE missing
+date_index = True
 
 def lambda_handler(event, context):
     """Amazon Lex fulfillment handler"""
@@ -36,22 +56,8 @@ def handle_spending_query(user_id, slots):
     time_period = slots.get('TimePeriod', 'today')
     category = slots.get('Category')
     
-    # Get transactions
-    response = transactions_table.query(
-        KeyConditionExpression='userId = :uid',
-        ExpressionAttributeValues={':uid': user_id}
-    )
-    transactions = response.get('Items', [])
-    
-    # Filter by time period
-    filtered_txns = filter_by_time_period(transactions, time_period)
-    
-    # Filter by category if specified
-    if category:
-        filtered_txns = [t for t in filtered_txns if t.get('category', '').lower() == category.lower()]
-    
-    # Calculate total
-    total = sum([t['amount'] for t in filtered_txns if t['type'] == 'expense'])
+    # Expenses and per-merchant amounts in the time period (and category)
+    total, top_merchants = spending_in(user_id, *period_range(time_period), category)
     
     # Build response
     if category:
@@ -60,12 +66,7 @@ def handle_spending_query(user_id, slots):
         message = f"You spent ₹{total:.2f} {time_period}."
     
     # Add breakdown
-    if len(filtered_txns) > 0:
-        top_merchants = {}
-        for t in filtered_txns:
-            merchant = t['merchant']
-            top_merchants[merchant] = top_merchants.get(merchant, 0) + t['amount']
-        
+    if top_merchants:
         top_3 = sorted(top_merchants.items(), key=lambda x: x[1], reverse=True)[:3]
         breakdown = ', '.join([f"{m}: ₹{a:.0f}" for m, a in top_3])
         message += f" Top expenses: {breakdown}."
@@ -115,50 +116,38 @@ def handle_investment_query(user_id, slots):
     savings_amount = slots.get('Amount')
     
     if not savings_amount:
-        # Calculate potential savings from wasteful expenses
-        response = transactions_table.query(
-            KeyConditionExpression='userId = :uid',
-            ExpressionAttributeValues={':uid': user_id}
-        )
-        transactions = response.get('Items', [])
+        # Calculate potential savings from the last 30 days of expenses
+        monthly_expenses, _ = spending_in(user_id, *period_range('last 30 days'))
         
         # Simple calculation: suggest 10% of monthly expenses
-        monthly_expenses = sum([t['amount'] for t in transactions if t['type'] == 'expense'])
-        savings_amount = monthly_expenses * 0.1
+        savings_amount = float(monthly_expenses) * 0.1
     else:
         savings_amount = float(savings_amount)
     
-    # Generate recommendations
-    recommendations = [
-        {
-            'name': 'Index Fund SIP',
-            'risk': 'Medium',
-            'return_12m': 10.7,
-            'projected': savings_amount * 12 * 1.107,
-            'points': int(savings_amount * 1.44)  # 12 months * 0.12
-        },
-        {
-            'name': 'Digital Gold',
-            'risk': 'Low',
-            'return_12m': 5.7,
-            'projected': savings_amount * 12 * 1.057,
-            'points': int(savings_amount * 1.2)
-        },
-        {
-            'name': 'High-Yield Savings',
-            'risk': 'No Risk',
-            'return_12m': 4.0,
-            'projected': savings_amount * 12 * 1.04,
-            'points': int(savings_amount * 1.0)
-        }
-    ]
+    # Generate recommendations, the same projections as the dashboard's
+    from investment_projections import engine_for
+    
+    engine = engine_for()
+    recommendations = engine.recommend(savings_amount)
+    if not recommendations:
+        return close_with_message(
+            f"Saving ₹{savings_amount:.0f} per month is a great start! "
+            f"Once you can set aside ₹{engine.min_investment.min():.0f} a month, "
+            "I can suggest where to invest it."
+        )
     
     best = recommendations[0]
+    year = best['projections']['12_months']
     
-    message = f"If you save ₹{savings_amount:.0f} per month, I recommend investing in {best['name']}. "
-    message += f"In 12 months, your ₹{savings_amount * 12:.0f} could grow to ₹{best['projected']:.0f} "
-    message += f"(~{best['return_12m']}% return). "
-    message += f"Plus, you'll earn {best['points']} reward points! "
+    message = f"If you save ₹{best['monthly_investment']:.0f} per month, I recommend investing in {best['option']}. "
+    message += f"In 12 months, your ₹{year['invested']:.0f} could grow to ₹{year['projected']:.0f} "
+    message += f"(~{best['annual_return_percent']}% a year). "
+    if SIMULATE_RETURNS:
+        outcome = next(row for row in engine.simulate(best['monthly_investment'])
+                       if row['option'] == best['option'])['projections']['12_months']
+        message += f"In 9 out of 10 simulated years you'd have at least ₹{outcome['p10']:.0f}, "
+        message += f"and in 1 out of 10 more than ₹{outcome['p90']:.0f}. "
+    message += f"Plus, you'll earn {best['reward_points']} reward points every month! "
     message += "Would you like to see other investment options?"
     
     return close_with_message(message)
@@ -167,14 +156,14 @@ def handle_investment_query(user_id, slots):
 def handle_reward_query(user_id, slots):
     """Handle reward points queries"""
     
-    # Get user rewards
-    response = rewards_table.query(
-        KeyConditionExpression='userId = :uid',
-        ExpressionAttributeValues={':uid': user_id}
-    )
-    rewards = response.get('Items', [])
+    # Get the user's reward totals
+    if USE_ROLLUPS:
+        summary = rollup_store().rewards(user_id)
+    else:
+        rewards = read_all(rewards_table, user_id)
+        summary = compute_rollups(rewards=rewards).get((user_id, REWARD_KEY), {})
     
-    total_points = sum([r['points'] for r in rewards])
+    total_points = summary.get('points', 0)
     
     # Determine tier
     if total_points >= 1500:
@@ -186,9 +175,9 @@ def handle_reward_query(user_id, slots):
     
     message = f"You have {total_points} reward points and you're in the {tier} tier! "
     
-    if rewards:
-        recent = sorted(rewards, key=lambda x: x['timestamp'], reverse=True)[0]
-        message += f"Your last reward: {recent['description']} (+{recent['points']} points). "
+    if summary.get('lastRewardAt'):
+        message += (f"Your last reward: {summary['lastRewardDescription']}"
+                    f" (+{summary['lastRewardPoints']} points). ")
     
     # Suggest next action
     if total_points < 500:
@@ -201,33 +190,95 @@ def handle_reward_query(user_id, slots):
     return close_with_message(message)
 
 
-def filter_by_time_period(transactions, time_period):
-    """Filter transactions by time period"""
-    today = datetime.now()
+def period_range(time_period, today=None):
+    """First and last day (ISO dates, inclusive) of a TimePeriod slot value"""
+    today = today or date.today()
+    end = today
     
     if time_period == 'today':
-        start_date = today.replace(hour=0, minute=0, second=0)
+        start = today
     elif time_period == 'yesterday':
-        start_date = (today - timedelta(days=1)).replace(hour=0, minute=0, second=0)
-        today = start_date + timedelta(days=1)
+        start = end = today - timedelta(days=1)
     elif time_period == 'this week' or time_period == 'week':
-        start_date = today - timedelta(days=7)
+        start = today - timedelta(days=6)
     elif time_period == 'this month' or time_period == 'month':
-        start_date = today.replace(day=1, hour=0, minute=0, second=0)
+        start = today.replace(day=1)
     elif time_period == 'last month':
-        last_month = today.replace(day=1) - timedelta(days=1)
-        start_date = last_month.replace(day=1, hour=0, minute=0, second=0)
-        today = today.replace(day=1, hour=0, minute=0, second=0)
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
     else:
-        start_date = today - timedelta(days=30)
+        start = today - timedelta(days=29)
     
-    filtered = []
-    for t in transactions:
-        txn_date = datetime.strptime(t['date'], '%Y-%m-%d')
-        if start_date <= txn_date <= today:
-            filtered.append(t)
+    return start.isoformat(), end.isoformat()
+
+
+def query_transactions(user_id, start, end, attributes=SPENDING_ATTRIBUTES):
+    """User's transactions dated start..end, read from the date index.
+    
+    Only the window is read, following LastEvaluatedKey past the 1 MB page
+    limit, and only attributes are returned. Without the index the whole
+    partition is read and filtered to the window instead.
+    """
+    global date_index
+    from boto3.dynamodb.conditions import Attr, Key
+    from botocore.exceptions import ClientError
+    
+    names = {f'#a{i}': name for i, name in enumerate(attributes)}
+    params = {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+    if date_index:
+        try:
+            return query_pages(dict(
+                params, IndexName=TRANSACTIONS_BY_DATE,
+                KeyConditionExpression=Key('userId').eq(user_id) & Key('date').between(start, end)))
+        except ClientError as e:
+            # DynamoDB answers ValidationException for an unknown index,
+            # moto ResourceNotFoundException; both name the index
+            error = e.response['Error']
+            if (error['Code'] not in ('ValidationException', 'ResourceNotFoundException')
+                    or 'index' not in error.get('Message', '').lower()):
+                raise
+            date_index = False
+    
+    return query_pages(dict(params, KeyConditionExpression=Key('userId').eq(user_id),
+                            FilterExpression=Attr('date').between(start, end)))
+
+
+def query_pages(params):
+    """Every item a Transactions query matches, following LastEvaluatedKey"""
+    transactions = []
+    while True:
+        response = transactions_table.query(**params)
+        transactions.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return transactions
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rollup_store():
+    global rollups
+    if rollups is None:
+        rollups = RollupStore()
+    return rollups
+
+
+def spending_in(user_id, start, end, category=None):
+    """(expense total, {merchant: amount}) for start..end, optionally in one category"""
+    if USE_ROLLUPS:
+        return spending_summary(rollup_store().window(user_id, start, end), category)
+    
+    transactions = query_transactions(user_id, start, end)
+    if category:
+        transactions = [t for t in transactions
+                        if (t.get('category') or '').lower() == category.lower()]
     
-    return filtered
+    total = sum([t['amount'] for t in transactions if t['type'] == 'expense'])
+    merchants = {}
+    for t in transactions:
+        merchants[t['merchant']] = merchants.get(t['merchant'], 0) + t['amount']
+    return total, merchants
 
 
 def close_with_message(message):
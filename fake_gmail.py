@@ -0,0 +1,237 @@
+"""
+Fake Gmail Service - PFMS Hackathon MVP
+In-memory stand-in for the Gmail API client, for local runs and benchmarks
+"""
+
+import base64
+import json
+import time
+from collections import Counter
+from email.utils import format_datetime
+from datetime import datetime, timedelta
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def make_message(msg_id, subject, body, sender='alerts@hdfcbank.net', date=None):
+    """Gmail API message resource (format='full') for a plain-text email"""
+    date = date or datetime(2024, 1, 1, 10, 0)
+    message = {
+        'id': msg_id,
+        'threadId': msg_id,
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'Date', 'value': format_datetime(date)}
+            ],
+            'body': {'data': base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')}
+        }
+    }
+    message['sizeEstimate'] = len(subject) + len(sender) + len(body) + 200
+    return message
+
+
+def sample_mailbox(count):
+    """count transaction emails, newest first like the Gmail API lists them"""
+    merchants = ['Swiggy', 'Zomato', 'Amazon', 'Uber', 'Netflix', 'Flipkart']
+    start = datetime(2024, 1, 1, 9, 30)
+    return [
+        make_message(
+            f'msg{n:08d}',
+            f'Transaction alert: Rs.{100 + n % 900}.00 debited at {merchants[n % len(merchants)]}',
+            f'Dear customer, Rs.{100 + n % 900}.00 was debited from your account via UPI '
+            f'at {merchants[n % len(merchants)]}.',
+            date=start + timedelta(hours=n)
+        )
+        for n in reversed(range(count))
+    ]
+
+
+def mixed_mailbox(count, noise_every=3):
+    """sample_mailbox where every noise_every-th email is a bulky promotional
+    mail that matches the search query but carries no transaction"""
+    messages = sample_mailbox(count)
+    html = '<html><body>' + '<p>Exclusive offers picked for you this week!</p>' * 1000 + '</body></html>'
+    for n in range(0, count, noise_every):
+        messages[n] = make_message(
+            messages[n]['id'],
+            'Exclusive payment offers picked for you',
+            html,
+            sender='Deals Weekly <newsletter@shopdeals-mail.com>'
+        )
+    return messages
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{"error": "fake"}')
+
+
+class FakeRequest:
+    def __init__(self, service, func):
+        self.service = service
+        self.func = func
+
+    def execute(self):
+        self.service.round_trip()
+        return self.func()
+
+
+class FakeBatch:
+    """Stands in for BatchHttpRequest: one round trip, per-call callbacks"""
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.requests))
+        if any(request_id == r[0] for r in self.requests):
+            # As BatchHttpRequest.add does
+            raise KeyError(f'A request with this ID already exists: {request_id}')
+        self.requests.append((request_id, request, callback))
+
+    def execute(self):
+        self.service.round_trip()
+        self.service.calls['batch'] += 1
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.func(), None
+            except HttpError as e:
+                response, exception = None, e
+            (callback or self.callback)(request_id, response, exception)
+
+
+class FakeGmailService:
+    """Serves messages from a list; every query matches every message.
+
+    History starts empty at historyId 1000; add_message() records a
+    messageAdded entry and expire_history() makes older ids answer 404.
+
+    latency is added to each HTTP round trip, and every rate_limit_every-th
+    messages.get answers 429 so retry paths get exercised. arrivals are
+    delivered one after each messages.list page, so later pages shift
+    and repeat ids like Gmail's do while mail comes in.
+    """
+
+    def __init__(self, messages, latency=0.0, rate_limit_every=0, arrivals=()):
+        self.mailbox = list(messages)
+        self.by_id = {m['id']: m for m in self.mailbox}
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.arrivals = list(arrivals)
+        self.calls = Counter()
+        self.history_records = []
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id
+
+    def round_trip(self):
+        self.calls['http'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_message(self, message):
+        """Deliver a new message: newest first in listings, recorded in history"""
+        self.mailbox.insert(0, message)
+        self.by_id[message['id']] = message
+        self.history_id += 1
+        self.history_records.append({
+            'id': str(self.history_id),
+            'messagesAdded': [{'message': {'id': message['id'], 'threadId': message['threadId'],
+                                           'labelIds': ['INBOX']}}]
+        })
+
+    def expire_history(self):
+        """Forget history records, like Gmail does after about a week"""
+        self.history_records.clear()
+        self.oldest_history_id = self.history_id
+
+    # users() resolves to the service itself
+    def users(self):
+        return self
+
+    def messages(self):
+        return FakeMessages(self)
+
+    def history(self):
+        return FakeHistory(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def getProfile(self, userId):
+        def run():
+            self.calls['profile'] += 1
+            return {'emailAddress': 'demo@pfms.com', 'historyId': str(self.history_id),
+                    'messagesTotal': len(self.mailbox)}
+        return FakeRequest(self, run)
+
+
+class FakeMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        service = self.service
+
+        def run():
+            service.calls['list'] += 1
+            start = int(pageToken or 0)
+            end = start + maxResults
+            page = {'messages': [{'id': m['id'], 'threadId': m['threadId']}
+                                 for m in service.mailbox[start:end]],
+                    'resultSizeEstimate': len(service.mailbox)}
+            if end < len(service.mailbox):
+                page['nextPageToken'] = str(end)
+            if service.arrivals:
+                service.add_message(service.arrivals.pop(0))
+            return page
+        return FakeRequest(service, run)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        service = self.service
+
+        def run():
+            service.calls['get'] += 1
+            if service.rate_limit_every and service.calls['get'] % service.rate_limit_every == 0:
+                raise http_error(429)
+            if id not in service.by_id:
+                raise http_error(404)
+            message = service.by_id[id]
+            if format == 'metadata':
+                headers = [h for h in message['payload']['headers']
+                           if not metadataHeaders or h['name'] in metadataHeaders]
+                message = {'id': message['id'], 'threadId': message['threadId'],
+                           'sizeEstimate': message['sizeEstimate'],
+                           'payload': {'mimeType': message['payload']['mimeType'],
+                                       'headers': headers}}
+            service.calls['bytes'] += len(json.dumps(message))
+            return message
+        return FakeRequest(service, run)
+
+
+class FakeHistory:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None,
+             maxResults=100, **kwargs):
+        service = self.service
+
+        def run():
+            service.calls['history'] += 1
+            if int(startHistoryId) < service.oldest_history_id:
+                raise http_error(404)
+            records = [h for h in service.history_records if int(h['id']) > int(startHistoryId)]
+            start = int(pageToken or 0)
+            end = start + maxResults
+            page = {'historyId': str(service.history_id)}
+            if records[start:end]:
+                page['history'] = records[start:end]
+            if end < len(records):
+                page['nextPageToken'] = str(end)
+            return page
+        return FakeRequest(service, run)
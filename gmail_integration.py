@@ -4,88 +4,689 @@ Fetches transaction emails and parses them
 """
 
 import os
+import hashlib
 import json
+import random
 import re
-from datetime import datetime
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import pickle
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from email.utils import parseaddr
+from functools import lru_cache
+from itertools import islice
+
+# The Google client libraries are imported where they are first needed, so
+# importing this module (e.g. for parsing) stays cheap
 
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+# One authorized-user JSON file per user (what Credentials.to_json writes)
+TOKEN_DIR = os.environ.get('GMAIL_TOKEN_DIR', 'tokens')
+DEFAULT_USER = 'default'
+
+# Single token the original authenticate() pickled for every user; the
+# first user without a JSON token takes it over (see FileTokenStore)
+LEGACY_TOKEN = os.environ.get('GMAIL_LEGACY_TOKEN', 'token.pickle')
+
+# Access tokens live an hour; refresh in the background once this close
+REFRESH_MARGIN = timedelta(minutes=10)
+
+TRANSACTION_QUERY = 'subject:(transaction OR payment OR debited OR credited OR receipt OR invoice)'
+
+# Gmail takes up to 100 calls per batch request but recommends 50
+BATCH_SIZE = 50
+LIST_PAGE_SIZE = 500
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 503}
+
+# Gmail allows 250 quota units per user per second and messages.get costs 5
+USER_CALLS_PER_SECOND = 50
+
+# Local version of TRANSACTION_QUERY for mail that arrives through history
+TRANSACTION_SUBJECT = re.compile(r'\b(transaction|payment|debited|credited|receipt|invoice)\b',
+                                 re.IGNORECASE)
+
+
+# Two-phase parsing: headers fetched first to decide which bodies to download
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+
+# Banks, wallets and merchants whose mail is almost always a transaction
+TRANSACTION_SENDER_DOMAINS = {
+    'hdfcbank.net', 'hdfcbank.com', 'icicibank.com', 'sbi.co.in', 'axisbank.com',
+    'kotak.com', 'yesbank.in', 'idfcfirstbank.com', 'paytm.com', 'phonepe.com',
+    'amazonpay.in', 'swiggy.in', 'zomato.com', 'uber.com', 'olacabs.com'
+}
+# Subjects that name a payment. A bare "payment" is left out: newsletters
+# use it to get past TRANSACTION_QUERY, and it matches every listed mail
+STRONG_SUBJECT = re.compile(r'\b(debited|credited|spent|transaction|txn|upi|receipt|invoice|'
+                            r'order|refund|paid)\b|\bpayment (of|to|for|received|successful)\b',
+                            re.IGNORECASE)
+SUBJECT_AMOUNT = re.compile(r'(₹|\bRs\.?|\bINR)\s*[0-9]', re.IGNORECASE)
+
+
+def sender_domain(sender):
+    """'HDFC Bank <alerts@hdfcbank.net>' -> 'hdfcbank.net'"""
+    address = parseaddr(sender)[1]
+    return address.rpartition('@')[2].lower()
+
+
+def is_transaction_candidate(subject, sender):
+    """Header-only guess whether a message is worth downloading in full"""
+    domain = sender_domain(sender)
+    if any(domain == d or domain.endswith('.' + d) for d in TRANSACTION_SENDER_DOMAINS):
+        return True
+    return bool(STRONG_SUBJECT.search(subject) or SUBJECT_AMOUNT.search(subject))
+
+
+# Alerts state the transaction up front; templates only look this far in
+TEMPLATE_WINDOW = 500
+
+# Amount as written in Indian bank alerts: 1,299.00
+AMOUNT = r'(?P<amount>[0-9][0-9,]*(?:\.[0-9]+)?)'
+
+
+def template(pattern, txn_type):
+    """Precompile a bank template; {amount} expands to the amount group.
+    
+    Templates are case-sensitive: alerts use fixed wording, and a literal
+    prefix lets the regex engine skip ahead instead of trying every offset.
+    """
+    return re.compile(pattern.replace('{amount}', AMOUNT)), txn_type
+
+
+HDFC_TEMPLATES = [
+    template(r'Rs\.?\s*{amount} has been debited from account \S+ to VPA \S+ '
+             r'(?P<merchant>[^\n]{1,40}?) on \d', 'expense'),
+    template(r'Credit Card ending \d+ for Rs\.?\s*{amount} at (?P<merchant>[^\n]{1,40}?) on \d',
+             'expense'),
+    template(r'Rs\.?\s*{amount} is successfully credited to your account \S+ by VPA \S+ '
+             r'(?P<merchant>[^\n]{1,40}?) on \d', 'income')
+]
+
+# Sender domain -> templates tried, in order, before the generic patterns
+BANK_TEMPLATES = {
+    'hdfcbank.net': HDFC_TEMPLATES,
+    'hdfcbank.com': HDFC_TEMPLATES,
+    'icicibank.com': [
+        template(r'used for a transaction of INR\s*{amount} on [^\n]{1,30}? '
+                 r'Info: (?P<merchant>[^.\n]{1,40})', 'expense'),
+        template(r'Acct \S+ debited for Rs\.?\s*{amount} on \S+; '
+                 r'(?P<merchant>[^;\n]{1,40}?) credited', 'expense'),
+        template(r'Acct \S+ (?:is )?credited with Rs\.?\s*{amount} on \S+ '
+                 r'(?:from|by) (?P<merchant>[^.;\n]{1,40})', 'income')
+    ],
+    'sbi.co.in': [
+        template(r'A/C \S+ has a debit by \w+ of Rs\.?\s*{amount} on \S+ '
+                 r'(?:transfer )?to (?P<merchant>[^.\n]{1,40}?)\.', 'expense'),
+        template(r'A/c \S+ is credited by Rs\.?\s*{amount} on \S+ '
+                 r'by (?P<merchant>[^.(\n]{1,40}?)\s*[.(]', 'income')
+    ],
+    'axisbank.com': [
+        template(r'INR\s*{amount} debited from A/c no\. \S+ on [^\n]{1,30}? '
+                 r'at UPI/\w+/\d+/(?P<merchant>[^./\n]{1,40}?)\.', 'expense'),
+        template(r'INR\s*{amount} credited to A/c no\. \S+', 'income')
+    ],
+    'kotak.com': [
+        template(r'Rs\.?\s*{amount} is debited from your Kotak Bank A/c \S+ '
+                 r'to VPA (?P<merchant>[\w.-]{1,40})@', 'expense'),
+        template(r'Rs\.?\s*{amount} is credited to your Kotak Bank A/c \S+', 'income')
+    ],
+    'paytm.com': [
+        template(r'You paid Rs\.?\s*{amount} to (?P<merchant>[^.\n]{1,40}?)\.', 'expense'),
+        template(r'You received Rs\.?\s*{amount} from (?P<merchant>[^.\n]{1,40}?)\.', 'income')
+    ],
+    'phonepe.com': [
+        template(r'Paid ₹\s*{amount} to (?P<merchant>[^.\n]{1,40}?)(?:\.|\s+Debited)', 'expense'),
+        template(r'Received ₹\s*{amount} from (?P<merchant>[^.\n]{1,40}?)\.', 'income')
+    ]
+}
+
+# Fallback for everyone else: (₹ or Rs or INR), then a bounded 'amount' match
+GENERIC_AMOUNT_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+    r'₹\s*([0-9][0-9,]*\.?[0-9]*)',
+    r'Rs\.?\s*([0-9][0-9,]*\.?[0-9]*)',
+    r'INR\s*([0-9][0-9,]*\.?[0-9]*)',
+    r'amount[^0-9\n]{0,40}([0-9][0-9,]*\.?[0-9]*)'
+]]
+
+# Common merchant names, checked before any other merchant heuristic
+KNOWN_MERCHANTS = [
+    'swiggy', 'zomato', 'amazon', 'flipkart', 'netflix', 'spotify',
+    'uber', 'ola', 'paytm', 'phonepe', 'gpay', 'myntra', 'ajio',
+    'bigbasket', 'dunzo', 'bookmyshow', 'makemytrip', 'airtel',
+    'jio', 'starbucks', 'mcdonald', 'domino', 'kfc'
+]
+
+
+@lru_cache(maxsize=1024)
+def templates_for(sender):
+    """Templates registered for the sender's domain or a parent domain"""
+    domain = sender_domain(sender)
+    while domain:
+        if domain in BANK_TEMPLATES:
+            return BANK_TEMPLATES[domain]
+        domain = domain.partition('.')[2]
+    return []
+
+
+def find_template(sender, text):
+    """First bank template for the sender that matches near the start of text.
+    
+    Returns (match, transaction type) or (None, None).
+    """
+    for pattern, txn_type in templates_for(sender):
+        match = pattern.search(text, 0, TEMPLATE_WINDOW)
+        if match:
+            return match, txn_type
+    return None, None
+
+
+def parse_amount(text):
+    return float(text.replace(',', ''))
+
+
+def is_retryable(error):
+    """Rate limited (429) or a transient server error"""
+    from googleapiclient.errors import HttpError
+    return isinstance(error, HttpError) and error.resp.status in RETRY_STATUSES
+
+
+def is_not_found(error):
+    from googleapiclient.errors import HttpError
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
+def get_header(headers, name):
+    return next((h['value'] for h in headers if h['name'] == name), '')
+
+
+class FileTokenStore:
+    """Per-user OAuth credentials as JSON files in a directory.
+    
+    Deployments from before per-user tokens have one token.pickle that
+    every user shared. The first user loaded without a JSON file of their
+    own takes it over: it is re-saved as their JSON token and deleted, so
+    it migrates exactly once.
+    """
+    
+    def __init__(self, directory=TOKEN_DIR, legacy_path=LEGACY_TOKEN):
+        self.directory = directory
+        self.legacy_path = legacy_path
+    
+    def path(self, user_id):
+        return os.path.join(self.directory, re.sub(r'[^\w.@-]', '_', user_id) + '.json')
+    
+    def load(self, user_id):
+        try:
+            with open(self.path(user_id)) as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            return self.migrate_legacy(user_id)
+        from google.oauth2.credentials import Credentials
+        return Credentials.from_authorized_user_info(info, SCOPES)
+    
+    def migrate_legacy(self, user_id):
+        """Move the legacy pickle to user_id's JSON token, or None if there is none"""
+        if not self.legacy_path:
+            return None
+        # The rename is atomic, so only one caller claims the pickle
+        claimed = f'{self.legacy_path}.{threading.get_ident()}.migrating'
+        try:
+            os.rename(self.legacy_path, claimed)
+        except FileNotFoundError:
+            return None
+        import pickle
+        with open(claimed, 'rb') as f:
+            creds = pickle.load(f)
+        self.save(user_id, creds)
+        os.remove(claimed)
+        return creds
+    
+    def save(self, user_id, creds):
+        """Write atomically and readable by the owner only"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(user_id)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(creds.to_json())
+        os.replace(tmp, path)
+
+
+def utcnow():
+    """Naive UTC now, the convention google-auth uses for expiry"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CredentialCache:
+    """Per-user credentials kept in memory for the life of the process.
+    
+    get() returns cached credentials without disk or network access while
+    they are good for more than margin. Within the margin they are still
+    returned at once and refreshed on a background thread; only credentials
+    that are already expired are refreshed inline.
+    """
+    
+    def __init__(self, store=None, margin=REFRESH_MARGIN):
+        self.store = store or FileTokenStore()
+        self.margin = margin
+        self.credentials = {}
+        self.refreshing = set()
+        self.locks = {}
+        self.lock = threading.Lock()
+    
+    def get(self, user_id):
+        """Usable credentials for user_id, or None if they have never authorized"""
+        creds = self.credentials.get(user_id)
+        if creds is None:
+            creds = self.store.load(user_id)
+            if creds is None:
+                return None
+            self.credentials[user_id] = creds
+        
+        if not creds.valid:
+            if not creds.refresh_token:
+                return None
+            self.refresh(user_id, creds)
+        elif self.expiring(creds):
+            self.refresh_in_background(user_id, creds)
+        return creds
+    
+    def put(self, user_id, creds):
+        """Cache and persist newly authorized credentials"""
+        self.credentials[user_id] = creds
+        self.store.save(user_id, creds)
+    
+    def expiring(self, creds):
+        return creds.expiry is not None and creds.expiry - self.margin <= utcnow()
+    
+    def lock_for(self, user_id):
+        with self.lock:
+            return self.locks.setdefault(user_id, threading.Lock())
+    
+    def refresh(self, user_id, creds):
+        with self.lock_for(user_id):
+            # Another thread may have refreshed while we waited for the lock
+            if creds.valid and not self.expiring(creds):
+                return
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+            self.store.save(user_id, creds)
+    
+    def refresh_in_background(self, user_id, creds):
+        with self.lock:
+            if user_id in self.refreshing:
+                return
+            self.refreshing.add(user_id)
+        
+        def run():
+            try:
+                self.refresh(user_id, creds)
+            except Exception:
+                pass  # get() refreshes inline once the token has expired
+            finally:
+                with self.lock:
+                    self.refreshing.discard(user_id)
+        
+        threading.Thread(target=run, name=f'refresh-{user_id}', daemon=True).start()
+
+
+# Process-wide, so warm Lambda invocations skip authentication entirely
+CREDENTIALS = CredentialCache()
+_services = {}
+
+
+@lru_cache(maxsize=1)
+def gmail_discovery():
+    """Gmail discovery document bundled with the client library, parsed once"""
+    from googleapiclient.discovery_cache import get_static_doc
+    return json.loads(get_static_doc('gmail', 'v1'))
+
+
+def gmail_service(user_id, creds):
+    """Gmail API client for user_id, reused while its credentials are.
+    
+    Refreshing updates the credentials object in place, so a cached client
+    stays authorized.
+    """
+    cached = _services.get(user_id)
+    if cached and cached[0] is creds:
+        return cached[1]
+    from googleapiclient.discovery import build_from_document
+    service = build_from_document(gmail_discovery(), credentials=creds)
+    _services[user_id] = (creds, service)
+    return service
+
+
+class RateBudget:
+    """Token bucket of API calls per second for one user.
+    
+    acquire(cost) reserves cost calls and sleeps until the bucket has
+    refilled enough to cover them; waited is the total time slept.
+    """
+    
+    def __init__(self, rate=USER_CALLS_PER_SECOND, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self, cost=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(cost, self.capacity)
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+
+class SyncStateStore:
+    """Last synced Gmail historyId per user, kept in DynamoDB.
+    
+    Until the GmailSyncState table is created every user has no
+    checkpoint, so each sync is a full sync and nothing is saved.
+    """
+    
+    def __init__(self, table_name='GmailSyncState', dynamodb=None):
+        if dynamodb is None:
+            import aws_clients
+            dynamodb = aws_clients.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.missing = self.table.meta.client.exceptions.ResourceNotFoundException
+    
+    def get(self, user_id):
+        try:
+            item = self.table.get_item(Key={'userId': user_id}).get('Item')
+        except self.missing:
+            return None
+        return item.get('historyId') if item else None
+    
+    def set(self, user_id, history_id):
+        try:
+            self.table.put_item(Item={
+                'userId': user_id,
+                'historyId': history_id,
+                'syncedAt': datetime.now().isoformat()
+            })
+        except self.missing:
+            pass
+
+
+class MemorySyncStateStore(dict):
+    """In-process SyncStateStore for local runs"""
+    
+    def set(self, user_id, history_id):
+        self[user_id] = history_id
+
+
 class GmailTransactionFetcher:
-    def __init__(self):
-        self.service = None
-        
-    def authenticate(self):
-        """OAuth2 authentication for Gmail"""
-        creds = None
-        
-        # Load saved credentials
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-        
-        # Refresh or get new credentials
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Save credentials
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-        
-        self.service = build('gmail', 'v1', credentials=creds)
+    def __init__(self, service=None, retry_delay=1.0, two_phase=False, budget=None):
+        self.service = service
+        self.retry_delay = retry_delay
+        self.two_phase = two_phase
+        self.budget = budget
+        self.stats = Counter()
+        
+    def authenticate(self, user_id=None, credentials=None, interactive=True):
+        """OAuth2 authentication for Gmail.
+        
+        Credentials and the API client are cached per user for the life of
+        the process (see CredentialCache), so warm invocations return
+        without touching disk or network. Without a browser to run the
+        consent flow in (interactive=False), unknown users raise.
+        """
+        user_id = user_id or DEFAULT_USER
+        credentials = credentials or CREDENTIALS
+        creds = credentials.get(user_id)
+        
+        # First authorization for this user
+        if creds is None:
+            if not interactive:
+                raise PermissionError(f'No Gmail authorization for {user_id}')
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(
+                'credentials.json', SCOPES)
+            creds = flow.run_local_server(port=0)
+            credentials.put(user_id, creds)
+        
+        self.service = gmail_service(user_id, creds)
         return True
     
     def fetch_transaction_emails(self, max_results=50):
         """Fetch transaction-related emails"""
-        query = 'subject:(transaction OR payment OR debited OR credited OR receipt OR invoice)'
-        
-        results = self.service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=max_results
-        ).execute()
+        return list(self.iter_transactions(max_results=max_results))
+    
+    def iter_transactions(self, query=TRANSACTION_QUERY, max_results=None):
+        """Yield parsed transactions, fetching messages in batches.
+        
+        Ids are consumed page by page, so memory stays flat however many
+        messages match.
+        """
+        ids = self.iter_message_ids(query, max_results)
+        while True:
+            chunk = list(islice(ids, BATCH_SIZE))
+            if not chunk:
+                break
+            for msg in self.get_transaction_messages(chunk):
+                transaction = self.parse_message(msg)
+                if transaction:
+                    yield transaction
+    
+    def iter_message_ids(self, query, max_results=None):
+        """Message ids matching query, following nextPageToken; each id
+        once, although list pages can repeat one while the mailbox changes"""
+        page_token = None
+        remaining = max_results
+        seen = set()
+        while remaining is None or remaining > 0:
+            page_size = LIST_PAGE_SIZE if remaining is None else min(remaining, LIST_PAGE_SIZE)
+            results = self.execute(self.service.users().messages().list(
+                userId='me',
+                q=query,
+                maxResults=page_size,
+                pageToken=page_token
+            ))
+            
+            messages = results.get('messages', [])
+            for msg in messages:
+                if msg['id'] in seen:
+                    continue
+                seen.add(msg['id'])
+                yield msg['id']
+                if remaining is not None:
+                    remaining -= 1
+                    if not remaining:
+                        return
+            
+            page_token = results.get('nextPageToken')
+            if not page_token or not messages:
+                break
+    
+    def get_transaction_messages(self, msg_ids, match_subject=False):
+        """Full messages worth parsing among msg_ids.
+        
+        In two-phase mode only the Subject/From/Date headers are fetched
+        first, and bodies are downloaded for likely transactions only;
+        stats['bytesSavedEstimate'] is Gmail's sizeEstimate of the skipped
+        messages minus the size of the metadata responses, not bytes
+        measured on the wire.
+        """
+        if not self.two_phase:
+            return self.get_messages(msg_ids)
+        
+        candidates = []
+        for msg in self.get_messages(msg_ids, format='metadata',
+                                     metadataHeaders=METADATA_HEADERS):
+            headers = msg['payload'].get('headers', [])
+            subject = get_header(headers, 'Subject')
+            self.stats['bytesSavedEstimate'] -= len(json.dumps(msg))
+            if match_subject and not TRANSACTION_SUBJECT.search(subject):
+                wanted = False
+            else:
+                wanted = is_transaction_candidate(subject, get_header(headers, 'From'))
+            if wanted:
+                candidates.append(msg['id'])
+            else:
+                self.stats['skipped'] += 1
+                self.stats['bytesSavedEstimate'] += msg.get('sizeEstimate', 0)
         
-        messages = results.get('messages', [])
-        transactions = []
+        self.stats['fullFetched'] += len(candidates)
+        return self.get_messages(candidates) if candidates else []
+    
+    def get_messages(self, msg_ids, format='full', **params):
+        """Fetch messages in one batch request, retrying the rate-limited ones.
+        
+        Ids are de-duplicated first: a batch rejects a repeated request_id.
+        """
+        msg_ids = list(dict.fromkeys(msg_ids))
+        results = {}
+        pending = list(msg_ids)
+        for attempt in range(MAX_RETRIES + 1):
+            retry = []
+            errors = []
+            
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                elif is_not_found(exception):
+                    pass  # deleted since it was listed
+                elif is_retryable(exception) and attempt < MAX_RETRIES:
+                    retry.append(request_id)
+                else:
+                    errors.append(exception)
+            
+            batch = self.service.new_batch_http_request(callback=callback)
+            for msg_id in pending:
+                batch.add(self.service.users().messages().get(
+                    userId='me',
+                    id=msg_id,
+                    format=format,
+                    **params
+                ), request_id=msg_id)
+            self.execute(batch, cost=len(pending))
+            
+            if errors:
+                raise errors[0]
+            if not retry:
+                break
+            pending = retry
+            self.backoff(attempt)
         
-        for msg in messages:
-            transaction = self.parse_email(msg['id'])
-            if transaction:
-                transactions.append(transaction)
+        self.stats['messages'] += len(results)
+        return [results[msg_id] for msg_id in msg_ids if msg_id in results]
+    
+    def sync(self, history_id=None, max_results=50):
+        """Sync new transactions since a historyId checkpoint.
+        
+        Falls back to a full sync of the newest max_results messages when
+        there is no checkpoint or Gmail has expired the history (404).
+        Returns (transactions, mode, new historyId); save the new checkpoint
+        once the transactions are stored.
+        """
+        if history_id:
+            try:
+                transactions, history_id = self.fetch_since(history_id)
+                return transactions, 'incremental', history_id
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+        
+        # Take the checkpoint first so mail arriving during the sync is not skipped
+        history_id = self.execute(self.service.users().getProfile(userId='me'))['historyId']
+        transactions = self.fetch_transaction_emails(max_results=max_results)
+        return transactions, 'full', history_id
+    
+    def fetch_since(self, start_history_id):
+        """Transactions from messages added after start_history_id.
+        
+        Returns (transactions, latest historyId); raises HttpError 404 when
+        start_history_id is too old.
+        """
+        msg_ids = {}
+        page_token = None
+        while True:
+            results = self.execute(self.service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token
+            ))
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    msg_ids[added['message']['id']] = True
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
         
-        return transactions
+        transactions = []
+        msg_ids = list(msg_ids)
+        for start in range(0, len(msg_ids), BATCH_SIZE):
+            chunk = msg_ids[start:start + BATCH_SIZE]
+            for msg in self.get_transaction_messages(chunk, match_subject=True):
+                # history is not filtered by the search query, do it here
+                subject = get_header(msg['payload'].get('headers', []), 'Subject')
+                if not TRANSACTION_SUBJECT.search(subject):
+                    continue
+                transaction = self.parse_message(msg)
+                if transaction:
+                    transactions.append(transaction)
+        
+        return transactions, results['historyId']
+    
+    def execute(self, request, cost=1):
+        """Execute an API request, backing off on 429 and transient errors.
+        
+        cost is the number of API calls the request makes (a batch makes
+        one per message), charged to the rate budget if there is one.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            if self.budget:
+                self.budget.acquire(cost)
+            try:
+                return request.execute()
+            except Exception as e:
+                if not is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                self.backoff(attempt)
+    
+    def backoff(self, attempt):
+        """Exponential backoff with jitter"""
+        time.sleep(self.retry_delay * (2 ** attempt) * (0.5 + random.random() / 2))
     
     def parse_email(self, msg_id):
         """Parse email to extract transaction details"""
-        msg = self.service.users().messages().get(
+        msg = self.execute(self.service.users().messages().get(
             userId='me',
             id=msg_id,
             format='full'
-        ).execute()
-        
+        ))
+        return self.parse_message(msg)
+    
+    def parse_message(self, msg):
+        """Parse a fetched message into a transaction"""
         # Get email body
         payload = msg['payload']
         headers = payload.get('headers', [])
         
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-        date_str = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
+        subject = get_header(headers, 'Subject')
+        date_str = get_header(headers, 'Date')
+        sender = get_header(headers, 'From')
         
         # Get body text
         body = self.get_email_body(payload)
         
         # Extract transaction details
         transaction = self.extract_transaction_data(subject, body, date_str, sender)
+        if transaction:
+            transaction['messageId'] = msg['id']
         
         return transaction
     
@@ -106,26 +707,12 @@ class GmailTransactionFetcher:
     def extract_transaction_data(self, subject, body, date_str, sender):
         """Extract amount, merchant, payment method from email"""
         
-        # Extract amount (₹ or Rs or INR)
-        amount_patterns = [
-            r'₹\s*([0-9,]+\.?[0-9]*)',
-            r'Rs\.?\s*([0-9,]+\.?[0-9]*)',
-            r'INR\s*([0-9,]+\.?[0-9]*)',
-            r'amount.*?([0-9,]+\.?[0-9]*)'
-        ]
-        
-        amount = None
-        for pattern in amount_patterns:
-            match = re.search(pattern, body + ' ' + subject, re.IGNORECASE)
-            if match:
-                amount = float(match.group(1).replace(',', ''))
-                break
-        
+        amount, txn_type, merchant_hint = self.extract_amount(subject, body, sender)
         if not amount:
             return None
         
         # Extract merchant
-        merchant = self.extract_merchant(subject, body, sender)
+        merchant = self.extract_merchant(subject, body, sender, merchant_hint)
         
         # Extract payment method
         payment_method = self.extract_payment_method(body)
@@ -137,10 +724,11 @@ class GmailTransactionFetcher:
         except:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        # Detect transaction type
-        txn_type = 'expense'
-        if any(word in (subject + body).lower() for word in ['credited', 'received', 'salary', 'refund']):
-            txn_type = 'income'
+        # Detect transaction type, unless the template already knows it
+        if txn_type is None:
+            txn_type = 'expense'
+            if any(word in (subject + body).lower() for word in ['credited', 'received', 'salary', 'refund']):
+                txn_type = 'income'
         
         return {
             'date': date,
@@ -152,19 +740,37 @@ class GmailTransactionFetcher:
             'rawSubject': subject
         }
     
-    def extract_merchant(self, subject, body, sender):
+    def extract_amount(self, subject, body, sender):
+        """Amount (₹ or Rs or INR) with the type and payee a bank template knows.
+        
+        Returns (amount, type, merchant); type and merchant are None unless a
+        template for the sender's domain matched.
+        """
+        text = body + ' ' + subject
+        
+        # Bank/wallet template for the sender first, generic patterns after
+        match, txn_type = find_template(sender, text)
+        if match:
+            return parse_amount(match.group('amount')), txn_type, match.groupdict().get('merchant')
+        
+        for pattern in GENERIC_AMOUNT_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                return parse_amount(match.group(1)), None, None
+        return None, None, None
+    
+    def extract_merchant(self, subject, body, sender, hint=None):
         """Extract merchant name"""
-        # Common merchant patterns
-        merchants = [
-            'swiggy', 'zomato', 'amazon', 'flipkart', 'netflix', 'spotify',
-            'uber', 'ola', 'paytm', 'phonepe', 'gpay', 'myntra', 'ajio',
-            'bigbasket', 'dunzo', 'bookmyshow', 'makemytrip', 'airtel',
-            'jio', 'starbucks', 'mcdonald', 'domino', 'kfc'
-        ]
+        # Payee captured by a bank template
+        if hint:
+            hint = hint.strip()
+            known = next((m for m in KNOWN_MERCHANTS if m in hint.lower()), None)
+            return known.capitalize() if known else hint.title()
         
         text = (subject + ' ' + body + ' ' + sender).lower()
         
-        for merchant in merchants:
+        # Common merchant patterns
+        for merchant in KNOWN_MERCHANTS:
             if merchant in text:
                 return merchant.capitalize()
         
@@ -199,6 +805,57 @@ class GmailTransactionFetcher:
             return 'Unknown'
 
 
+def transaction_id(txn):
+    """Deterministic id, so re-syncing the same email upserts the same row.
+    
+    Gmail transactions hash their message id; anything else hashes its
+    content.
+    """
+    if txn.get('messageId'):
+        basis = f"gmail:{txn['messageId']}"
+    else:
+        basis = json.dumps([txn.get('date'), txn.get('amount'), txn.get('merchant'),
+                            txn.get('rawSubject')])
+    return 'txn_' + hashlib.sha256(basis.encode('utf-8')).hexdigest()[:24]
+
+
+def to_dynamo(value):
+    """Copy of value with floats as Decimal, which is what DynamoDB accepts"""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_dynamo(v) for v in value]
+    return value
+
+
+def save_transactions(table, user_id, transactions):
+    """Upsert transactions in batches.
+    
+    batch_writer sends BatchWriteItem requests of 25 items and re-sends
+    unprocessed items; duplicate ids within a sync collapse into one put.
+    """
+    with table.batch_writer(overwrite_by_pkeys=['userId', 'transactionId']) as batch:
+        for txn in transactions:
+            txn['userId'] = user_id
+            txn['transactionId'] = transaction_id(txn)
+            batch.put_item(Item=to_dynamo(txn))
+    return len(transactions)
+
+
+def sync_user(fetcher, user_id, sync_state, table, mode=None, max_results=50):
+    """Sync one user's new transactions into table and move their checkpoint.
+    
+    mode='full' ignores the saved checkpoint. Returns (transactions, sync mode).
+    """
+    checkpoint = None if mode == 'full' else sync_state.get(user_id)
+    transactions, mode, history_id = fetcher.sync(checkpoint, max_results=max_results)
+    save_transactions(table, user_id, transactions)
+    sync_state.set(user_id, history_id)
+    return transactions, mode
+
+
 # Lambda handler for AWS
 def lambda_handler(event, context):
     """AWS Lambda function to fetch Gmail transactions"""
@@ -206,29 +863,24 @@ def lambda_handler(event, context):
     user_id = event.get('userId')
     
     # Initialize Gmail fetcher
-    fetcher = GmailTransactionFetcher()
+    fetcher = GmailTransactionFetcher(two_phase=event.get('twoPhase', False))
     
     try:
         # Authenticate
-        fetcher.authenticate()
+        fetcher.authenticate(user_id, interactive=False)
         
-        # Fetch transactions
-        transactions = fetcher.fetch_transaction_emails(max_results=50)
-        
-        # Store in DynamoDB
-        import boto3
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table('Transactions')
-        
-        for txn in transactions:
-            txn['userId'] = user_id
-            txn['transactionId'] = f"txn_{datetime.now().timestamp()}"
-            table.put_item(Item=txn)
+        # Fetch transactions added since the last sync (full sync on first run)
+        # and store them in DynamoDB
+        import aws_clients
+        transactions, mode = sync_user(fetcher, user_id, SyncStateStore(),
+                                       aws_clients.table('Transactions'), event.get('mode'))
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': f'Fetched {len(transactions)} transactions',
+                'syncMode': mode,
+                'bytesSavedEstimate': fetcher.stats['bytesSavedEstimate'],
                 'transactions': transactions
             })
         }
@@ -0,0 +1,100 @@
+"""
+Import Budget - PFMS Hackathon MVP
+Cold-start import time per Lambda module, measured with python -X importtime
+and checked against the budgets in import_budgets.json
+
+Usage: python import_budget.py [--record] [--top N] [module ...]
+tests/test_import_budget.py runs the same check (skip with SKIP_IMPORT_BUDGET=1)
+"""
+
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budgets.json')
+
+# Fresh interpreters per module; the median keeps one slow run from failing the check
+RUNS = 5
+
+# --record sets budgets this far above the measured median, enough for a
+# machine that is also running the benchmarks or tests
+HEADROOM = 3.0
+MIN_BUDGET_MS = 15
+
+
+def import_times(module):
+    """{imported module: (self ms, cumulative ms)} for one cold import of module"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(BUDGET_FILE), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr}')
+
+    # Children are listed before their parent; a top-level line closes a
+    # tree, so interpreter startup imports (site, ...) are dropped here
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        if name.strip() == module:
+            return times
+        if not name.startswith('  '):
+            times = {}
+    raise RuntimeError(f'{module} missing from -X importtime output')
+
+
+def measure(module, runs=RUNS):
+    """Median cumulative import time of module in ms, and the last run's breakdown"""
+    samples = []
+    for _ in range(runs):
+        times = import_times(module)
+        samples.append(times[module][1])
+    return statistics.median(samples), times
+
+
+def load_budgets():
+    with open(BUDGET_FILE) as f:
+        return json.load(f)
+
+
+def main(argv):
+    record = '--record' in argv
+    top = 0
+    if '--top' in argv:
+        top = int(argv[argv.index('--top') + 1])
+        del argv[argv.index('--top'):argv.index('--top') + 2]
+    budgets = load_budgets()
+    modules = [a for a in argv if not a.startswith('--')] or list(budgets)
+
+    over = []
+    for module in modules:
+        median, times = measure(module)
+        budget = budgets.get(module)
+        if record:
+            budget = budgets[module] = max(MIN_BUDGET_MS, math.ceil(median * HEADROOM))
+        status = 'ok' if budget is not None and median <= budget else 'OVER'
+        if status == 'OVER':
+            over.append(module)
+        print(f"  {module:<24} {median:8.1f} ms  budget {budget if budget is not None else '-':>5} ms  {status}")
+
+        if top:
+            heaviest = sorted(((c, s, n) for n, (s, c) in times.items() if n != module),
+                              reverse=True)[:top]
+            for cumulative, self_ms, name in heaviest:
+                print(f"      {cumulative:8.1f} ms  (self {self_ms:.1f})  {name}")
+
+    if record:
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budgets, f, indent=2)
+            f.write('\n')
+    return 1 if over and not record else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,244 @@
+"""
+Investment Projections - PFMS Hackathon MVP
+What a monthly SIP grows to per investment option and horizon, computed
+with NumPy for any number of savings amounts at once, and simulated
+percentile outcomes
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# return_12m is the option's expected annual return; volatility (annual
+# standard deviation) and distribution drive simulate().
+INVESTMENT_OPTIONS = {
+    'gold_digital': {
+        'name': 'Digital Gold',
+        'risk': 'Low',
+        'return_12m': 0.057,
+        'volatility': 0.14,
+        'distribution': 'lognormal',
+        'min_investment': 100
+    },
+    'index_fund': {
+        'name': 'Index Fund SIP',
+        'risk': 'Medium',
+        'return_12m': 0.107,
+        'volatility': 0.16,
+        'distribution': 'student_t',
+        'min_investment': 500
+    },
+    'high_yield_savings': {
+        'name': 'High-Yield Savings',
+        'risk': 'No Risk',
+        'return_12m': 0.04,
+        'volatility': 0.0,
+        'distribution': 'normal',
+        'min_investment': 1000
+    },
+    'debt_fund': {
+        'name': 'Debt Mutual Fund',
+        'risk': 'Low',
+        'return_12m': 0.065,
+        'volatility': 0.03,
+        'distribution': 'normal',
+        'min_investment': 1000
+    }
+}
+
+# Months the recommendations project over
+HORIZONS = (6, 12)
+
+# Reward points per rupee invested each month
+POINTS_RATE = 0.12
+
+# simulate() defaults: return paths per option, and a fixed seed so the
+# same question gets the same answer
+SIMULATION_PATHS = int(os.environ.get('SIMULATION_PATHS', 10000))
+SIMULATION_SEED = int(os.environ.get('SIMULATION_SEED', 42))
+PERCENTILES = (10, 50, 90)
+
+# Monthly return distributions, each with the option's mean and volatility:
+#   normal      r ~ N(mean, sd)
+#   lognormal   log(1 + r) normal, so returns never go below -100%
+#   student_t   fat-tailed t with df degrees of freedom (default 5)
+DISTRIBUTIONS = ('normal', 'lognormal', 'student_t')
+
+
+def options_version(options):
+    """Short fingerprint of an option table; memoized results are per version"""
+    payload = json.dumps(options, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def sip_factors(annual_returns, months):
+    """Value of investing 1 at the start of each month, after each horizon.
+
+    annual_returns (O,) compound monthly at (1 + r) ** (1/12) - 1, so 12
+    months of a lump sum earn exactly r; months (H,). Returns (O, H).
+    """
+    monthly = (1 + np.asarray(annual_returns, dtype=np.float64)) ** (1 / 12) - 1
+    n = np.asarray(months, dtype=np.float64)
+    growth = (1 + monthly[:, None]) ** n[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = np.where(monthly[:, None] > 0,
+                           (growth - 1) / monthly[:, None] * (1 + monthly[:, None]),
+                           n[None, :])
+    return factors
+
+
+def monthly_returns(rng, model, paths, months):
+    """(paths, months) monthly returns for one option's return model"""
+    mean = (1 + model['return_12m']) ** (1 / 12) - 1
+    sd = model.get('volatility', 0.0) / 12 ** 0.5
+    distribution = model.get('distribution', 'normal')
+    if sd == 0:
+        return np.full((paths, months), mean)
+    if distribution == 'lognormal':
+        # Match the arithmetic mean and sd of 1 + r
+        sigma2 = np.log1p((sd / (1 + mean)) ** 2)
+        mu = np.log1p(mean) - sigma2 / 2
+        return np.expm1(mu + np.sqrt(sigma2) * rng.standard_normal((paths, months)))
+    if distribution == 'student_t':
+        df = model.get('df', 5)
+        if df <= 2:
+            raise ValueError('student_t needs df > 2 for a finite volatility')
+        scale = sd * np.sqrt((df - 2) / df)
+        return mean + scale * rng.standard_t(df, (paths, months))
+    if distribution == 'normal':
+        return mean + sd * rng.standard_normal((paths, months))
+    raise ValueError(f'Unknown return distribution: {distribution}')
+
+
+class ProjectionEngine:
+    """SIP projections for one option table and set of horizons.
+
+    project() takes any array of monthly amounts and returns every
+    amount x option x horizon in a few array operations;
+    recommend() formats one amount's projections for the API from the
+    per-rupee values, worked out once per engine.
+    """
+
+    def __init__(self, options=INVESTMENT_OPTIONS, horizons=HORIZONS):
+        self.options = options
+        self.keys = list(options)
+        self.horizons = tuple(horizons)
+        self.version = options_version(options)
+        self.annual = np.array([options[k]['return_12m'] for k in self.keys], dtype=np.float64)
+        self.min_investment = np.array([options[k]['min_investment'] for k in self.keys],
+                                       dtype=np.float64)
+        self.factors = sip_factors(self.annual, self.horizons)
+        # Options best max-horizon gain first; the order holds for any amount
+        last = self.horizons.index(max(self.horizons))
+        gain = self.factors[:, last] - self.horizons[last]
+        self.ranked = [(self.keys[o], self.factors[o].tolist())
+                       for o in sorted(range(len(self.keys)), key=lambda o: -gain[o])]
+        # simulate_unit() results per (paths, seed, models), on this engine
+        self.cached_unit = lru_cache(maxsize=64)(self.frozen_unit)
+
+    def project(self, amounts):
+        """(invested (A, H), projected (A, O, H), eligible (A, O)) for amounts (A,)"""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        invested = amounts[:, None] * np.asarray(self.horizons, dtype=np.float64)[None, :]
+        projected = amounts[:, None, None] * self.factors[None, :, :]
+        eligible = amounts[:, None] >= self.min_investment[None, :]
+        return invested, projected, eligible
+
+    def recommend(self, monthly_savings):
+        """Eligible options for one monthly amount, best 12-month gain first.
+
+        Built from the per-rupee values with plain float arithmetic; a
+        NumPy round trip through project() costs more than it saves for
+        one amount.
+        """
+        amount = float(monthly_savings)
+        return [self.row(key, amount, [amount * months for months in self.horizons],
+                         [amount * factor for factor in factors])
+                for key, factors in self.ranked
+                if amount >= self.options[key]['min_investment']]
+
+    def row(self, key, amount, invested, projected):
+        """One option's recommendation from its invested and projected values per horizon"""
+        option = self.options[key]
+        projections = {}
+        for months, spent, value in zip(self.horizons, invested, projected):
+            projections[f'{months}_months'] = {
+                'invested': spent,
+                'projected': round(value, 2),
+                'gain': round(value - spent, 2),
+                'return_percent': round((value / spent - 1) * 100, 1) if spent else 0.0
+            }
+        return {
+            'option': option['name'],
+            'risk': option['risk'],
+            'monthly_investment': amount,
+            'annual_return_percent': round(option['return_12m'] * 100, 1),
+            'projections': projections,
+            'reward_points': int(amount * POINTS_RATE)
+        }
+    
+    def simulate_unit(self, paths=SIMULATION_PATHS, seed=SIMULATION_SEED, models=None):
+        """Percentiles (O, H, P) of a SIP of 1 a month over simulated paths.
+        
+        models maps option keys to overrides of return_12m, volatility,
+        distribution and df. Every month of every path is drawn up front
+        and the SIP is rolled forward one month at a time across all
+        paths. Values scale with the monthly amount, so one run serves
+        every amount.
+        """
+        rng = np.random.default_rng(seed)
+        months = max(self.horizons)
+        horizon_index = {n: h for h, n in enumerate(self.horizons)}
+        result = np.empty((len(self.keys), len(self.horizons), len(PERCENTILES)))
+        for o, key in enumerate(self.keys):
+            model = {**self.options[key], **(models or {}).get(key, {})}
+            growth = 1 + monthly_returns(rng, model, paths, months)
+            value = np.zeros(paths)
+            for t in range(months):
+                value = (value + 1) * growth[:, t]
+                if t + 1 in horizon_index:
+                    result[o, horizon_index[t + 1]] = np.percentile(value, PERCENTILES)
+        return result
+    
+    def frozen_unit(self, paths, seed, models_key):
+        unit = self.simulate_unit(paths, seed, json.loads(models_key))
+        unit.setflags(write=False)
+        return unit
+    
+    def simulate(self, monthly_savings, paths=SIMULATION_PATHS, seed=SIMULATION_SEED, models=None):
+        """P10/P50/P90 outcomes per eligible option for one monthly amount,
+        best median 12-month outcome first"""
+        amount = float(monthly_savings)
+        unit = self.cached_unit(paths, seed, json.dumps(models or {}, sort_keys=True))
+        rows = []
+        for o, key in enumerate(self.keys):
+            if amount < self.min_investment[o]:
+                continue
+            projections = {}
+            for h, months in enumerate(self.horizons):
+                outcome = {f'p{p}': round(float(v) * amount, 2) for p, v in zip(PERCENTILES, unit[o, h])}
+                projections[f'{months}_months'] = {'invested': amount * months, **outcome}
+            rows.append({
+                'option': self.options[key]['name'],
+                'risk': self.options[key]['risk'],
+                'monthly_investment': amount,
+                'projections': projections,
+                'paths': paths
+            })
+        rank = f'{max(self.horizons)}_months'
+        return sorted(rows, key=lambda x: x['projections'][rank]['p50'], reverse=True)
+
+
+# One engine per option table version and horizons
+_engines = {}
+
+
+def engine_for(options=INVESTMENT_OPTIONS, horizons=HORIZONS):
+    version = options_version(options)
+    engine = _engines.get((version, tuple(horizons)))
+    if engine is None:
+        engine = _engines[version, tuple(horizons)] = ProjectionEngine(options, horizons)
+    return engine
@@ -0,0 +1,269 @@
+"""
+Leaderboard - PFMS Hackathon MVP
+Top users by reward points and each user's own rank, read from a sharded
+points index on the Users table instead of scanning it
+
+Usage: python leaderboard.py backfill|snapshot [BOARD]
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+POINTS_INDEX = 'lbShard-totalPoints-index'
+SNAPSHOT_TABLE = 'LeaderboardSnapshots'
+
+# Users are spread over this many index partitions so no single partition
+# key takes every award's write; top-K reads one page from each
+SHARDS = int(os.environ.get('LEADERBOARD_SHARDS', 10))
+
+# How long a warm Lambda serves the top-N from memory
+CACHE_TTL = float(os.environ.get('LEADERBOARD_TTL', 30))
+CACHE_SIZE = 100
+
+# rank() counts at most this many users above the caller; further down
+# the board it estimates the rank from the latest snapshot's histogram
+RANK_COUNT_LIMIT = int(os.environ.get('LEADERBOARD_RANK_LIMIT', 1000))
+
+# Most buckets a snapshot's points histogram is merged into
+HISTOGRAM_BUCKETS = 1000
+
+# (table, shards) -> (fetched at, entries), and
+# ('histogram', table, board) -> (fetched at, histogram), shared by warm invocations
+_cache = {}
+
+
+def shard_for(user_id, shards=SHARDS):
+    """Index partition of a user; crc32, unlike hash(), is the same in every process"""
+    return f'lb#{zlib.crc32(user_id.encode()) % shards}'
+
+
+def entry(rank, user):
+    return {
+        'rank': rank,
+        'userId': user['userId'],
+        'email': user.get('email', 'Anonymous'),
+        'points': int(user.get('totalPoints', 0)),
+        'tier': user.get('tier', 'Bronze')
+    }
+
+
+def ranked(users):
+    """Entries for users sorted highest points first. Tied users share a
+    rank, one more than the number of users with more points, as in
+    Leaderboard.rank()"""
+    entries = []
+    for i, user in enumerate(users):
+        tied = i and user['totalPoints'] == users[i - 1]['totalPoints']
+        entries.append(entry(entries[-1]['rank'] if tied else i + 1, user))
+    return entries
+
+
+def histogram(points, buckets=HISTOGRAM_BUCKETS):
+    """[[high, low, users], ...] from {points: users}, highest first, with
+    neighbouring point values merged into at most buckets rows of
+    about the same number of users"""
+    rows = []
+    per_bucket = sum(points.values()) / buckets
+    for value in sorted(points, reverse=True):
+        if rows and (len(rows) >= buckets or rows[-1][2] + points[value] <= per_bucket):
+            rows[-1][1] = value
+            rows[-1][2] += points[value]
+        else:
+            rows.append([value, value, points[value]])
+    return rows
+
+
+def users_above(rows, points):
+    """Users with more than points in a histogram; exact for unmerged
+    rows, interpolated within the row points falls in"""
+    above = 0
+    for high, low, users in rows:
+        if low > points:
+            above += users
+        elif high > points:
+            above += users * (high - points) / (high - low)
+    return int(above)
+
+
+class Leaderboard:
+    """Top-K and rank queries over the Users points index.
+
+    Every user with points carries lbShard (set by
+    RewardSystem.update_user_points); the index is keyed on lbShard and
+    totalPoints, so the top K of the board is within the top K of each
+    shard and a request reads SHARDS x K index items, however many
+    users there are.
+    """
+
+    def __init__(self, users_table=None, shards=SHARDS, ttl=CACHE_TTL, clock=time.monotonic,
+                 snapshots_table=None):
+        if users_table is None:
+            import aws_clients
+            users_table = aws_clients.table('Users')
+        self.users_table = users_table
+        self.snapshots_table = snapshots_table
+        self.shards = shards
+        self.ttl = ttl
+        self.clock = clock
+
+    def shard_top(self, shard, k):
+        response = self.users_table.query(
+            IndexName=POINTS_INDEX,
+            KeyConditionExpression='lbShard = :shard',
+            ExpressionAttributeValues={':shard': shard},
+            ScanIndexForward=False,
+            Limit=k
+        )
+        return response.get('Items', [])
+
+    def query_top(self, k):
+        """Top k users straight from the index, highest points first"""
+        users = []
+        for shard in range(self.shards):
+            users.extend(self.shard_top(f'lb#{shard}', k))
+        users.sort(key=lambda user: (-user['totalPoints'], user['userId']))
+        return ranked(users[:k])
+
+    def top(self, k=10):
+        """Top k users, from memory while the cached top-N is fresh"""
+        if k > CACHE_SIZE:
+            return self.query_top(k)
+        key = (self.users_table.name, self.shards)
+        cached = _cache.get(key)
+        now = self.clock()
+        if cached is None or now - cached[0] > self.ttl:
+            cached = _cache[key] = (now, self.query_top(CACHE_SIZE))
+        return cached[1][:k]
+
+    def rank(self, user_id):
+        """The user's place on the board, with ties sharing a rank, or None
+        for a user without points.
+        
+        Counts the users above them, one COUNT query per shard, reading at
+        most RANK_COUNT_LIMIT index items. Below that the rank comes from
+        the latest snapshot's points histogram and is marked approximate.
+        """
+        user = self.users_table.get_item(
+            Key={'userId': user_id},
+            ProjectionExpression='userId, email, totalPoints, tier'
+        ).get('Item')
+        if not user or 'totalPoints' not in user:
+            return None
+
+        above = 0
+        for shard in range(self.shards):
+            params = {
+                'IndexName': POINTS_INDEX,
+                'KeyConditionExpression': 'lbShard = :shard AND totalPoints > :points',
+                'ExpressionAttributeValues': {':shard': f'lb#{shard}', ':points': user['totalPoints']},
+                'Select': 'COUNT'
+            }
+            while above < RANK_COUNT_LIMIT:
+                response = self.users_table.query(Limit=RANK_COUNT_LIMIT - above, **params)
+                above += response['Count']
+                if 'LastEvaluatedKey' not in response:
+                    break
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            else:
+                return self.approximate_rank(user)
+        return entry(above + 1, user)
+
+    def approximate_rank(self, user, board='daily'):
+        """rank() for a user with at least RANK_COUNT_LIMIT users above
+        them, from the snapshot histogram (cached like top())"""
+        if self.snapshots_table is None:
+            import aws_clients
+            self.snapshots_table = aws_clients.table(SNAPSHOT_TABLE)
+        key = ('histogram', self.snapshots_table.name, board)
+        cached = _cache.get(key)
+        now = self.clock()
+        if cached is None or now - cached[0] > self.ttl:
+            snapshot = latest_snapshot(self.snapshots_table, board) or {}
+            cached = _cache[key] = (now, snapshot.get('histogram', []))
+        above = max(users_above(cached[1], user['totalPoints']), RANK_COUNT_LIMIT)
+        return {**entry(above + 1, user), 'approximate': True}
+
+    def histogram(self):
+        """Points histogram of every user on the board (see histogram());
+        scans the points index, so it is taken with the snapshot"""
+        params = {'IndexName': POINTS_INDEX, 'ProjectionExpression': 'totalPoints'}
+        points = {}
+        while True:
+            response = self.users_table.scan(**params)
+            for user in response.get('Items', []):
+                points[user['totalPoints']] = points.get(user['totalPoints'], 0) + 1
+            if 'LastEvaluatedKey' not in response:
+                return histogram(points)
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def snapshot(self, snapshots_table, board='daily', k=CACHE_SIZE):
+        """Store the current top k and the points histogram rank() falls
+        back on under board, e.g. for 'last week's winners' or rank
+        changes; taken by a scheduled snapshot_handler"""
+        taken_at = datetime.now(timezone.utc).isoformat()
+        entries = self.query_top(k)
+        rows = self.histogram()
+        snapshots_table.put_item(Item={'board': board, 'takenAt': taken_at, 'entries': entries,
+                                       'histogram': rows})
+        return {'board': board, 'takenAt': taken_at, 'entries': entries, 'histogram': rows}
+
+    def backfill(self):
+        """Give every user with points their lbShard; run once after adding
+        the index, and again after changing SHARDS"""
+        params = {'ProjectionExpression': 'userId, totalPoints, lbShard'}
+        updated = 0
+        while True:
+            response = self.users_table.scan(**params)
+            for user in response.get('Items', []):
+                shard = shard_for(user['userId'], self.shards)
+                if 'totalPoints' in user and user.get('lbShard') != shard:
+                    self.users_table.update_item(
+                        Key={'userId': user['userId']},
+                        UpdateExpression='SET lbShard = :shard',
+                        ExpressionAttributeValues={':shard': shard}
+                    )
+                    updated += 1
+            if 'LastEvaluatedKey' not in response:
+                return updated
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def latest_snapshot(snapshots_table, board='daily'):
+    response = snapshots_table.query(
+        KeyConditionExpression='board = :board',
+        ExpressionAttributeValues={':board': board},
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+
+def clear_cache():
+    _cache.clear()
+
+
+# Lambda handler for a scheduled (EventBridge) leaderboard snapshot
+def snapshot_handler(event, context):
+    import aws_clients
+
+    snapshot = Leaderboard().snapshot(aws_clients.table(SNAPSHOT_TABLE), event.get('board', 'daily'))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'board': snapshot['board'], 'takenAt': snapshot['takenAt'],
+                            'entries': len(snapshot['entries'])})
+    }
+
+
+if __name__ == '__main__':
+    command = sys.argv[1]
+    if command == 'backfill':
+        print(f"{Leaderboard().backfill()} users given a leaderboard shard")
+    else:
+        board = sys.argv[2] if len(sys.argv) > 2 else 'daily'
+        result = json.loads(snapshot_handler({'board': board}, None)['body'])
+        print(f"{board}: {result['entries']} entries at {result['takenAt']}")
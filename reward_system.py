@@ -3,15 +3,71 @@ Gamification & Reward Points System - PFMS Hackathon MVP
 Tracks user actions and awards points
 """
 
+import hashlib
 import json
+import os
+import re
+import threading
+import time
 from datetime import datetime
-import boto3
+from decimal import Decimal
+import aws_clients
+from leaderboard import Leaderboard, shard_for
+
+# Badges in the order get_user_stats lists them
+BADGE_ORDER = ['first_cancel', 'first_investment', 'savings_10', 'savings_20']
+
+# Actions whose first reward earns a bonus
+FIRST_TIME_BONUS = ('cancel_subscription', 'invest_savings')
+
+# Reward ids are 'rwd_' + a ULID: 48-bit millisecond time and 80 random bits
+# in Crockford base32, so a user's rewards sort by time under rewardId
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+REWARD_ID = re.compile(r'^rwd_[0-9A-HJKMNP-TV-Z]{26}$')
+
+_id_lock = threading.Lock()
+_last_id = (0, 0)
+
+
+def encode_ulid(ms, randomness):
+    value = (ms << 80) | randomness
+    return ''.join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def new_reward_id(now=None):
+    """Next reward id for time now (epoch seconds); ids from one process
+    strictly increase, even within a millisecond or if the clock steps back"""
+    global _last_id
+    ms = int((time.time() if now is None else now) * 1000)
+    with _id_lock:
+        last_ms, last_random = _last_id
+        if ms <= last_ms:
+            ms, randomness = last_ms, last_random + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big') >> 1
+        _last_id = (ms, randomness)
+    return 'rwd_' + encode_ulid(ms, randomness)
+
+
+def legacy_reward_id(reward):
+    """Sortable id for a reward stored under an old rwd_<user>_<seconds>
+    id: its timestamp, and randomness from the old id so reruns agree"""
+    ms = int(datetime.fromisoformat(reward['timestamp']).timestamp() * 1000)
+    digest = hashlib.sha256(reward['rewardId'].encode()).digest()
+    return 'rwd_' + encode_ulid(ms, int.from_bytes(digest[:10], 'big'))
+
+
+def predates_summary(user):
+    """Whether a Users item has points but no action summary, i.e. was
+    last rewarded before award_points kept one"""
+    return 'totalPoints' in user and 'rewardCount' not in user
 
 class RewardSystem:
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
-        self.rewards_table = self.dynamodb.Table('Rewards')
-        self.users_table = self.dynamodb.Table('Users')
+        self.dynamodb = aws_clients.resource('dynamodb')
+        self.rewards_table = aws_clients.table('Rewards')
+        self.users_table = aws_clients.table('Users')
+        self.leaderboard = Leaderboard(self.users_table)
         
         # Point values for different actions
         self.point_rules = {
@@ -44,6 +100,33 @@ class RewardSystem:
     
     def award_points(self, user_id, action, metadata=None):
         """Award points for user action"""
+        first_time = action in FIRST_TIME_BONUS and not self.has_done(user_id, action)
+        points, description = self.compute_award(action, metadata, first_time)
+        now = time.time()
+        
+        # Store reward
+        reward = {
+            'rewardId': new_reward_id(now),
+            'userId': user_id,
+            'action': action,
+            'points': points,
+            'description': description,
+            'metadata': metadata or {},
+            'timestamp': datetime.fromtimestamp(now).isoformat()
+        }
+        
+        self.rewards_table.put_item(Item=reward)
+        
+        # Update user total points and action summary
+        saved = [(metadata or {}).get('saved_amount', 0)] if action == 'meet_savings_target' else ()
+        self.update_user_points(user_id, points, action, self.badges_for(action, metadata or {}),
+                                saved_amounts=saved)
+        
+        return reward
+    
+    def compute_award(self, action, metadata, first_time=False):
+        """(points, description) for an action; first_time adds the
+        first cancellation/investment bonus"""
         points = 0
         description = ''
         
@@ -55,9 +138,8 @@ class RewardSystem:
             points = self.point_rules['cancel_subscription'] + int(monthly_cost / 10)
             description = f"Canceled {subscription_name} subscription"
             
-            # Check if first cancellation
-            user_rewards = self.get_user_rewards(user_id)
-            if not any(r['action'] == 'cancel_subscription' for r in user_rewards):
+            # First cancellation bonus
+            if first_time:
                 points += self.point_rules['first_subscription_cancel']
                 description += " (First cancellation bonus!)"
         
@@ -79,9 +161,8 @@ class RewardSystem:
             points = int(base_points * self.point_rules['invest_savings'])
             description = f"Invested ₹{investment_amount} in {investment_type}"
             
-            # Check if first investment
-            user_rewards = self.get_user_rewards(user_id)
-            if not any(r['action'] == 'invest_savings' for r in user_rewards):
+            # First investment bonus
+            if first_time:
                 points += self.point_rules['first_investment']
                 description += " (First investment bonus!)"
         
@@ -94,95 +175,271 @@ class RewardSystem:
             points = self.point_rules['monthly_goal_achieved']
             description = f"Achieved monthly goal: {goal_name}"
         
-        # Store reward
-        reward = {
-            'rewardId': f"rwd_{user_id}_{int(datetime.now().timestamp())}",
-            'userId': user_id,
-            'action': action,
-            'points': points,
-            'description': description,
-            'metadata': metadata or {},
-            'timestamp': datetime.now().isoformat()
-        }
+        return points, description
+    
+    def update_user_points(self, user_id, points_to_add, action=None, badges=(), counts=None,
+                           saved_amounts=()):
+        """Update user's total points and tier.
         
-        self.rewards_table.put_item(Item=reward)
+        The points are added atomically in one write, so concurrent awards
+        are never lost; the same write records action and badges in the
+        user's action summary (see get_action_summary) and puts the user on
+        the leaderboard's points index. The tier is written
+        only when this award crosses a threshold, on condition that the
+        total is still in the new tier's range; if a concurrent award has
+        moved it on, that award writes the tier instead.
         
-        # Update user total points
-        self.update_user_points(user_id, points)
+        counts ({action: rewards}) records several rewards at once, for
+        bulk awards that add up a user's points first. saved_amounts join
+        the savedAmounts number set in the same write: DynamoDB has no max(),
+        so the largest is taken when the summary is read. A user who had
+        points before the action summary existed gets it rebuilt from
+        their reward history (which already holds this award) on their
+        first counted award.
+        """
+        update = 'SET lbShard = :shard ADD totalPoints :delta'
+        names = {}
+        values = {':delta': points_to_add, ':shard': shard_for(user_id)}
+        if action:
+            counts = {action: 1}
+        if counts:
+            update += ', actionsSeen :actions, rewardCount :rewards'
+            values.update({':actions': set(counts), ':rewards': sum(counts.values())})
+            for i, (name, count) in enumerate(counts.items()):
+                update += f', #count{i} :count{i}'
+                names[f'#count{i}'] = f'count_{name}'
+                values[f':count{i}'] = count
+        if badges:
+            update += ', badges :badges'
+            values[':badges'] = set(badges)
+        if saved_amounts:
+            update += ', savedAmounts :saved'
+            values[':saved'] = {Decimal(str(amount)) for amount in saved_amounts}
         
-        return reward
+        params = {'ExpressionAttributeNames': names} if names else {}
+        response = self.users_table.update_item(
+            Key={'userId': user_id},
+            UpdateExpression=update,
+            ExpressionAttributeValues=values,
+            ReturnValues='UPDATED_NEW',
+            **params
+        )
+        new_total = int(response['Attributes']['totalPoints'])
+        tier = self.tier_for(new_total)
+        if counts and response['Attributes']['rewardCount'] == sum(counts.values()) \
+                and new_total != points_to_add:
+            self.backfill_action_summary(user_id, replace=True)
+        
+        if tier != self.tier_for(new_total - points_to_add):
+            low, high = self.tier_range(tier)
+            condition = 'totalPoints >= :low'
+            values = {':tier': tier, ':low': low}
+            if high is not None:
+                condition += ' AND totalPoints < :high'
+                values[':high'] = high
+            try:
+                self.users_table.update_item(
+                    Key={'userId': user_id},
+                    UpdateExpression='SET tier = :tier',
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=values
+                )
+            except self.users_table.meta.client.exceptions.ConditionalCheckFailedException:
+                pass
+        
+        return {'totalPoints': new_total, 'tier': tier}
     
-    def update_user_points(self, user_id, points_to_add):
-        """Update user's total points and tier"""
-        response = self.users_table.get_item(Key={'userId': user_id})
-        user = response.get('Item', {})
+    def get_action_summary(self, user_id):
+        """What the user has done so far, from their Users item.
         
-        current_points = user.get('totalPoints', 0)
-        new_total = current_points + points_to_add
+        Returns actions seen, per-action counts, the largest saved amount
+        and badge keys earned, kept up to date by award_points.
+        """
+        user = self.users_table.get_item(Key={'userId': user_id}).get('Item', {})
+        if predates_summary(user):
+            return self.backfill_action_summary(user_id)
+        return self.summary_from_user(user)
+    
+    def summary_from_user(self, user):
+        return {
+            'actions': set(user.get('actionsSeen', ())),
+            'counts': {name[len('count_'):]: int(count) for name, count in user.items()
+                       if name.startswith('count_')},
+            'rewardCount': int(user.get('rewardCount', 0)),
+            # Summaries from before savedAmounts stored maxSavedAmount instead
+            'maxSavedAmount': max([user.get('maxSavedAmount', 0), *user.get('savedAmounts', ())]),
+            'badges': set(user.get('badges', ()))
+        }
+    
+    def has_done(self, user_id, action):
+        """Whether the user has been rewarded for action before"""
+        item = self.users_table.get_item(
+            Key={'userId': user_id},
+            ProjectionExpression='actionsSeen, rewardCount, totalPoints'
+        ).get('Item', {})
+        if predates_summary(item):
+            return action in self.backfill_action_summary(user_id)['actions']
+        return action in item.get('actionsSeen', ())
+    
+    def badges_for(self, action, metadata):
+        """Badge keys a reward for action earns"""
+        if action == 'cancel_subscription':
+            return ['first_cancel']
+        if action == 'invest_savings':
+            return ['first_investment']
+        if action == 'meet_savings_target':
+            saved_amount = metadata.get('saved_amount', 0)
+            return [badge for badge, amount in [('savings_10', 10), ('savings_20', 20)]
+                    if saved_amount >= amount]
+        return []
+    
+    def backfill_action_summary(self, user_id, replace=False):
+        """Rebuild a user's action summary from their full reward history,
+        for users rewarded before the summary existed.
+        
+        Reads of such users call this on the way (see predates_summary).
+        Unless replace, the summary is only written if the user still has
+        none; if a concurrent award or backfill got there first, the
+        stored summary is returned instead.
+        """
+        rewards = self.get_user_rewards(user_id)
+        actions = {r['action'] for r in rewards if r.get('action')}
+        counts = {}
+        badges = set()
+        saved = set()
+        for r in rewards:
+            metadata = r.get('metadata', {})
+            counts[r['action']] = counts.get(r['action'], 0) + 1
+            badges.update(self.badges_for(r['action'], metadata))
+            if r['action'] == 'meet_savings_target':
+                saved.add(Decimal(str(metadata.get('saved_amount', 0))))
         
-        # Determine tier
+        names = {f'#c{i}': f'count_{a}' for i, a in enumerate(counts)}
+        values = {f':c{i}': n for i, n in enumerate(counts.values())}
+        sets = [f'{name} = {name.replace("#", ":")}' for name in names]
+        sets.append('rewardCount = :rewards')
+        values[':rewards'] = len(rewards)
+        for attribute, members in [('actionsSeen', actions), ('badges', badges),
+                                   ('savedAmounts', saved)]:
+            if members:
+                sets.append(f'{attribute} = :{attribute}')
+                values[f':{attribute}'] = members
+        
+        params = {'ExpressionAttributeNames': names} if names else {}
+        if not replace:
+            params['ConditionExpression'] = 'attribute_not_exists(rewardCount)'
+        try:
+            self.users_table.update_item(
+                Key={'userId': user_id},
+                UpdateExpression='SET ' + ', '.join(sets),
+                ExpressionAttributeValues=values,
+                **params
+            )
+        except self.users_table.meta.client.exceptions.ConditionalCheckFailedException:
+            return self.get_action_summary(user_id)
+        return self.summary_from_user({
+            'actionsSeen': actions, 'rewardCount': len(rewards), 'savedAmounts': saved,
+            'badges': badges, **{f'count_{a}': n for a, n in counts.items()}
+        })
+    
+    def tier_for(self, points):
+        """Highest tier whose threshold points reach"""
         tier = 'Bronze'
         for tier_name, threshold in sorted(self.tiers.items(), key=lambda x: x[1], reverse=True):
-            if new_total >= threshold:
+            if points >= threshold:
                 tier = tier_name
                 break
-        
-        # Update user
-        self.users_table.update_item(
-            Key={'userId': user_id},
-            UpdateExpression='SET totalPoints = :points, tier = :tier',
-            ExpressionAttributeValues={
-                ':points': new_total,
-                ':tier': tier
-            }
-        )
-        
-        return {'totalPoints': new_total, 'tier': tier}
+        return tier
+    
+    def tier_range(self, tier):
+        """(lowest points, next tier's threshold or None) for a tier"""
+        low = self.tiers[tier]
+        higher = [t for t in self.tiers.values() if t > low]
+        return low, min(higher) if higher else None
     
     def get_user_rewards(self, user_id):
         """Get all rewards for a user"""
-        response = self.rewards_table.query(
-            KeyConditionExpression='userId = :uid',
-            ExpressionAttributeValues={':uid': user_id}
-        )
-        return response.get('Items', [])
+        params = {
+            'KeyConditionExpression': 'userId = :uid',
+            'ExpressionAttributeValues': {':uid': user_id}
+        }
+        rewards = []
+        while True:
+            response = self.rewards_table.query(**params)
+            rewards.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return rewards
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
     
     def get_user_stats(self, user_id):
         """Get user's gamification stats"""
         response = self.users_table.get_item(Key={'userId': user_id})
         user = response.get('Item', {})
+        if predates_summary(user):
+            summary = self.backfill_action_summary(user_id)
+        else:
+            summary = self.summary_from_user(user)
         
-        rewards = self.get_user_rewards(user_id)
-        
-        # Calculate badges earned
-        badges_earned = []
-        
-        # Check for first cancellation
-        if any(r['action'] == 'cancel_subscription' for r in rewards):
-            badges_earned.append(self.badges['first_cancel'])
-        
-        # Check for first investment
-        if any(r['action'] == 'invest_savings' for r in rewards):
-            badges_earned.append(self.badges['first_investment'])
-        
-        # Check for savings achievements
-        savings_rewards = [r for r in rewards if r['action'] == 'meet_savings_target']
-        if savings_rewards:
-            max_savings = max([r.get('metadata', {}).get('saved_amount', 0) for r in savings_rewards])
-            if max_savings >= 10:
-                badges_earned.append(self.badges['savings_10'])
-            if max_savings >= 20:
-                badges_earned.append(self.badges['savings_20'])
+        # Badges earned, recorded by award_points
+        badges_earned = [self.badges[b] for b in BADGE_ORDER if b in summary['badges']]
         
         return {
             'userId': user_id,
-            'totalPoints': user.get('totalPoints', 0),
+            'totalPoints': int(user.get('totalPoints', 0)),
             'tier': user.get('tier', 'Bronze'),
             'badges': badges_earned,
-            'totalRewards': len(rewards),
-            'recentRewards': sorted(rewards, key=lambda x: x['timestamp'], reverse=True)[:5]
+            'totalRewards': summary['rewardCount'],
+            'recentRewards': self.get_recent_rewards(user_id, 5)
         }
     
+    def get_recent_rewards(self, user_id, limit=5):
+        """The user's latest rewards, newest first, read straight off the
+        rewardId sort key.
+        
+        Rewards still under old rwd_<user>_<seconds> ids sort by the user id
+        text instead; a lowercase user id puts them ahead of every new
+        reward until migrate_reward_ids has run.
+        """
+        response = self.rewards_table.query(
+            KeyConditionExpression='userId = :uid',
+            ExpressionAttributeValues={':uid': user_id},
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return response.get('Items', [])
+    
+    def migrate_reward_ids(self, user_id=None):
+        """Move rewards stored under old rwd_<user>_<seconds> ids to
+        sortable ids, for one user or (scanning) everyone.
+        
+        Each reward is written under its new id, keeping the old one as
+        legacyRewardId, and the old item is deleted; the Rewards stream sees
+        a REMOVE and an INSERT of the same points, which cancel out in the
+        rollups. Safe to rerun. Returns the number of rewards moved.
+        """
+        if user_id:
+            params = {'KeyConditionExpression': 'userId = :uid',
+                      'ExpressionAttributeValues': {':uid': user_id}}
+            read = self.rewards_table.query
+        else:
+            params = {}
+            read = self.rewards_table.scan
+        
+        moved = 0
+        with self.rewards_table.batch_writer() as batch:
+            while True:
+                response = read(**params)
+                for reward in response.get('Items', []):
+                    if REWARD_ID.match(reward['rewardId']):
+                        continue
+                    batch.put_item(Item={**reward, 'rewardId': legacy_reward_id(reward),
+                                         'legacyRewardId': reward['rewardId']})
+                    batch.delete_item(Key={'userId': reward['userId'], 'rewardId': reward['rewardId']})
+                    moved += 1
+                if 'LastEvaluatedKey' not in response:
+                    return moved
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
     def calculate_investment_points(self, monthly_savings, investment_option):
         """Calculate projected points for investment"""
         # Base points from savings
@@ -202,22 +459,11 @@ class RewardSystem:
     
     def get_leaderboard(self, limit=10):
         """Get top users by points (for leaderboard)"""
-        response = self.users_table.scan()
-        users = response.get('Items', [])
-        
-        # Sort by points
-        leaderboard = sorted(users, key=lambda x: x.get('totalPoints', 0), reverse=True)[:limit]
-        
-        return [
-            {
-                'rank': i + 1,
-                'userId': user['userId'],
-                'email': user.get('email', 'Anonymous'),
-                'points': user.get('totalPoints', 0),
-                'tier': user.get('tier', 'Bronze')
-            }
-            for i, user in enumerate(leaderboard)
-        ]
+        return self.leaderboard.top(limit)
+    
+    def get_rank(self, user_id):
+        """User's own leaderboard entry, or None before their first points"""
+        return self.leaderboard.rank(user_id)
 
 
 # Lambda handler for reward actions
@@ -278,6 +524,15 @@ def lambda_handler(event, context):
             'body': json.dumps({'leaderboard': leaderboard})
         }
     
+    elif action_type == 'rank':
+        # Get the user's own place on the leaderboard
+        rank = reward_system.get_rank(user_id)
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'rank': rank})
+        }
+    
     else:
         return {
             'statusCode': 400,
@@ -0,0 +1,371 @@
+"""
+Spending Rollups - PFMS Hackathon MVP
+Daily and monthly aggregates per user, category and merchant,
+kept up to date from the Transactions and Rewards DynamoDB streams
+
+Usage: python spending_rollups.py rebuild|check USER_ID ...
+"""
+
+import json
+import sys
+from datetime import date
+from decimal import Decimal
+
+ROLLUP_TABLE = 'SpendingRollups'
+
+# One item per user and rollupKey:
+#   D#2024-01-10, M#2024-01  spending in that day/month
+#   R#total                  reward points
+# Spending items hold expense, income and txnCount plus
+#   cat#<category>             expenses in the category
+#   mer#<merchant>             all amounts at the merchant
+#   cm#<category>#<merchant>   all amounts at the merchant in the category
+# with categories lowercased, the way the chatbot compares them.
+REWARD_KEY = 'R#total'
+
+# Attributes that hold the latest reward rather than a sum
+LATEST_REWARD = ('lastRewardAt', 'lastRewardDescription', 'lastRewardPoints')
+
+# Stream sequence number of the last record applied to an item. Every
+# record for a rollup item comes from one table's stream and one userId
+# partition, so its sequence numbers only go up, and a batch Lambda
+# retries is skipped item by item instead of being added twice.
+# Sequence numbers run to 40 digits, past the 38 a DynamoDB number holds,
+# so they are stored zero-padded as strings and compared lexically.
+SEQUENCE = 'lastSeq'
+SEQUENCE_DIGITS = 40
+
+# Item attributes that are not sums
+NOT_SUMMED = ('userId', 'rollupKey', SEQUENCE)
+
+
+def rollup_keys(day):
+    """Daily and monthly rollupKey for an ISO date"""
+    return [f'D#{day}', f'M#{day[:7]}']
+
+
+def to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def transaction_values(txn):
+    """What one transaction adds to each of its rollups"""
+    amount = to_decimal(txn['amount'])
+    merchant = txn.get('merchant') or 'Unknown Merchant'
+    category = (txn.get('category') or '').lower()
+    values = {
+        'txnCount': 1,
+        f'mer#{merchant}': amount,
+        f'cm#{category}#{merchant}': amount
+    }
+    if txn.get('type') == 'expense':
+        values['expense'] = amount
+        values[f'cat#{category}'] = amount
+    elif txn.get('type') == 'income':
+        values['income'] = amount
+    return values
+
+
+def reward_values(reward):
+    return {'points': to_decimal(reward['points']), 'rewardCount': 1}
+
+
+def accumulate(deltas, user_id, key, values, sign=1):
+    bucket = deltas.setdefault((user_id, key), {})
+    for name, value in values.items():
+        bucket[name] = bucket.get(name, 0) + sign * value
+
+
+def add_transaction(deltas, txn, sign=1):
+    """Add txn to its daily and monthly rollups; returns their keys"""
+    values = transaction_values(txn)
+    keys = rollup_keys(txn['date'])
+    for key in keys:
+        accumulate(deltas, txn['userId'], key, values, sign)
+    return keys
+
+
+def add_reward(deltas, reward, sign=1):
+    accumulate(deltas, reward['userId'], REWARD_KEY, reward_values(reward), sign)
+    return [REWARD_KEY]
+
+
+def compute_rollups(transactions=(), rewards=()):
+    """Rollups from raw items: {(userId, rollupKey): {attribute: value}}"""
+    rollups = {}
+    for txn in transactions:
+        add_transaction(rollups, txn)
+    latest = {}
+    for reward in rewards:
+        add_reward(rollups, reward)
+        if reward['timestamp'] > latest.get(reward['userId'], {}).get('timestamp', ''):
+            latest[reward['userId']] = reward
+    for user_id, reward in latest.items():
+        rollups[user_id, REWARD_KEY].update(latest_reward(reward))
+    return rollups
+
+
+def latest_reward(reward):
+    return dict(zip(LATEST_REWARD, (reward['timestamp'], reward.get('description', ''),
+                                    to_decimal(reward['points']))))
+
+
+def merge(items):
+    """Sum spending rollup items into one {attribute: value}"""
+    totals = {}
+    for item in items:
+        for name, value in item.items():
+            if name not in NOT_SUMMED:
+                totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def spending_summary(totals, category=None):
+    """(expense total, {merchant: amount}) from merged rollups, optionally
+    for one category; merchants that netted out to zero are left out"""
+    if category:
+        category = category.lower()
+        total = totals.get(f'cat#{category}', 0)
+        prefix = f'cm#{category}#'
+    else:
+        total = totals.get('expense', 0)
+        prefix = 'mer#'
+    merchants = {name[len(prefix):]: value for name, value in totals.items()
+                 if name.startswith(prefix) and value}
+    return total, merchants
+
+
+class RollupStore:
+    """Rollup items in DynamoDB"""
+
+    def __init__(self, table_name=ROLLUP_TABLE, dynamodb=None):
+        if dynamodb is None:
+            import aws_clients
+            dynamodb = aws_clients.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+
+    def apply(self, deltas, latest=None, sequences=None):
+        """Add deltas with one atomic ADD per rollup item, then record the
+        latest reward per user unless a newer one is already stored.
+
+        With sequences ({(userId, rollupKey): zero-padded last stream
+        sequence number}), an item only takes its delta if it has not
+        already applied that sequence number, so applying the same batch
+        again changes nothing.
+        """
+        from botocore.exceptions import ClientError
+
+        for (user_id, key), values in deltas.items():
+            values = {name: value for name, value in values.items() if value}
+            if not values:
+                continue
+            params = {
+                'Key': {'userId': user_id, 'rollupKey': key},
+                'UpdateExpression': 'ADD ' + ', '.join(f'#a{i} :v{i}' for i in range(len(values))),
+                'ExpressionAttributeNames': {f'#a{i}': name for i, name in enumerate(values)},
+                'ExpressionAttributeValues': {f':v{i}': value
+                                              for i, value in enumerate(values.values())}
+            }
+            sequence = (sequences or {}).get((user_id, key))
+            if sequence is not None:
+                params['UpdateExpression'] = f'SET {SEQUENCE} = :seq ' + params['UpdateExpression']
+                params['ConditionExpression'] = f'attribute_not_exists({SEQUENCE}) OR {SEQUENCE} < :seq'
+                params['ExpressionAttributeValues'][':seq'] = sequence
+            try:
+                self.table.update_item(**params)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+        for user_id, reward in (latest or {}).items():
+            values = latest_reward(reward)
+            try:
+                self.table.update_item(
+                    Key={'userId': user_id, 'rollupKey': REWARD_KEY},
+                    UpdateExpression='SET ' + ', '.join(f'{n} = :{n}' for n in values),
+                    ConditionExpression='attribute_not_exists(lastRewardAt) OR lastRewardAt < :lastRewardAt',
+                    ExpressionAttributeValues={f':{n}': v for n, v in values.items()}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+    def get(self, user_id, key):
+        return self.table.get_item(Key={'userId': user_id, 'rollupKey': key}).get('Item', {})
+
+    def query(self, user_id, start_key, end_key):
+        """Items with start_key <= rollupKey <= end_key, following LastEvaluatedKey"""
+        from boto3.dynamodb.conditions import Key
+
+        params = {'KeyConditionExpression': Key('userId').eq(user_id) &
+                  Key('rollupKey').between(start_key, end_key)}
+        items = []
+        while True:
+            response = self.table.query(**params)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def window(self, user_id, start, end, today=None):
+        """Merged spending for start..end (ISO dates, inclusive).
+
+        A whole month, or the month so far, is its monthly item; any other
+        window is one query over at most a month or so of daily items.
+        """
+        today = (today or date.today()).isoformat()
+        month_end = next_day(end)[:7] != end[:7]
+        if start.endswith('-01') and start[:7] == end[:7] and (end == today or month_end):
+            return merge([self.get(user_id, f'M#{start[:7]}')])
+        return merge(self.query(user_id, f'D#{start}', f'D#{end}'))
+
+    def rewards(self, user_id):
+        return self.get(user_id, REWARD_KEY)
+
+    def keys(self, user_id):
+        return {item['rollupKey'] for item in read_all(self.table, user_id, ['rollupKey'])}
+
+
+def next_day(day):
+    return date.fromordinal(date.fromisoformat(day).toordinal() + 1).isoformat()
+
+
+def image(record, which):
+    """Plain dict of a stream record's NewImage/OldImage, or None"""
+    from boto3.dynamodb.types import TypeDeserializer
+
+    raw = record.get('dynamodb', {}).get(which)
+    if raw is None:
+        return None
+    deserializer = TypeDeserializer()
+    return {name: deserializer.deserialize(value) for name, value in raw.items()}
+
+
+def source_table(record):
+    """'arn:aws:dynamodb:...:table/Transactions/stream/...' -> 'Transactions'"""
+    return record.get('eventSourceARN', '').split(':table/')[-1].split('/')[0]
+
+
+def stream_deltas(records):
+    """Rollup deltas, latest rewards and per-item last sequence numbers
+    for a batch of stream records.
+
+    Deltas are summed over the batch so each touched rollup item gets one
+    write; a MODIFY takes out the old image and adds the new one, so
+    re-synced transactions that did not change add nothing.
+    """
+    deltas = {}
+    latest = {}
+    sequences = {}
+    for record in records:
+        table = source_table(record)
+        if table == 'Transactions':
+            add = add_transaction
+        elif table == 'Rewards':
+            add = add_reward
+        else:
+            continue
+        old, new = image(record, 'OldImage'), image(record, 'NewImage')
+        if old == new:
+            continue
+        touched = []
+        if old:
+            touched += [(old['userId'], key) for key in add(deltas, old, -1)]
+        if new:
+            touched += [(new['userId'], key) for key in add(deltas, new)]
+            if table == 'Rewards' and new['timestamp'] > latest.get(new['userId'], {}).get('timestamp', ''):
+                latest[new['userId']] = new
+        sequence = record.get('dynamodb', {}).get('SequenceNumber')
+        if sequence:
+            sequence = sequence.zfill(SEQUENCE_DIGITS)
+            for item in touched:
+                sequences[item] = max(sequences.get(item, ''), sequence)
+    return deltas, latest, sequences
+
+
+def read_all(table, user_id, attributes=None):
+    """Every item of a user in table, projected to attributes if given"""
+    from boto3.dynamodb.conditions import Key
+
+    params = {'KeyConditionExpression': Key('userId').eq(user_id)}
+    if attributes:
+        names = {f'#a{i}': name for i, name in enumerate(attributes)}
+        params['ProjectionExpression'] = ', '.join(names)
+        params['ExpressionAttributeNames'] = names
+    items = []
+    while True:
+        response = table.query(**params)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def raw_rollups(user_id, transactions_table, rewards_table):
+    """Rollups for user_id computed from the raw Transactions and Rewards"""
+    transactions = read_all(transactions_table, user_id,
+                            ['userId', 'date', 'amount', 'merchant', 'category', 'type'])
+    rewards = read_all(rewards_table, user_id, ['userId', 'points', 'description', 'timestamp'])
+    return {key: values for (_, key), values in compute_rollups(transactions, rewards).items()}
+
+
+def rebuild(user_id, transactions_table, rewards_table, store):
+    """Recompute a user's rollups from raw data and replace the stored ones.
+
+    Pause the stream handler for the user (or run check() afterwards):
+    deltas applied while the rebuild runs can be overwritten.
+    """
+    expected = raw_rollups(user_id, transactions_table, rewards_table)
+    stale = store.keys(user_id) - set(expected)
+    with store.table.batch_writer(overwrite_by_pkeys=['userId', 'rollupKey']) as batch:
+        for key in stale:
+            batch.delete_item(Key={'userId': user_id, 'rollupKey': key})
+        for key, values in expected.items():
+            batch.put_item(Item={'userId': user_id, 'rollupKey': key, **values})
+    return len(expected)
+
+
+def check(user_id, transactions_table, rewards_table, store):
+    """Differences between the stored rollups and the raw data, as
+    (rollupKey, attribute, expected, stored); empty when consistent"""
+    expected = raw_rollups(user_id, transactions_table, rewards_table)
+    stored = {item['rollupKey']: item for item in read_all(store.table, user_id)}
+
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, {})
+        have = {name: value for name, value in stored.get(key, {}).items()
+                if name not in NOT_SUMMED}
+        for name in sorted(set(want) | set(have)):
+            default = '' if name in LATEST_REWARD[:2] else 0
+            if want.get(name, default) != have.get(name, default):
+                problems.append((key, name, want.get(name), have.get(name)))
+    return problems
+
+
+# Lambda handler for the Transactions and Rewards DynamoDB streams
+def lambda_handler(event, context):
+    """Apply a batch of stream records (NEW_AND_OLD_IMAGES) to the rollups"""
+    deltas, latest, sequences = stream_deltas(event.get('Records', []))
+    RollupStore().apply(deltas, latest, sequences)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'records': len(event.get('Records', [])),
+                            'rollupsUpdated': len(deltas)})
+    }
+
+
+if __name__ == '__main__':
+    import aws_clients
+
+    command, user_ids = sys.argv[1], sys.argv[2:]
+    tables = aws_clients.table('Transactions'), aws_clients.table('Rewards')
+    store = RollupStore()
+    for user_id in user_ids:
+        if command == 'rebuild':
+            print(f"{user_id}: {rebuild(user_id, *tables, store)} rollups written")
+        else:
+            problems = check(user_id, *tables, store)
+            print(f"{user_id}: {'consistent' if not problems else f'{len(problems)} differences'}")
+            for key, name, want, have in problems[:20]:
+                print(f"  {key} {name}: expected {want}, stored {have}")
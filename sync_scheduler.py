@@ -0,0 +1,118 @@
+"""
+Gmail Sync Scheduler - PFMS Hackathon MVP
+Syncs a whole shard of users concurrently from one Lambda invocation
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+from gmail_integration import (
+    GmailTransactionFetcher, RateBudget, SyncStateStore, USER_CALLS_PER_SECOND, sync_user
+)
+
+# Each user's sync mostly waits on Gmail, so threads overlap well
+MAX_WORKERS = int(os.environ.get('SYNC_WORKERS', 8))
+
+
+def default_fetcher(user_id, two_phase=False):
+    """Authenticated GmailTransactionFetcher for user_id"""
+    fetcher = GmailTransactionFetcher(two_phase=two_phase)
+    fetcher.authenticate(user_id, interactive=False)
+    return fetcher
+
+
+class SyncScheduler:
+    """Runs sync_user for a list of users on a bounded thread pool.
+
+    Every user gets their own fetcher and RateBudget, so a large mailbox or a
+    retry storm spends only that user's Gmail quota. Each user is one task
+    capped at max_results messages, so no user holds a worker for long and
+    users start in the order given, at most max_workers at a time.
+
+    fetcher_factory(user_id) returns an authenticated fetcher; resources()
+    returns (sync state store, Transactions table) for the calling thread.
+    """
+
+    def __init__(self, fetcher_factory=default_fetcher, resources=None,
+                 max_workers=MAX_WORKERS, calls_per_second=USER_CALLS_PER_SECOND,
+                 max_results=50):
+        self.fetcher_factory = fetcher_factory
+        self.max_workers = max_workers
+        self.calls_per_second = calls_per_second
+        self.max_results = max_results
+        if resources is not None:
+            self.resources = resources
+
+    def resources(self):
+        """DynamoDB tables from the calling thread's shared resource"""
+        return SyncStateStore(), aws_clients.table('Transactions')
+
+    def run(self, user_ids, mode=None):
+        """Sync every user once; returns one summary per user, in order"""
+        users = list(dict.fromkeys(user_ids))
+        if not users:
+            return []
+        workers = min(self.max_workers, len(users))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gmail-sync') as pool:
+            return list(pool.map(lambda user_id: self.sync_one(user_id, mode), users))
+
+    def sync_one(self, user_id, mode=None):
+        """Sync one user; failures are reported in the summary, not raised"""
+        started = time.perf_counter()
+        summary = {
+            'userId': user_id,
+            'status': 'ok',
+            'syncMode': None,
+            'messages': 0,
+            'transactions': 0,
+            'error': None
+        }
+        budget = RateBudget(self.calls_per_second)
+        try:
+            fetcher = self.fetcher_factory(user_id)
+            fetcher.budget = budget
+            sync_state, table = self.resources()
+            transactions, summary['syncMode'] = sync_user(
+                fetcher, user_id, sync_state, table, mode, self.max_results)
+            summary['messages'] = fetcher.stats['messages']
+            summary['transactions'] = len(transactions)
+        except Exception as e:
+            summary['status'] = 'error'
+            summary['error'] = str(e)
+        summary['latencyMs'] = round((time.perf_counter() - started) * 1000, 1)
+        summary['throttledMs'] = round(budget.waited * 1000, 1)
+        return summary
+
+
+def summarize(results, elapsed):
+    """Totals for a scheduler run"""
+    return {
+        'users': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] == 'error'),
+        'transactions': sum(r['transactions'] for r in results),
+        'elapsedMs': round(elapsed * 1000, 1),
+        'results': results
+    }
+
+
+# Lambda handler for AWS
+def lambda_handler(event, context):
+    """Sync Gmail transactions for every user in event['userIds']"""
+
+    two_phase = event.get('twoPhase', False)
+    scheduler = SyncScheduler(
+        fetcher_factory=lambda user_id: default_fetcher(user_id, two_phase),
+        max_workers=event.get('maxWorkers', MAX_WORKERS)
+    )
+
+    started = time.perf_counter()
+    results = scheduler.run(event.get('userIds', []), event.get('mode'))
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(summarize(results, time.perf_counter() - started))
+    }
@@ -0,0 +1,15 @@
+"""
+Shared setup for the PFMS tests: the Lambda modules live at the repo root,
+and the reference (original) implementations live in benchmarks.py
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# boto3 clients need a region; moto serves every call
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
@@ -0,0 +1,129 @@
+"""
+Subscription and wasteful-expense detectors: the incremental detector, the
+NumPy backend and the single-pass rules must agree with the originals
+"""
+
+import json
+import os
+import random
+
+import pytest
+
+from ai_categorization import SubscriptionDetector, TransactionCategorizer
+from benchmarks import (ROOT, StubComprehend, legacy_detect_wasteful_expenses,
+                        same_subscriptions, synthetic_history)
+
+
+@pytest.fixture(scope='module')
+def history():
+    return synthetic_history(merchants=120, months=12)
+
+
+@pytest.fixture(scope='module')
+def categorizer():
+    return TransactionCategorizer(comprehend=StubComprehend(latency=0))
+
+
+@pytest.fixture(scope='module')
+def sample():
+    with open(os.path.join(ROOT, 'sample_transactions.json')) as f:
+        return json.load(f)['transactions']
+
+
+def detect(categorizer, transactions):
+    subscriptions = categorizer.detect_subscription(transactions)
+    return subscriptions, categorizer.detect_wasteful_expenses(transactions, subscriptions)
+
+
+@pytest.mark.parametrize('order', ['as_given', 'by_date'])
+def test_subscription_detector_matches_batch(categorizer, history, order):
+    transactions = history if order == 'as_given' else sorted(history, key=lambda t: t['date'])
+    same_subscriptions(categorizer.detect_subscription(transactions),
+                       SubscriptionDetector(transactions).subscriptions())
+
+
+def test_subscription_detector_incremental_updates(categorizer, history):
+    past, new = history[:-20], history[-20:]
+    detector = SubscriptionDetector(past)
+    for n, txn in enumerate(new, 1):
+        detector.add(txn)
+        same_subscriptions(categorizer.detect_subscription(past + new[:n]), detector.subscriptions())
+
+
+def test_subscription_detector_round_trips_state(history):
+    detector = SubscriptionDetector(history[:-5])
+    restored = SubscriptionDetector.from_dict(json.loads(json.dumps(detector.to_dict())))
+    for txn in history[-5:]:
+        detector.add(txn)
+        restored.add(txn)
+    assert restored.subscriptions() == detector.subscriptions()
+
+
+def test_numpy_backend_matches_python_on_sample(categorizer, sample):
+    numpy = TransactionCategorizer(comprehend=StubComprehend(latency=0), backend='numpy')
+    assert detect(numpy, sample) == detect(categorizer, sample)
+
+
+def test_numpy_backend_matches_python_on_history(categorizer, history):
+    numpy = TransactionCategorizer(comprehend=StubComprehend(latency=0), backend='numpy')
+    assert detect(numpy, history) == detect(categorizer, history)
+
+
+def test_wasteful_rules_match_original_without_duplicates(categorizer, history):
+    subscriptions = categorizer.detect_subscription(history)
+    legacy = legacy_detect_wasteful_expenses(history, subscriptions)
+    wasteful = categorizer.detect_wasteful_expenses(history, subscriptions)
+    assert len({json.dumps(w, sort_keys=True) for w in wasteful}) == len(wasteful)
+    assert ({json.dumps(w, sort_keys=True) for w in legacy} ==
+            {json.dumps(w, sort_keys=True) for w in wasteful})
+
+
+def monthly(merchant, months, start='2020-01-05'):
+    from datetime import date, timedelta
+
+    day = date.fromisoformat(start)
+    charges = []
+    for _ in range(months):
+        charges.append({'date': day.isoformat(), 'amount': 299.0, 'merchant': merchant})
+        day += timedelta(days=30)
+    return charges
+
+
+def test_subscription_state_stays_bounded():
+    # Charges days apart can never be monthly, so none of their dates are kept
+    daily = [{'date': f'2021-{1 + n // 28 % 12:02d}-{1 + n % 28:02d}', 'amount': 180.0,
+              'merchant': 'Swiggy'} for n in range(3000)]
+    detector = SubscriptionDetector(monthly('Netflix', 120) + daily)
+    assert detector.merchants['swiggy'].days is None
+    assert detector.merchants['swiggy'].count == 3000
+    assert len(detector.merchants['netflix'].days) == 120
+    assert detector.merchant_stats('Netflix')['meanInterval'] == 30
+    assert detector.subscription('Netflix')['transactionCount'] == 120
+
+
+def test_out_of_order_charges_are_exact(categorizer):
+    charges = monthly('Netflix', 60) + monthly('Hotstar', 60, '2020-01-20')
+    missing_month = [t for t in charges if t['date'] != '2022-01-18']
+    for transactions in (charges, missing_month):
+        for seed in range(5):
+            shuffled = list(transactions)
+            random.Random(seed).shuffle(shuffled)
+            same_subscriptions(categorizer.detect_subscription(shuffled),
+                               SubscriptionDetector(shuffled).subscriptions())
+
+
+def test_late_charge_inside_a_regular_history(categorizer):
+    charges = monthly('Netflix', 60)
+    extra = {'date': '2020-06-20', 'amount': 299.0, 'merchant': 'Netflix'}
+    detector = SubscriptionDetector(charges + [extra])
+    assert categorizer.detect_subscription(charges + [extra]) == []
+    assert detector.subscriptions() == []
+
+
+def test_late_charge_fills_an_old_gap(categorizer):
+    charges = monthly('Netflix', 60)
+    gap = charges.pop(5)
+    assert SubscriptionDetector(charges).subscriptions() == []
+    assert len(categorizer.detect_subscription(charges + [gap])) == 1
+    same_subscriptions(categorizer.detect_subscription(charges + [gap]),
+                       SubscriptionDetector(charges + [gap]).subscriptions())
@@ -0,0 +1,91 @@
+"""
+Transaction categorization: keyword rules, the merchant store and the
+Comprehend fallback
+"""
+
+import logging
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from ai_categorization import TransactionCategorizer
+from benchmarks import StubComprehend, legacy_rule_category, synthetic_transactions
+from category_store import DynamoCategoryStore, MemoryCategoryStore, MerchantCategoryStore
+
+
+def categorizer(store=None):
+    return TransactionCategorizer(comprehend=StubComprehend(latency=0),
+                                  store=store or MerchantCategoryStore([MemoryCategoryStore()]))
+
+
+def categories(categorizer, transactions):
+    return [t['category'] for t in categorizer.categorize_transactions([dict(t) for t in transactions])]
+
+
+def test_matcher_matches_keyword_scan():
+    handler = categorizer()
+    for txn in synthetic_transactions(2000):
+        merchant, subject = txn['merchant'].lower(), txn['rawSubject'].lower()
+        assert handler.matcher.match(merchant, subject) == \
+            legacy_rule_category(handler.category_rules, merchant, subject)
+
+
+def test_store_backed_results_equal_rules_only():
+    transactions = synthetic_transactions(2000)
+    store = MerchantCategoryStore([MemoryCategoryStore()])
+    categories(categorizer(store), transactions)
+
+    # Later invocations reuse the store; a fresh store only has the rules
+    assert categories(categorizer(store), transactions) == categories(categorizer(), transactions)
+
+
+def test_comprehend_guess_does_not_override_rules():
+    store = MerchantCategoryStore([MemoryCategoryStore()])
+    first = {'merchant': 'Ramesh Traders', 'rawSubject': 'Payment received'}
+    later = {'merchant': 'Ramesh Traders', 'rawSubject': 'Your Swiggy food order'}
+
+    assert categories(categorizer(store), [first]) == ['Shopping']
+    assert categories(categorizer(store), [later]) == ['Food']
+
+
+def test_stored_guess_answers_without_comprehend():
+    store = MerchantCategoryStore([MemoryCategoryStore()])
+    txn = {'merchant': 'Ramesh Traders', 'rawSubject': 'Payment received'}
+    categories(categorizer(store), [txn])
+
+    warm = categorizer(store)
+    assert categories(warm, [txn]) == ['Shopping']
+    assert warm.comprehend.calls == 0
+
+
+@pytest.fixture
+def dynamodb():
+    with mock_aws():
+        yield boto3.resource('dynamodb', region_name='ap-south-1')
+
+
+def test_dynamo_tier_round_trip(dynamodb):
+    dynamodb.create_table(
+        TableName='MerchantCategories',
+        KeySchema=[{'AttributeName': 'merchant', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'merchant', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    tier = DynamoCategoryStore(dynamodb=dynamodb)
+    tier.set('ramesh traders', 'Shopping', '2')
+    assert tier.get('ramesh traders', '2') == 'Shopping'
+    assert tier.get('ramesh traders', '1') is None
+
+
+def test_missing_dynamo_tier_is_logged_once(dynamodb, caplog):
+    tier = DynamoCategoryStore(dynamodb=dynamodb)
+    with caplog.at_level(logging.WARNING, logger='category_store'):
+        tier.set('ramesh traders', 'Shopping', '2')
+        assert tier.get('ramesh traders', '2') is None
+    assert len(caplog.records) == 1 and 'MerchantCategories' in caplog.text
+
+    # The faster tiers keep working without the shared one
+    store = MerchantCategoryStore([MemoryCategoryStore(), tier])
+    txn = {'merchant': 'Ramesh Traders', 'rawSubject': 'Payment received'}
+    assert categories(categorizer(store), [txn]) == ['Shopping']
@@ -0,0 +1,114 @@
+"""
+Streaming categorization: NDJSON in and out of moto's S3, chunk by chunk,
+against the batch handler's steps on the whole input
+"""
+
+import json
+import random
+
+import boto3
+import moto.s3.models
+import pytest
+from moto import mock_aws
+
+import aws_clients
+from ai_categorization import InvestmentRecommender, TransactionCategorizer
+from benchmarks import StubComprehend, synthetic_history, synthetic_transactions
+from categorization_pipeline import S3NdjsonWriter, categorize_stream, read_ndjson, run
+from category_store import MemoryCategoryStore, MerchantCategoryStore
+
+REGION = 'ap-south-1'
+BUCKET = 'pfms-imports'
+
+TRANSACTIONS = synthetic_history(merchants=40, months=14) + synthetic_transactions(300)
+random.Random(25).shuffle(TRANSACTIONS)
+
+
+def categorizer():
+    return TransactionCategorizer(comprehend=StubComprehend(latency=0),
+                                  store=MerchantCategoryStore([MemoryCategoryStore()]))
+
+
+def batch_result():
+    """What the batch handler works out from the whole input at once"""
+    handler = categorizer()
+    categorized = handler.categorize_transactions([dict(t) for t in TRANSACTIONS])
+    subscriptions = handler.detect_subscription(categorized)
+    wasteful = handler.detect_wasteful_expenses(categorized, subscriptions)
+    total_savings = sum([w['monthlySavings'] for w in wasteful])
+    return categorized, {
+        'transactionCount': len(categorized),
+        'subscriptions': subscriptions,
+        'wasteful_expenses': wasteful,
+        'potential_monthly_savings': total_savings,
+        'investment_recommendations': InvestmentRecommender().recommend_investments(total_savings)
+    }
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # Parts of a few KB stand in for S3's 5 MB minimum
+    monkeypatch.setattr(moto.s3.models, 'S3_UPLOAD_PART_MIN_SIZE', 1024)
+    with mock_aws():
+        aws_clients.reset()
+        client = boto3.client('s3', region_name=REGION)
+        client.create_bucket(Bucket=BUCKET,
+                             CreateBucketConfiguration={'LocationConstraint': REGION})
+        body = ''.join(json.dumps(t) + '\n' + ('\n' if n % 50 == 0 else '')
+                       for n, t in enumerate(TRANSACTIONS))
+        client.put_object(Bucket=BUCKET, Key='in.ndjson', Body=body.encode('utf-8'))
+        yield client
+        aws_clients.reset()
+
+
+def test_read_ndjson_from_s3_skips_blank_lines(s3):
+    assert list(read_ndjson(f's3://{BUCKET}/in.ndjson')) == TRANSACTIONS
+
+
+def test_writer_uploads_in_parts(s3):
+    lines = [json.dumps(t) + '\n' for t in TRANSACTIONS]
+    writer = S3NdjsonWriter(BUCKET, 'out.ndjson', s3=s3, part_size=4096)
+    for line in lines:
+        writer.write(line)
+    writer.close()
+
+    # A part goes up once the buffer reaches part_size, so it may run a line over
+    assert 3 < len(writer.parts) <= sum(map(len, lines)) // 4096 + 1
+    assert s3.get_object(Bucket=BUCKET, Key='out.ndjson')['Body'].read().decode() == ''.join(lines)
+
+
+def test_empty_output_is_one_empty_part(s3):
+    S3NdjsonWriter(BUCKET, 'empty.ndjson', s3=s3).close()
+    assert s3.get_object(Bucket=BUCKET, Key='empty.ndjson')['ContentLength'] == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 10000])
+def test_chunks_match_the_batch_handler(s3, chunk_size):
+    categorized, expected = batch_result()
+    writer = S3NdjsonWriter(BUCKET, 'out.ndjson', s3=s3, part_size=4096)
+    summary = categorize_stream(read_ndjson(f's3://{BUCKET}/in.ndjson'), writer,
+                                categorizer(), chunk_size=chunk_size)
+    writer.close()
+
+    assert summary == expected
+    assert list(read_ndjson(f's3://{BUCKET}/out.ndjson')) == categorized
+
+
+def test_run_from_s3_to_s3(s3):
+    categorized, expected = batch_result()
+    summary = run(f's3://{BUCKET}/in.ndjson', f's3://{BUCKET}/out.ndjson', categorizer(),
+                  chunk_size=100)
+    assert summary == {**expected, 'output': f's3://{BUCKET}/out.ndjson'}
+    assert list(read_ndjson(f's3://{BUCKET}/out.ndjson')) == categorized
+
+
+def test_failed_run_aborts_the_upload(s3):
+    class Failing(TransactionCategorizer):
+        def categorize_transactions(self, transactions):
+            raise RuntimeError('Comprehend is down')
+
+    with pytest.raises(RuntimeError):
+        run(f's3://{BUCKET}/in.ndjson', f's3://{BUCKET}/out.ndjson', Failing(
+            comprehend=StubComprehend(latency=0), store=MerchantCategoryStore([MemoryCategoryStore()])))
+    assert 'Uploads' not in s3.list_multipart_uploads(Bucket=BUCKET)
+    assert 'Contents' not in s3.list_objects_v2(Bucket=BUCKET, Prefix='out')
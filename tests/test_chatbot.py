@@ -0,0 +1,95 @@
+"""
+Chatbot fulfillment: TimePeriod slot windows and reading transactions by
+date, with and without the date index, against moto's DynamoDB
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from moto import mock_aws
+
+import aws_clients
+import chatbot_fulfillment
+from benchmarks import dynamo_table, dynamo_transactions_table
+from chatbot_fulfillment import period_range, query_transactions
+
+REGION = 'ap-south-1'
+
+
+@pytest.mark.parametrize('time_period, today, expected', [
+    ('today', date(2024, 3, 15), ('2024-03-15', '2024-03-15')),
+    ('yesterday', date(2024, 3, 1), ('2024-02-29', '2024-02-29')),
+    ('this week', date(2024, 3, 3), ('2024-02-26', '2024-03-03')),
+    ('this month', date(2024, 3, 1), ('2024-03-01', '2024-03-01')),
+    ('this month', date(2024, 3, 31), ('2024-03-01', '2024-03-31')),
+    ('last month', date(2024, 1, 10), ('2023-12-01', '2023-12-31')),
+    ('last month', date(2024, 3, 31), ('2024-02-01', '2024-02-29')),
+    (None, date(2024, 1, 15), ('2023-12-17', '2024-01-15')),
+])
+def test_period_range(time_period, today, expected):
+    assert period_range(time_period, today) == expected
+
+
+def test_period_range_defaults_to_today():
+    start, end = period_range('today')
+    assert start == end == date.today().isoformat()
+
+
+HISTORY = [
+    {'userId': user_id, 'transactionId': f'{user_id}-{n}',
+     'date': (date(2024, 1, 1) + timedelta(days=n)).isoformat(),
+     'amount': Decimal(100 + n), 'merchant': 'Swiggy', 'category': 'Food',
+     'type': 'expense', 'rawSubject': 'Transaction alert'}
+    for user_id in ('u1', 'u2') for n in range(90)
+]
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setattr(chatbot_fulfillment, 'date_index', True)
+    with mock_aws():
+        aws_clients.reset()
+        yield
+        aws_clients.reset()
+
+
+def load(table):
+    with table.batch_writer() as batch:
+        for txn in HISTORY:
+            batch.put_item(Item=txn)
+
+
+def expected(start, end):
+    return sorted((t['date'], t['amount']) for t in HISTORY
+                  if t['userId'] == 'u1' and start <= t['date'] <= end)
+
+
+def read(start, end):
+    rows = query_transactions('u1', start, end)
+    assert all(set(row) <= set(chatbot_fulfillment.SPENDING_ATTRIBUTES) for row in rows)
+    return sorted((row['date'], row['amount']) for row in rows)
+
+
+def test_window_from_the_date_index(aws, monkeypatch):
+    # The moto helper creates the table in us-east-1
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    aws_clients.reset()
+    load(dynamo_transactions_table())
+    assert read('2024-02-01', '2024-02-29') == expected('2024-02-01', '2024-02-29')
+    assert chatbot_fulfillment.date_index is True
+
+
+def test_missing_date_index_falls_back_to_a_filtered_query(aws):
+    load(dynamo_table('Transactions', 'transactionId', region=REGION))
+    assert read('2024-02-01', '2024-02-29') == expected('2024-02-01', '2024-02-29')
+    assert chatbot_fulfillment.date_index is False
+    assert read('2024-03-25', '2024-04-30') == expected('2024-03-25', '2024-04-30')
+
+
+def test_missing_table_is_not_mistaken_for_a_missing_index(aws):
+    from botocore.exceptions import ClientError
+
+    with pytest.raises(ClientError):
+        query_transactions('u1', '2024-01-01', '2024-01-31')
+    assert chatbot_fulfillment.date_index is True
@@ -0,0 +1,121 @@
+"""
+Gmail OAuth: per-user token files, the legacy token.pickle migration and
+the in-process credential cache
+"""
+
+import pickle
+import threading
+from collections import Counter
+from datetime import timedelta
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from benchmarks import oauth_credentials
+from gmail_integration import CredentialCache, FileTokenStore, GmailTransactionFetcher, utcnow
+
+
+class CountingStore(FileTokenStore):
+    """FileTokenStore that counts its disk reads and writes"""
+
+    def __init__(self, directory):
+        super().__init__(directory, legacy_path=None)
+        self.calls = Counter()
+
+    def load(self, user_id):
+        self.calls['load'] += 1
+        return super().load(user_id)
+
+    def save(self, user_id, creds):
+        self.calls['save'] += 1
+        super().save(user_id, creds)
+
+
+class RefreshingCredentials(Credentials):
+    """Refresh without the network; blocks until release is set"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+        self.release.set()
+        self.refreshed = threading.Event()
+        self.threads = []
+
+    def refresh(self, request):
+        self.threads.append(threading.current_thread().name)
+        assert self.release.wait(5)
+        self.token = 'refreshed-token'
+        self.expiry = utcnow() + timedelta(hours=1)
+        self.refreshed.set()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CountingStore(str(tmp_path / 'tokens'))
+
+
+def test_legacy_pickle_is_migrated_once(tmp_path):
+    legacy = tmp_path / 'token.pickle'
+    with open(legacy, 'wb') as f:
+        pickle.dump(oauth_credentials(3600), f)
+    store = FileTokenStore(str(tmp_path / 'tokens'), legacy_path=str(legacy))
+
+    creds = store.load('u1')
+    assert creds.refresh_token == 'refresh-token'
+    assert not legacy.exists()
+    assert (tmp_path / 'tokens' / 'u1.json').exists()
+    assert store.load('u1').refresh_token == 'refresh-token'
+    assert store.load('u2') is None
+
+
+def test_lambda_authenticates_from_a_legacy_pickle(tmp_path):
+    legacy = tmp_path / 'token.pickle'
+    with open(legacy, 'wb') as f:
+        pickle.dump(oauth_credentials(3600), f)
+    cache = CredentialCache(FileTokenStore(str(tmp_path / 'tokens'), legacy_path=str(legacy)))
+
+    assert GmailTransactionFetcher().authenticate('u1', credentials=cache, interactive=False)
+    with pytest.raises(PermissionError):
+        GmailTransactionFetcher().authenticate('u2', credentials=cache, interactive=False)
+
+
+def test_warm_hit_touches_neither_disk_nor_network(store):
+    store.save('u1', oauth_credentials(3600, RefreshingCredentials))
+    store.calls.clear()
+    cache = CredentialCache(store)
+
+    first = cache.get('u1')
+    for _ in range(20):
+        assert cache.get('u1') is first
+    assert store.calls == Counter(load=1)
+    assert not cache.refreshing
+
+
+def test_credentials_inside_the_margin_refresh_in_the_background(store):
+    cache = CredentialCache(store)
+    creds = oauth_credentials(300, RefreshingCredentials)
+    creds.release.clear()
+    cache.credentials['u1'] = creds
+
+    # Returned at once, while the refresh is still waiting to finish
+    assert cache.get('u1').token == 'access-token'
+    assert cache.get('u1').token == 'access-token'
+    creds.release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'refresh-u1':
+            thread.join(5)
+    assert creds.refreshed.is_set() and not cache.refreshing
+
+    assert creds.threads == ['refresh-u1']
+    assert creds.token == 'refreshed-token' and not cache.expiring(creds)
+    assert store.calls['save'] == 1
+
+
+def test_expired_credentials_refresh_inline(store):
+    cache = CredentialCache(store)
+    creds = oauth_credentials(-60, RefreshingCredentials)
+    cache.credentials['u1'] = creds
+
+    assert cache.get('u1').token == 'refreshed-token'
+    assert creds.threads == [threading.current_thread().name]
+    assert store.calls['save'] == 1
@@ -0,0 +1,24 @@
+"""
+Bank alert parsing: every email in sample_emails.json must parse to its
+expected fields with the bank templates and precompiled patterns
+"""
+
+import pytest
+
+from benchmarks import email_corpus
+from gmail_integration import GmailTransactionFetcher
+
+EMAILS = email_corpus()
+
+
+@pytest.fixture(scope='module')
+def fetcher():
+    return GmailTransactionFetcher()
+
+
+@pytest.mark.parametrize('email', EMAILS, ids=[e['subject'][:40] for e in EMAILS])
+def test_email_corpus(fetcher, email):
+    txn = fetcher.extract_transaction_data(
+        email['subject'], email['body'], email['date'], email['sender'])
+    expected = email['expected']
+    assert (txn and {key: txn[key] for key in expected}) == expected
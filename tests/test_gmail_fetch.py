@@ -0,0 +1,127 @@
+"""
+Gmail fetching against fake_gmail: pagination, batching and retries
+"""
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import gmail_integration
+from fake_gmail import (
+    FakeGmailService, FakeRequest, http_error, make_message, mixed_mailbox, sample_mailbox
+)
+from gmail_integration import MAX_RETRIES, GmailTransactionFetcher
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(gmail_integration, 'LIST_PAGE_SIZE', 7)
+    monkeypatch.setattr(gmail_integration, 'BATCH_SIZE', 5)
+
+
+def fetcher(service):
+    return GmailTransactionFetcher(service, retry_delay=0)
+
+
+def test_fetch_follows_list_pages(small_pages):
+    mailbox = sample_mailbox(30)
+    service = FakeGmailService(mailbox)
+    transactions = fetcher(service).fetch_transaction_emails(max_results=20)
+    assert [t['messageId'] for t in transactions] == [m['id'] for m in mailbox[:20]]
+    assert service.calls['list'] == 3
+
+
+def test_repeated_ids_across_pages_are_fetched_once(small_pages):
+    arrivals = [make_message(f'new{n}', 'Rs.50.00 debited at Swiggy', 'Rs.50.00 debited via UPI')
+                for n in range(3)]
+    service = FakeGmailService(sample_mailbox(30), arrivals=arrivals)
+    ids = list(fetcher(service).iter_message_ids('', None))
+    assert len(ids) == len(set(ids)) == 30
+
+    service = FakeGmailService(sample_mailbox(30), arrivals=arrivals)
+    transactions = fetcher(service).fetch_transaction_emails(max_results=30)
+    assert len({t['messageId'] for t in transactions}) == len(transactions) == 30
+
+
+def test_duplicate_ids_in_one_batch():
+    mailbox = sample_mailbox(3)
+    ids = [m['id'] for m in mailbox]
+    messages = fetcher(FakeGmailService(mailbox)).get_messages(ids + ids[:2])
+    assert [m['id'] for m in messages] == ids
+
+
+def test_rate_limited_gets_are_retried():
+    service = FakeGmailService(sample_mailbox(40), rate_limit_every=4)
+    transactions = fetcher(service).fetch_transaction_emails(max_results=40)
+    assert len(transactions) == 40
+    assert service.calls['get'] > 40
+
+
+def test_rate_limit_that_never_clears_raises():
+    service = FakeGmailService(sample_mailbox(3), rate_limit_every=1)
+    with pytest.raises(HttpError):
+        fetcher(service).get_messages([m['id'] for m in service.mailbox])
+    assert service.calls['batch'] == MAX_RETRIES + 1
+
+
+def test_deleted_messages_drop_out_of_a_batch():
+    mailbox = sample_mailbox(3)
+    messages = fetcher(FakeGmailService(mailbox)).get_messages(['gone'] + [m['id'] for m in mailbox])
+    assert [m['id'] for m in messages] == [m['id'] for m in mailbox]
+
+
+def test_transient_errors_back_off_and_retry(monkeypatch):
+    service = FakeGmailService([])
+    failures = [http_error(503), http_error(500)]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return 'ok'
+
+    attempts = []
+    client = fetcher(service)
+    monkeypatch.setattr(client, 'backoff', attempts.append)
+    assert client.execute(FakeRequest(service, flaky)) == 'ok'
+    assert attempts == [0, 1]
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    service = FakeGmailService([])
+    attempts = []
+    client = fetcher(service)
+    monkeypatch.setattr(client, 'backoff', attempts.append)
+
+    def forbidden():
+        raise http_error(403)
+
+    with pytest.raises(HttpError):
+        client.execute(FakeRequest(service, forbidden))
+    assert attempts == []
+
+
+def test_batched_fetch_matches_one_get_per_message(small_pages):
+    from benchmarks import legacy_fetch_transaction_emails
+
+    mailbox = sample_mailbox(20)
+    expected = legacy_fetch_transaction_emails(fetcher(FakeGmailService(mailbox)), 12)
+    assert fetcher(FakeGmailService(mailbox, rate_limit_every=5)).fetch_transaction_emails(12) == expected
+
+
+def test_two_phase_keeps_every_corpus_transaction():
+    from benchmarks import email_corpus
+
+    mailbox = [make_message(f'corpus{n}', e['subject'], e['body'], sender=e['sender'])
+               for n, e in enumerate(email_corpus())]
+    full = fetcher(FakeGmailService(mailbox)).fetch_transaction_emails(len(mailbox))
+    client = GmailTransactionFetcher(FakeGmailService(mailbox), retry_delay=0, two_phase=True)
+    assert client.fetch_transaction_emails(len(mailbox)) == full
+    assert client.stats['skipped'] == 0
+
+
+def test_two_phase_skips_promotional_mail():
+    mailbox = mixed_mailbox(30)
+    full = fetcher(FakeGmailService(mailbox)).fetch_transaction_emails(30)
+    client = GmailTransactionFetcher(FakeGmailService(mailbox), retry_delay=0, two_phase=True)
+    assert client.fetch_transaction_emails(30) == full
+    assert client.stats['skipped'] == 10
+    assert client.stats['bytesSavedEstimate'] > 0
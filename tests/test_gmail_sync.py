@@ -0,0 +1,170 @@
+"""
+Gmail sync Lambda: options from the event reach the fetcher, incremental
+syncs against fake_gmail, the checkpoint store and the multi-user
+scheduler
+"""
+
+import json
+
+import pytest
+from moto import mock_aws
+
+import aws_clients
+import gmail_integration
+from benchmarks import dynamo_table
+from fake_gmail import FakeGmailService, make_message, sample_mailbox
+from gmail_integration import GmailTransactionFetcher, MemorySyncStateStore, sync_user
+from sync_scheduler import SyncScheduler
+
+REGION = 'ap-south-1'
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    fetchers = []
+
+    def sync_user(fetcher, user_id, sync_state, table, mode=None, max_results=50):
+        fetchers.append(fetcher)
+        return [], 'full'
+
+    monkeypatch.setattr(gmail_integration.GmailTransactionFetcher, 'authenticate',
+                        lambda self, *args, **kwargs: None)
+    monkeypatch.setattr(gmail_integration, 'SyncStateStore', gmail_integration.MemorySyncStateStore)
+    monkeypatch.setattr(gmail_integration, 'sync_user', sync_user)
+    return fetchers
+
+
+@pytest.mark.parametrize('event, two_phase', [({'userId': 'u1'}, False),
+                                              ({'userId': 'u1', 'twoPhase': True}, True)])
+def test_handler_passes_two_phase(synced, event, two_phase):
+    response = gmail_integration.lambda_handler(event, None)
+    assert response['statusCode'] == 200, json.loads(response['body'])
+    assert synced[0].two_phase is two_phase
+
+
+def new_alert(msg_id, merchant='Swiggy'):
+    return make_message(msg_id, f'Transaction alert: Rs.250.00 debited at {merchant}',
+                        f'Rs.250.00 was debited from your account via UPI at {merchant}')
+
+
+def test_incremental_sync_after_a_full_sync():
+    service = FakeGmailService(sample_mailbox(10))
+    fetcher = GmailTransactionFetcher(service, retry_delay=0)
+    transactions, mode, checkpoint = fetcher.sync(None)
+    assert (len(transactions), mode) == (10, 'full')
+
+    service.add_message(new_alert('new1'))
+    transactions, mode, latest = fetcher.sync(checkpoint)
+    assert mode == 'incremental'
+    assert [t['messageId'] for t in transactions] == ['new1']
+    assert int(latest) > int(checkpoint)
+
+
+def test_expired_history_falls_back_to_a_full_sync():
+    service = FakeGmailService(sample_mailbox(10))
+    fetcher = GmailTransactionFetcher(service, retry_delay=0)
+    _, _, checkpoint = fetcher.sync(None)
+    service.add_message(new_alert('new1'))
+    service.expire_history()
+
+    transactions, mode, latest = fetcher.sync(checkpoint)
+    assert (len(transactions), mode) == (11, 'full')
+    assert latest == str(service.history_id)
+
+
+def test_sync_user_advances_the_checkpoint():
+    from benchmarks import MemoryTable
+
+    service = FakeGmailService(sample_mailbox(5))
+    fetcher = GmailTransactionFetcher(service, retry_delay=0)
+    state, table = MemorySyncStateStore(), MemoryTable()
+
+    assert sync_user(fetcher, 'u1', state, table)[1] == 'full'
+    first = state['u1']
+    service.add_message(new_alert('new1'))
+    service.add_message(new_alert('new2', 'Uber'))
+    transactions, mode = sync_user(fetcher, 'u1', state, table)
+    assert (len(transactions), mode) == (2, 'incremental')
+    assert int(state['u1']) == int(first) + 2
+
+    # Nothing new: the checkpoint stays put and nothing is written
+    assert sync_user(fetcher, 'u1', state, table) == ([], 'incremental')
+    assert int(state['u1']) == int(first) + 2
+    assert len(table.items) == 7
+
+
+@pytest.fixture
+def aws():
+    with mock_aws():
+        aws_clients.reset()
+        yield
+        aws_clients.reset()
+
+
+def test_sync_state_round_trip(aws):
+    dynamo_table('GmailSyncState', region=REGION)
+    store = gmail_integration.SyncStateStore()
+    assert store.get('u1') is None
+    store.set('u1', '12345')
+    assert store.get('u1') == '12345'
+
+
+def test_missing_sync_state_table_means_full_sync(aws):
+    store = gmail_integration.SyncStateStore()
+    store.set('u1', '12345')
+    assert store.get('u1') is None
+
+
+def test_resaving_a_sync_upserts_the_same_rows(aws):
+    import boto3
+
+    dynamo_table('Transactions', 'transactionId', region=REGION)
+    table = boto3.resource('dynamodb', region_name=REGION).Table('Transactions')
+    mailbox = sample_mailbox(30)
+
+    fetcher = GmailTransactionFetcher(FakeGmailService(mailbox), retry_delay=0)
+    gmail_integration.save_transactions(table, 'u1', fetcher.fetch_transaction_emails(30))
+    first = {item['transactionId'] for item in table.scan()['Items']}
+    assert len(first) == 30
+
+    # A full re-sync after a lost checkpoint sees the same emails again
+    fetcher = GmailTransactionFetcher(FakeGmailService(mailbox), retry_delay=0)
+    transactions = fetcher.fetch_transaction_emails(30)
+    gmail_integration.save_transactions(table, 'u1', transactions + transactions[:5])
+    assert {item['transactionId'] for item in table.scan()['Items']} == first
+
+
+def scheduler(mailboxes, **kwargs):
+    """SyncScheduler over fake_gmail mailboxes keyed by user id"""
+    from benchmarks import MemoryTable
+
+    state, table = MemorySyncStateStore(), MemoryTable()
+
+    def fetcher_factory(user_id):
+        if user_id not in mailboxes:
+            raise PermissionError(f'No Gmail credentials for {user_id}')
+        return GmailTransactionFetcher(FakeGmailService(mailboxes[user_id]), retry_delay=0)
+
+    return SyncScheduler(fetcher_factory, resources=lambda: (state, table), **kwargs), state
+
+
+def test_one_failing_user_does_not_stop_the_others():
+    runner, state = scheduler({'u1': sample_mailbox(5), 'u3': sample_mailbox(8)}, max_workers=2)
+    results = runner.run(['u1', 'u2', 'u3'])
+    assert [(r['userId'], r['status'], r['transactions']) for r in results] == [
+        ('u1', 'ok', 5), ('u2', 'error', 0), ('u3', 'ok', 8)]
+    assert 'No Gmail credentials' in results[1]['error']
+    assert set(state) == {'u1', 'u3'}
+
+
+def test_each_user_spends_their_own_rate_budget():
+    mailboxes = {'heavy1': sample_mailbox(150), 'heavy2': sample_mailbox(150),
+                 'light': sample_mailbox(5)}
+    runner, _ = scheduler(mailboxes, max_workers=3, calls_per_second=100, max_results=150)
+    results = {r['userId']: r for r in runner.run(mailboxes)}
+    assert all(r['status'] == 'ok' for r in results.values())
+    # 152 calls against a 100-call bucket: each heavy user waits about half a
+    # second of their own, and the light user never waits behind them
+    for user_id in ('heavy1', 'heavy2'):
+        assert 400 <= results[user_id]['throttledMs'] <= 600
+    assert results['light']['throttledMs'] == 0
@@ -0,0 +1,22 @@
+"""
+Cold-start import time of each Lambda module against import_budgets.json.
+Set SKIP_IMPORT_BUDGET=1 where timings are meaningless (slow or shared CI)
+"""
+
+import os
+
+import pytest
+
+from import_budget import load_budgets, measure
+
+pytestmark = pytest.mark.skipif(os.environ.get('SKIP_IMPORT_BUDGET', '0') == '1',
+                                reason='SKIP_IMPORT_BUDGET=1')
+
+
+@pytest.mark.parametrize('module, budget', sorted(load_budgets().items()))
+def test_import_within_budget(module, budget):
+    median, times = measure(module)
+    heaviest = sorted(((c, n) for n, (_, c) in times.items() if n != module), reverse=True)[:5]
+    assert median <= budget, (
+        f'import {module} took {median:.1f} ms (budget {budget} ms); heaviest: '
+        + ', '.join(f'{name} {ms:.1f} ms' for ms, name in heaviest))
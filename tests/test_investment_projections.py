@@ -0,0 +1,83 @@
+"""
+Investment projections: memoized recommendations against the NumPy grid,
+and the seeded return simulation
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks import grid_recommendations
+from investment_projections import (
+    DISTRIBUTIONS, INVESTMENT_OPTIONS, ProjectionEngine, engine_for, monthly_returns
+)
+
+
+@pytest.mark.parametrize('amount', [99.5, 100, 499.99, 500, 999.6, 1000, 1234.56, 5000])
+def test_recommend_matches_the_grid(amount):
+    engine = engine_for()
+    assert engine.recommend(amount) == grid_recommendations(engine, amount)
+
+
+def test_eligibility_uses_actual_amount():
+    engine = engine_for()
+    minimums = {option['name']: option['min_investment'] for option in INVESTMENT_OPTIONS.values()}
+
+    assert engine.recommend(99.5) == []
+    rows = engine.recommend(999.6)
+    assert rows and all(minimums[row['option']] <= 999.6 for row in rows)
+    assert {row['monthly_investment'] for row in rows} == {999.6}
+
+
+def test_rows_are_not_shared_between_calls():
+    engine = engine_for()
+    engine.recommend(1500)[0]['projections']['12_months']['gain'] = 0
+    assert engine.recommend(1500)[0]['projections']['12_months']['gain'] > 0
+
+
+def test_simulation_is_reproducible_per_seed():
+    engine = engine_for()
+    first = engine.simulate(2000, paths=2000, seed=5)
+    assert engine.simulate(2000, paths=2000, seed=5) == first
+    assert engine.simulate(2000, paths=2000, seed=6) != first
+    # An engine built outside engine_for() simulates, and caches, on its own
+    assert ProjectionEngine(INVESTMENT_OPTIONS).simulate(2000, paths=2000, seed=5) == first
+
+
+def test_simulation_follows_each_engines_options():
+    options = {'fund': {**INVESTMENT_OPTIONS['index_fund'], 'min_investment': 0}}
+    calm = ProjectionEngine(options)
+    wild = ProjectionEngine({'fund': {**options['fund'], 'volatility': 0.6}})
+    calm_row, wild_row = calm.simulate(1000, paths=2000)[0], wild.simulate(1000, paths=2000)[0]
+    spread = [row['projections']['12_months']['p90'] - row['projections']['12_months']['p10']
+              for row in (calm_row, wild_row)]
+    assert spread[0] < spread[1]
+
+
+@pytest.mark.parametrize('distribution', DISTRIBUTIONS)
+def test_distributions_keep_mean_and_volatility(distribution):
+    model = {'return_12m': 0.12, 'volatility': 0.2, 'distribution': distribution}
+    returns = monthly_returns(np.random.default_rng(3), model, 200000, 1)[:, 0]
+    assert returns.mean() == pytest.approx(1.12 ** (1 / 12) - 1, abs=0.001)
+    assert returns.std() == pytest.approx(0.2 / 12 ** 0.5, rel=0.03)
+
+
+def test_distributions_differ_in_shape():
+    def sample(distribution):
+        model = {'return_12m': 0.1, 'volatility': 1.5, 'distribution': distribution}
+        returns = monthly_returns(np.random.default_rng(3), model, 200000, 1)[:, 0]
+        return returns, ((returns - returns.mean()) ** 4).mean() / returns.var() ** 2
+
+    normal, normal_kurtosis = sample('normal')
+    lognormal, _ = sample('lognormal')
+    _, t_kurtosis = sample('student_t')
+    assert normal.min() < -1 < lognormal.min()
+    assert t_kurtosis > normal_kurtosis + 1
+
+
+def test_unknown_distributions_are_rejected():
+    rng = np.random.default_rng(0)
+    with pytest.raises(ValueError):
+        monthly_returns(rng, {'return_12m': 0.1, 'volatility': 0.1, 'distribution': 'cauchy'}, 10, 1)
+    with pytest.raises(ValueError):
+        monthly_returns(rng, {'return_12m': 0.1, 'volatility': 0.1, 'distribution': 'student_t',
+                              'df': 2}, 10, 1)
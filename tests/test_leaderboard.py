@@ -0,0 +1,97 @@
+"""
+Leaderboard over the sharded points index, against moto's DynamoDB
+"""
+
+import random
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import leaderboard
+from leaderboard import POINTS_INDEX, Leaderboard, histogram, shard_for, users_above
+
+REGION = 'ap-south-1'
+
+rng = random.Random(20)
+POINTS = {f'user{i:03d}': rng.randint(0, 40) * 25 for i in range(200)}
+
+
+def true_rank(user_id):
+    return 1 + sum(p > POINTS[user_id] for p in POINTS.values())
+
+
+@pytest.fixture
+def board():
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb', region_name=REGION)
+        users = dynamodb.create_table(
+            TableName='Users',
+            KeySchema=[{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'userId', 'AttributeType': 'S'},
+                                  {'AttributeName': 'lbShard', 'AttributeType': 'S'},
+                                  {'AttributeName': 'totalPoints', 'AttributeType': 'N'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': POINTS_INDEX,
+                'KeySchema': [{'AttributeName': 'lbShard', 'KeyType': 'HASH'},
+                              {'AttributeName': 'totalPoints', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['email', 'tier']}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        snapshots = dynamodb.create_table(
+            TableName='LeaderboardSnapshots',
+            KeySchema=[{'AttributeName': 'board', 'KeyType': 'HASH'},
+                       {'AttributeName': 'takenAt', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'board', 'AttributeType': 'S'},
+                                  {'AttributeName': 'takenAt', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        with users.batch_writer() as batch:
+            for user_id, total in POINTS.items():
+                batch.put_item(Item={'userId': user_id, 'totalPoints': total,
+                                     'lbShard': shard_for(user_id)})
+        leaderboard.clear_cache()
+        yield Leaderboard(users, snapshots_table=snapshots)
+        leaderboard.clear_cache()
+
+
+def test_top_and_rank_share_the_tie_rule(board):
+    top = board.query_top(30)
+    assert [e['rank'] for e in top] == [true_rank(e['userId']) for e in top]
+    assert any(a['rank'] == b['rank'] for a, b in zip(top, top[1:]))
+    for e in top:
+        assert board.rank(e['userId'])['rank'] == e['rank']
+
+
+def test_rank_is_exact_within_the_count_limit(board):
+    for user_id in list(POINTS)[:20]:
+        result = board.rank(user_id)
+        assert result['rank'] == true_rank(user_id) and 'approximate' not in result
+
+
+def test_rank_beyond_the_count_limit_uses_the_histogram(board, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'RANK_COUNT_LIMIT', 10)
+    board.snapshot(board.snapshots_table, k=10)
+    user_id = min(POINTS, key=lambda u: (POINTS[u], u))
+    result = board.rank(user_id)
+    assert result['approximate'] is True
+    # Every point value has its own row here, so the estimate is exact
+    assert result['rank'] == true_rank(user_id)
+
+
+def test_rank_without_a_snapshot_is_a_lower_bound(board, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'RANK_COUNT_LIMIT', 10)
+    user_id = min(POINTS, key=lambda u: (POINTS[u], u))
+    result = board.rank(user_id)
+    assert (result['rank'], result['approximate']) == (11, True)
+
+
+def test_merged_histogram_estimates_stay_close():
+    counts = {}
+    for total in POINTS.values():
+        counts[total] = counts.get(total, 0) + 1
+    rows = histogram(counts, buckets=8)
+    assert len(rows) <= 8 and sum(users for _, _, users in rows) == len(POINTS)
+    for user_id in POINTS:
+        assert abs(users_above(rows, POINTS[user_id]) + 1 - true_rank(user_id)) <= len(POINTS) / 8
@@ -0,0 +1,151 @@
+"""
+RewardSystem against moto's DynamoDB
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from moto import mock_aws
+
+import aws_clients
+from benchmarks import atomic_moto_updates, count_requests, dynamo_table
+from bulk_awards import BulkAwarder
+from reward_system import REWARD_ID, RewardSystem, new_reward_id
+
+REGION = 'ap-south-1'
+
+
+@pytest.fixture
+def tables():
+    with mock_aws(), atomic_moto_updates():
+        tables = {name: dynamo_table(name, key, region=REGION)
+                  for name, key in [('Users', None), ('Rewards', 'rewardId')]}
+        aws_clients.reset()
+        yield tables
+        aws_clients.reset()
+
+
+def test_concurrent_awards_add_up(tables):
+    deltas = [[5 + (t * 7 + n * 13) % 50 for n in range(10)] for t in range(4)]
+    expected = sum(map(sum, deltas))
+
+    def worker(points):
+        system = RewardSystem()
+        for delta in points:
+            system.update_user_points('user1', delta)
+
+    with ThreadPoolExecutor(len(deltas)) as pool:
+        list(pool.map(worker, deltas))
+
+    user = tables['Users'].get_item(Key={'userId': 'user1'})['Item']
+    assert user['totalPoints'] == expected
+    assert user['tier'] == RewardSystem().tier_for(expected)
+
+
+def test_tier_follows_thresholds(tables):
+    system = RewardSystem()
+    assert system.update_user_points('user1', 499)['tier'] == 'Bronze'
+    assert system.update_user_points('user1', 1)['tier'] == 'Silver'
+    assert system.update_user_points('user1', 1000)['tier'] == 'Gold'
+    assert tables['Users'].get_item(Key={'userId': 'user1'})['Item']['tier'] == 'Gold'
+
+
+def test_savings_award_is_one_user_update(tables):
+    system = RewardSystem()
+    calls = count_requests(system.users_table)
+    for saved in (15, 40, 25):
+        system.award_points('user1', 'meet_savings_target', {'saved_amount': saved, 'budget': 1000})
+    assert calls['UpdateItem'] == 3
+    assert system.get_action_summary('user1')['maxSavedAmount'] == 40
+
+    report = BulkAwarder(max_workers=2).run(
+        [('user1', 'meet_savings_target', {'saved_amount': saved, 'budget': 1000})
+         for saved in (60, 30)])
+    assert report['failed'] == []
+    assert system.get_action_summary('user1')['maxSavedAmount'] == 60
+
+
+@pytest.fixture
+def legacy_user(tables):
+    """user1 as rewarded before the action summary: points, no summary"""
+    rewards = [('cancel_subscription', 150, {'subscription_name': 'Netflix'}),
+               ('invest_savings', 210, {'investment_amount': 500})]
+    for n, (action, points, metadata) in enumerate(rewards):
+        tables['Rewards'].put_item(Item={
+            'userId': 'user1', 'rewardId': new_reward_id(1700000000 + n), 'action': action,
+            'points': points, 'metadata': metadata, 'timestamp': f'2023-11-14T22:13:2{n}'})
+    tables['Users'].put_item(Item={'userId': 'user1', 'totalPoints': 360, 'tier': 'Bronze'})
+    return tables
+
+
+def test_legacy_user_gets_no_second_first_time_bonus(legacy_user):
+    reward = RewardSystem().award_points('user1', 'invest_savings', {'investment_amount': 500})
+    assert 'bonus' not in reward['description']
+    summary = RewardSystem().get_action_summary('user1')
+    assert summary['rewardCount'] == 3 and summary['counts']['invest_savings'] == 2
+
+
+def test_legacy_user_stats_are_backfilled(legacy_user):
+    stats = RewardSystem().get_user_stats('user1')
+    assert stats['totalRewards'] == 2
+    assert len(stats['badges']) == 2
+
+
+def test_legacy_user_summary_is_backfilled_on_award(legacy_user):
+    RewardSystem().award_points('user1', 'weekly_streak', {})
+    user = legacy_user['Users'].get_item(Key={'userId': 'user1'})['Item']
+    assert user['rewardCount'] == 3
+    assert user['actionsSeen'] == {'cancel_subscription', 'invest_savings', 'weekly_streak'}
+    assert user['badges'] == {'first_cancel', 'first_investment'}
+
+
+def test_bulk_awards_backfill_legacy_users(legacy_user):
+    report = BulkAwarder(max_workers=2).run([('user1', 'cancel_subscription', {'monthly_cost': 100})])
+    assert report['failed'] == []
+    rewards = RewardSystem().get_user_rewards('user1')
+    assert not any('bonus' in r['description'] for r in rewards if r['timestamp'] > '2024')
+    assert RewardSystem().get_action_summary('user1')['counts']['cancel_subscription'] == 2
+
+
+def test_reward_ids_increase_within_a_millisecond():
+    ids = [new_reward_id(1700000000.0004) for _ in range(500)]
+    assert all(REWARD_ID.match(i) for i in ids)
+    assert ids == sorted(set(ids))
+    # A clock that steps back still gets a larger id
+    assert new_reward_id(1600000000) > ids[-1]
+
+
+@pytest.fixture
+def mixed_ids(tables):
+    """user1 with three rewards under old ids and two newer ones under ULIDs"""
+    for n in range(3):
+        seconds = 1700000000 + n * 3600
+        tables['Rewards'].put_item(Item={
+            'userId': 'user1', 'rewardId': f'rwd_user1_{seconds}', 'action': 'weekly_streak',
+            'points': 25, 'description': f'old {n}',
+            'timestamp': datetime.fromtimestamp(seconds).isoformat()})
+    system = RewardSystem()
+    for _ in range(2):
+        system.award_points('user1', 'weekly_streak', {})
+    return system
+
+
+def test_old_ids_come_first_before_migration(mixed_ids):
+    recent = mixed_ids.get_recent_rewards('user1', limit=5)
+    assert [r['description'] for r in recent[:3]] == ['old 2', 'old 1', 'old 0']
+
+
+def test_migrated_rewards_sort_by_time(mixed_ids):
+    assert mixed_ids.migrate_reward_ids('user1') == 3
+    assert mixed_ids.migrate_reward_ids('user1') == 0
+
+    rewards = mixed_ids.get_user_rewards('user1')
+    assert len(rewards) == 5 and all(REWARD_ID.match(r['rewardId']) for r in rewards)
+    assert sorted(r['legacyRewardId'] for r in rewards if 'legacyRewardId' in r) == [
+        f'rwd_user1_{1700000000 + n * 3600}' for n in range(3)]
+
+    recent = mixed_ids.get_recent_rewards('user1', limit=4)
+    assert [r['timestamp'] for r in recent] == sorted((r['timestamp'] for r in rewards),
+                                                      reverse=True)[:4]
+    assert [r['description'] for r in recent[2:]] == ['old 2', 'old 1']
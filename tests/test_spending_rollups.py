@@ -0,0 +1,88 @@
+"""
+Spending rollups fed by stream records, against moto's DynamoDB
+"""
+
+from decimal import Decimal
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from benchmarks import dynamo_table, stream_record
+from spending_rollups import RollupStore, compute_rollups, stream_deltas
+
+REGION = 'ap-south-1'
+
+TRANSACTIONS = [
+    {'userId': 'user1', 'transactionId': f'txn{n}', 'date': f'2024-01-{1 + n % 20:02d}',
+     'amount': Decimal(100 + n), 'merchant': ['Swiggy', 'Amazon', 'Uber'][n % 3],
+     'category': ['Food', 'Shopping', 'Transport'][n % 3], 'type': 'expense'}
+    for n in range(30)
+]
+REWARDS = [
+    {'userId': 'user1', 'rewardId': f'rwd_{n}', 'points': Decimal(10 * n + 5),
+     'description': f'Reward {n}', 'timestamp': f'2024-01-{n + 1:02d}T09:00:00'}
+    for n in range(5)
+]
+
+
+@pytest.fixture
+def store():
+    with mock_aws():
+        dynamo_table('SpendingRollups', 'rollupKey', region=REGION)
+        yield RollupStore(dynamodb=boto3.resource('dynamodb', region_name=REGION))
+
+
+def stored(store):
+    items = store.table.scan()['Items']
+    return {item['rollupKey']: {name: value for name, value in item.items()
+                                if name not in ('userId', 'rollupKey', 'lastSeq')}
+            for item in items}
+
+
+def expected():
+    return {key: values for (_, key), values in compute_rollups(TRANSACTIONS, REWARDS).items()}
+
+
+def test_stream_batches_match_raw_rollups(store):
+    records = ([stream_record('Transactions', new=t) for t in TRANSACTIONS] +
+               [stream_record('Rewards', new=r) for r in REWARDS])
+    for n in range(0, len(records), 10):
+        store.apply(*stream_deltas(records[n:n + 10]))
+    assert stored(store) == expected()
+
+
+def test_retried_batches_are_not_added_twice(store):
+    records = ([stream_record('Transactions', new=t) for t in TRANSACTIONS] +
+               [stream_record('Rewards', new=r) for r in REWARDS])
+    first, second = records[:20], records[20:]
+    store.apply(*stream_deltas(first))
+    store.apply(*stream_deltas(first))
+    # A retry after bisecting the batch sees only part of it again
+    store.apply(*stream_deltas(first[:7]))
+    store.apply(*stream_deltas(second))
+    store.apply(*stream_deltas(second))
+    assert stored(store) == expected()
+
+
+def test_records_without_sequence_numbers_still_apply(store):
+    records = [stream_record('Transactions', new=t) for t in TRANSACTIONS]
+    for record in records:
+        del record['dynamodb']['SequenceNumber']
+    store.apply(*stream_deltas(records))
+    assert stored(store) == {key: values for key, values in expected().items()
+                             if not key.startswith('R#')}
+
+
+def test_sequence_numbers_longer_than_a_dynamodb_number(store):
+    records = [stream_record('Transactions', new=t) for t in TRANSACTIONS]
+    # 39 digits for the first 15 records, 40 after
+    for n, record in enumerate(records):
+        record['dynamodb']['SequenceNumber'] = str(10 ** 39 - 15 + n)
+    store.apply(*stream_deltas(records[:20]))
+    store.apply(*stream_deltas(records[10:20]))
+    store.apply(*stream_deltas(records[20:]))
+    store.apply(*stream_deltas(records[:5]))
+    assert stored(store) == {key: values for key, values in expected().items()
+                             if not key.startswith('R#')}
+    assert {len(item['lastSeq']) for item in store.table.scan()['Items']} == {40}
@@ -0,0 +1,124 @@
+"""
+Vectorized Analytics - PFMS Hackathon MVP
+NumPy backend for subscription detection and wasteful expense flagging
+"""
+
+import numpy as np
+
+
+class TransactionColumns:
+    """Columnar view of a transaction list.
+
+    Dates are int days, amounts float64, merchant (lowercased) and category
+    are categorical codes numbered in order of first appearance.
+    """
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+
+        merchant_index = {}
+        category_index = {}
+        merchant_codes = []
+        category_codes = []
+        for txn in transactions:
+            merchant = txn['merchant'].lower()
+            code = merchant_index.get(merchant)
+            if code is None:
+                code = merchant_index[merchant] = len(merchant_index)
+            merchant_codes.append(code)
+
+            category = txn.get('category')
+            code = category_index.get(category)
+            if code is None:
+                code = category_index[category] = len(category_index)
+            category_codes.append(code)
+
+        self.merchants = list(merchant_index)
+        self.categories = list(category_index)
+        self.merchant_codes = np.array(merchant_codes, dtype=np.int64)
+        self.category_codes = np.array(category_codes, dtype=np.int64)
+        self.days = np.array([t['date'] for t in transactions],
+                             dtype='datetime64[D]').astype(np.int64)
+        amounts = [t['amount'] for t in transactions]
+        self.amounts = np.array(amounts, dtype=np.float64)
+        # Integer amounts sum to ints in the Python backend, keep that
+        self.integral = all(type(a) is int for a in amounts)
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def merchant_mask(self, keywords):
+        """Rows whose merchant contains any keyword, checked once per merchant"""
+        hits = np.array([any(k in m for k in keywords) for m in self.merchants], dtype=bool)
+        return hits[self.merchant_codes] if len(self) else np.zeros(0, dtype=bool)
+
+    def category_mask(self, category):
+        if category not in self.categories:
+            return np.zeros(len(self), dtype=bool)
+        return self.category_codes == self.categories.index(category)
+
+    def total(self, mask):
+        """Sum of the selected amounts, added in row order like sum()"""
+        total = sum(self.amounts[mask].tolist())
+        return int(total) if self.integral else total
+
+
+def detect_subscription(columns, min_interval=25, max_interval=35):
+    """Same result as TransactionCategorizer.detect_subscription"""
+    if not len(columns):
+        return []
+
+    # Group rows by merchant, date order inside each group (stable, like sorted())
+    order = np.lexsort((columns.days, columns.merchant_codes))
+    codes = columns.merchant_codes[order]
+    days = columns.days[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+
+    # A merchant is irregular if any interval inside its group is off
+    intervals = np.diff(days)
+    off = (codes[1:] == codes[:-1]) & ((intervals < min_interval) | (intervals > max_interval))
+    irregular = np.zeros(len(columns.merchants), dtype=bool)
+    irregular[codes[1:][off]] = True
+
+    candidates = (ends - starts >= 2) & ~irregular[codes[starts]]
+
+    transactions = columns.transactions
+    subscriptions = []
+    for start, end in zip(starts[candidates].tolist(), ends[candidates].tolist()):
+        rows = order[start:end].tolist()
+        amounts = [transactions[i]['amount'] for i in rows]
+        subscriptions.append({
+            'service': transactions[rows[0]]['merchant'],
+            'amount': sum(amounts) / len(amounts),
+            'frequency': 'monthly',
+            'lastCharged': transactions[rows[-1]]['date'],
+            'status': 'active',
+            'transactionCount': len(rows)
+        })
+    return subscriptions
+
+
+class ColumnarExpenseIndex:
+    """ExpenseIndex over TransactionColumns for the wasteful-expense rules"""
+
+    def __init__(self, columns, subscriptions, keywords):
+        self.columns = columns
+        self.subscriptions = subscriptions
+        self._masks = {name: columns.merchant_mask(words) for name, words in keywords.items()}
+        self._subscription_hits = {
+            name: [s for s in subscriptions if any(w in s['service'].lower() for w in words)]
+            for name, words in keywords.items()
+        }
+
+    def keyword_stats(self, name):
+        mask = self._masks[name]
+        return int(mask.sum()), self.columns.total(mask)
+
+    def small_stats(self, category, limit):
+        mask = (self.columns.amounts < limit) & self.columns.category_mask(category)
+        return int(mask.sum()), self.columns.total(mask)
+
+    def subscription_hits(self, name):
+        return self._subscription_hits[name]